@@ -0,0 +1,290 @@
+import csv, io, json, os, shutil, time, uuid
+from typing import Dict, List, Optional, Tuple
+from .config import settings
+from .parser import (PARSER_VERSION, PROGRESS_CHECK_MASK, ROW_INDEX_MASK, RowOffsetIndex, RowSink, _TableWriter,
+                     detect_compression, load_section_index, parse_report_file, parse_report_to_sections,
+                     report_metadata, section_index_path)
+from .progress import bus
+from . import metrics
+from .profiling import stage
+from .scheduler import check_cancelled
+from .storage import file_sha256
+
+# Caché de parseo direccionada por contenido:
+#   DATA_DIR/_cache/<sha256>-v<PARSER_VERSION>/manifest.json + un CSV por tabla (sin Cliente)
+CACHE_DIRNAME = "_cache"
+READ_BLOCK = 1024 * 1024
+CONTENT_ID_KIND = "file-sha256"  # única identidad de contenido: upload, CLI y re-uploads dan la misma clave
+
+def cache_root() -> str:
+    return os.path.join(settings.DATA_DIR, CACHE_DIRNAME)
+
+# === Identidad de contenido (sidecar en index/ junto al índice de secciones) ===
+
+def content_id_path(index_dir: str, filepath: str) -> str:
+    return os.path.join(index_dir, os.path.basename(filepath) + ".content.json")
+
+def save_content_id(index_dir: str, filepath: str, digest: str) -> None:
+    st = os.stat(filepath)
+    path = content_id_path(index_dir, filepath)
+    os.makedirs(index_dir, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"sha256": digest, "kind": CONTENT_ID_KIND, "size": st.st_size, "mtime": st.st_mtime}, f)
+    os.replace(path + ".tmp", path)
+
+def content_id(index_dir: str, filepath: str) -> str:
+    """
+    SHA-256 del archivo completo: el registrado al completar el upload o, si falta,
+    quedó obsoleto o es de otro tipo (sidecars antiguos), calculado leyendo el archivo.
+    """
+    st = os.stat(filepath)
+    try:
+        with open(content_id_path(index_dir, filepath), "r", encoding="utf-8") as f:
+            cid = json.load(f)
+        if (cid.get("kind") == CONTENT_ID_KIND and cid.get("size") == st.st_size
+                and cid.get("mtime") == st.st_mtime and cid.get("sha256")):
+            return cid["sha256"]
+    except (OSError, ValueError):
+        pass
+    digest = file_sha256(filepath)
+    save_content_id(index_dir, filepath, digest)
+    return digest
+
+# === Entradas de la caché ===
+
+def entry_dir(digest: str) -> str:
+    return os.path.join(cache_root(), f"{digest}-v{PARSER_VERSION}")
+
+def load_entry(digest: str) -> Optional[Tuple[str, Dict]]:
+    d = entry_dir(digest)
+    try:
+        with open(os.path.join(d, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(os.path.join(d, "manifest.json"))  # LRU para la evicción
+    except OSError:
+        pass
+    return d, manifest
+
+def new_build_dir(parent: Optional[str] = None) -> str:
+    d = os.path.join(parent or cache_root(), f".build-{uuid.uuid4().hex}")
+    os.makedirs(d)
+    return d
+
+def make_manifest(build_dir: str, meta: Dict, sections: List[Dict]) -> Dict:
+    counts: Dict[str, int] = {}
+    for sec in sections:
+        counts[sec["bucket"]] = counts.get(sec["bucket"], 0) + sec["rows"]
+    return {
+        "version": PARSER_VERSION,
+        "meta": meta,
+        "sections": sections,
+        "counts": counts,
+        "bytes": sum(os.path.getsize(os.path.join(build_dir, s["file"])) for s in sections),
+    }
+
+def publish(build_dir: str, digest: str, manifest: Dict) -> Tuple[str, Dict]:
+    """Publica build_dir como entrada de `digest` (rename atómico). Si otra sesión ganó la carrera, se usa la suya."""
+    with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    final = entry_dir(digest)
+    try:
+        os.rename(build_dir, final)
+    except OSError:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        found = load_entry(digest)
+        if found is None:
+            raise
+        return found
+    _evict(keep=final)
+    return final, manifest
+
+def _evict(keep: str) -> None:
+    """Borra las entradas menos usadas mientras la caché supere PARSE_CACHE_MAX_BYTES (0 = sin límite)."""
+    limit = settings.PARSE_CACHE_MAX_BYTES
+    if limit <= 0:
+        return
+    entries = []
+    root = cache_root()
+    for name in os.listdir(root):
+        mpath = os.path.join(root, name, "manifest.json")
+        try:
+            with open(mpath, "r", encoding="utf-8") as f:
+                size = json.load(f).get("bytes", 0)
+            entries.append((os.path.getmtime(mpath), size, os.path.join(root, name)))
+        except (OSError, ValueError):
+            continue
+    total = sum(e[1] for e in entries)
+    for _, size, d in sorted(entries):
+        if total <= limit:
+            break
+        if d == keep:
+            continue
+        shutil.rmtree(d, ignore_errors=True)
+        total -= size
+
+# === Ensamblado de la salida de una sesión ===
+
+def _cliente_suffix(cliente_val: str) -> bytes:
+    """',<cliente>\\r\\n' con el mismo quoting que csv.writer aplicaría a la última columna."""
+    buf = io.StringIO()
+    csv.writer(buf).writerow(["x", cliente_val])
+    return buf.getvalue()[1:].encode("utf-8")
+
+def _copy_with_suffix(src_path: str, out, suffix: bytes, ridx: Optional[RowOffsetIndex] = None) -> None:
+    # Filas de una sola línea: agregar Cliente = reemplazar cada fin de línea (en C, por bloques).
+    # Con `ridx`, cada ROW_INDEX_MASK + 1 filas se marca su offset en la salida, igual que al parsear.
+    carry = b""
+    nrow = ridx.end_rows if ridx is not None else 0
+    pos = out.tell() if ridx is not None else 0
+    with open(src_path, "rb") as fh:
+        for block in iter(lambda: fh.read(READ_BLOCK), b""):
+            block = carry + block
+            cut = block.rfind(b"\n") + 1
+            carry = block[cut:]
+            data = block[:cut].replace(b"\r\n", suffix)
+            if ridx is not None and data:
+                rows = data.count(b"\n")
+                # Primera fila múltiplo de ROW_INDEX_MASK + 1 dentro del bloque; se avanza fila a fila desde ahí
+                k = (nrow + ROW_INDEX_MASK) & ~ROW_INDEX_MASK
+                p, at = 0, nrow
+                while k < nrow + rows:
+                    while at < k:
+                        p = data.index(b"\n", p) + 1
+                        at += 1
+                    ridx.mark(k, pos + p)
+                    k += ROW_INDEX_MASK + 1
+                nrow += rows
+                pos += len(data)
+            out.write(data)
+    if carry:
+        out.write(carry)
+
+def assemble_report(
+    filepath: str,
+    sections_dir: str,
+    manifest: Dict,
+    outputs_dir: str,
+    cliente_por_defecto: str,
+    session_id: str,
+    sink: Optional[RowSink] = None,
+    write_csv: bool = True,
+) -> Dict[str, int]:
+    """
+    Agrega a los CSV de outputs_dir (append) las tablas ya parseadas de un
+    reporte, aplicando el Cliente de la sesión. Resultado idéntico a parsear el
+    reporte con parse_report_file.
+    """
+    tw = _TableWriter(filepath, outputs_dir, cliente_por_defecto, session_id, manifest["meta"], sink, write_csv)
+    suffix = _cliente_suffix(tw.cliente_val)
+    try:
+        for sec in manifest["sections"]:
+            check_cancelled(session_id)
+            bucket = sec["bucket"]
+            path = os.path.join(sections_dir, sec["file"])
+            canon = tw.ensure_header(bucket, sec["header"])
+            f, w, _ = tw.out_handles[bucket]
+            # Con de-duplicación cada fila pasa por el filtro (y los agregados cuentan solo las que quedan)
+            dup = tw.dedup.checker(bucket, canon) if tw.dedup is not None else None
+            # Agregados ya calculados al parsear la sección; una entrada sin ellos se agrega al recorrerla
+            agg = None
+            if tw.summary is not None:
+                if "summary" in sec and dup is None:
+                    tw.summary.merge({bucket: sec["summary"]})
+                else:
+                    agg = tw.summary.adder(bucket, canon)
+            kept = sec["rows"]
+            if (sink is None and tw.columnar is None and dup is None and agg is None and w is not None and sec["simple"]
+                    and canon == sec["header"] and len(canon) > 2):
+                f.flush()
+                _copy_with_suffix(path, f.buffer, suffix, tw.row_index.get(bucket))
+            else:
+                map_row = tw.make_row_mapper(sec["header"][:-1], canon)
+                ridx = tw.row_index.get(bucket) if w is not None else None
+                nrow = ridx.end_rows if ridx is not None else 0
+                col = tw.columnar.writer(bucket, canon).append if tw.columnar is not None else None
+                kept = 0
+                with open(path, "r", encoding="utf-8", newline="", buffering=READ_BLOCK) as src:
+                    for n, row in enumerate(csv.reader(src), 1):
+                        if not n & PROGRESS_CHECK_MASK:
+                            check_cancelled(session_id)
+                        out = map_row(row)
+                        if dup is not None and dup(out):
+                            continue
+                        kept += 1
+                        if w is not None:
+                            if ridx is not None and not nrow & ROW_INDEX_MASK:
+                                ridx.mark(nrow, f.tell())
+                            nrow += 1
+                            w.writerow(out)
+                        if col is not None:
+                            col(out)
+                        if agg is not None:
+                            agg(out)
+                        if sink is not None:
+                            sink(bucket, canon, out)
+            if w is not None:
+                tw.table_written(bucket, kept)
+            tw.counts[bucket] += kept
+            metrics.ASSEMBLE_ROWS.inc(kept, bucket)
+            tw.emit_progress(bucket, kept, os.path.getsize(path), force=True)
+    finally:
+        tw.close()
+    return tw.counts
+
+def build_entry(filepath: str, digest: str, session_id: str, index_dir: Optional[str] = None) -> Tuple[str, Dict]:
+    """Parsea el reporte completo a una entrada nueva de la caché."""
+    compression = detect_compression(filepath)
+    idx = None
+    if not compression:
+        idx = load_section_index(filepath, section_index_path(index_dir, filepath) if index_dir else None)
+    build = new_build_dir()
+    try:
+        sections, _ = parse_report_to_sections(filepath, build, session_id, idx, compression=compression)
+        meta = idx["meta"] if idx is not None else report_metadata(filepath)
+        return publish(build, digest, make_manifest(build, meta, sections))
+    except BaseException:
+        shutil.rmtree(build, ignore_errors=True)
+        raise
+
+def parse_report_cached(
+    filepath: str,
+    outputs_dir: str,
+    cliente_por_defecto: str,
+    session_id: str,
+    index_dir: str,
+    sink: Optional[RowSink] = None,
+    write_csv: bool = True,
+) -> Dict[str, int]:
+    """
+    parse_report_file a través de la caché de parseo: un reporte ya visto (mismo
+    hash de contenido y PARSER_VERSION) no se vuelve a escanear, se ensambla
+    desde la caché. Con PARSE_CACHE=false es parse_report_file tal cual.
+    """
+    if not settings.PARSE_CACHE:
+        return parse_report_file(filepath, outputs_dir, cliente_por_defecto, session_id,
+                                 index_path=section_index_path(index_dir, filepath), sink=sink, write_csv=write_csv)
+    name = os.path.basename(filepath)
+    t0 = time.time()
+    digest = content_id(index_dir, filepath)
+    found = load_entry(digest)
+    mode = "cache_hit" if found is not None else "cache_miss"
+    metrics.PARSE_CACHE.inc(1, "hit" if found is not None else "miss")
+    if found is not None:
+        bus.push(session_id, "info", f"{name}: ya parseado antes (caché {digest[:12]}); ensamblando salida")
+    else:
+        with stage(session_id, f"parseo|{name}"):
+            found = build_entry(filepath, digest, session_id, index_dir)
+        bus.push(session_id, "info", f"{name}: parseado en {time.time() - t0:.1f}s y guardado en caché")
+    d, manifest = found
+    with stage(session_id, f"ensamblado|{name}"):
+        counts = assemble_report(filepath, d, manifest, outputs_dir, cliente_por_defecto, session_id,
+                                 sink=sink, write_csv=write_csv)
+    metrics.PARSE_REPORT_SECONDS.observe(time.time() - t0, mode)
+    bus.push(session_id, "info",
+             f"Procesado {name} "
+             f"(T1N={counts['t1_normal']}, T1A={counts['t1_ajustada']}, "
+             f"T2N={counts['t2_normal']}, T2A={counts['t2_ajustada']})")
+    return counts
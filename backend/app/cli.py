@@ -0,0 +1,174 @@
+"""
+Modo batch sin servidor web: parsea reportes que ya están en disco y opcionalmente
+los ingesta en Elasticsearch, con el mismo código que la app (parse_report_file vía
+caché de parseo / pool paralelo, y bulk_ingest).
+
+    cd backend
+    python -m app.cli /mnt/reportes/*.csv --cliente ACME --out /data/acme
+    python -m app.cli /mnt/reportes --cliente ACME --out /data/acme --workers 8 --ingest
+
+La configuración (ES_*, PARSE_CACHE, MAX_CONCURRENCY...) se lee de las mismas
+variables de entorno / .env que el backend.
+"""
+import argparse, glob, json, os, sys, time, uuid
+from typing import Dict, List
+from .cache import parse_report_cached
+from .columnar import INGEST_SOURCES, remove_parts
+from .config import settings
+from .dedup import remove_dedup_state
+from .elastic import bulk_ingest, bulk_load_mode
+from .models import EsIndices
+from .parallel import parse_reports_parallel
+from .parser import BUCKETS
+from .progress import bus
+from .summary import remove_report_summaries
+
+_LEVEL_TAG = {"warning": "WARN", "error": "ERROR", "success": "OK"}
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """Directorios (sus archivos, sin ocultos) y globs → lista de archivos sin duplicados, en orden."""
+    out: List[str] = []
+    seen = set()
+    for pat in patterns:
+        if os.path.isdir(pat):
+            found = sorted(os.path.join(pat, f) for f in os.listdir(pat) if not f.startswith("."))
+        else:
+            found = sorted(glob.glob(pat, recursive=True))
+        for p in found:
+            p = os.path.abspath(p)
+            if os.path.isfile(p) and p not in seen:
+                seen.add(p)
+                out.append(p)
+    return out
+
+def _console(verbose: bool):
+    last_progress = [0.0]
+
+    def listener(session_id: str, level: str, message: str):
+        if message.startswith(("progress|", "timing|")):
+            # Progreso: como mucho una línea por segundo (o todas con -v)
+            if not verbose and time.time() - last_progress[0] < 1.0:
+                return
+            last_progress[0] = time.time()
+            message = " ".join(message.split("|")[1:])
+        print(f"[{_LEVEL_TAG.get(level, 'INFO')}] {message}", file=sys.stderr, flush=True)
+    return listener
+
+def _fmt_rate(n: float, secs: float, unit: str) -> str:
+    return f"{n / max(secs, 1e-6):,.0f} {unit}/s"
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m app.cli",
+                                 description="Procesa reportes Qualys (y opcionalmente los ingesta en ES) sin la API web.")
+    ap.add_argument("inputs", nargs="+", help="Directorios o globs de reportes (.csv, .csv.gz, .csv.zst)")
+    ap.add_argument("--cliente", required=True, help="Cliente por defecto (si el reporte no trae uno)")
+    ap.add_argument("--out", default="outputs", help="Directorio de salida de los CSV (default: ./outputs)")
+    ap.add_argument("--append", action="store_true", help="Agregar a los CSV existentes en --out en vez de recrearlos")
+    ap.add_argument("--workers", type=int, default=settings.MAX_CONCURRENCY,
+                    help="Procesos de parseo (1 = secuencial; default: MAX_CONCURRENCY)")
+    ap.add_argument("--no-cache", action="store_true", help="No usar la caché de parseo (PARSE_CACHE)")
+    ap.add_argument("--parquet", action="store_true",
+                    help="Escribir también un dataset Parquet por bucket en --out/parquet/ (OUTPUT_PARQUET; requiere pyarrow)")
+    ap.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=settings.OUTPUT_DEDUP,
+                    help="Omitir filas repetidas entre reportes según DEDUP_COLUMNS_T1/_T2 (default: OUTPUT_DEDUP)")
+    ap.add_argument("--ingest", action="store_true", help="Ingestar las salidas en Elasticsearch (ES_BASE_URL)")
+    ap.add_argument("--ingest-source", choices=INGEST_SOURCES, default=settings.INGEST_SOURCE,
+                    help="Leer la ingesta de los CSV o de las partes Parquet (default: INGEST_SOURCE)")
+    ap.add_argument("--bulk-load", action=argparse.BooleanOptionalAction, default=settings.ES_BULK_LOAD,
+                    help="Modo bulk-load: template, refresh/réplicas en pausa y _id determinista (default: ES_BULK_LOAD)")
+    ap.add_argument("--delta", action=argparse.BooleanOptionalAction, default=settings.ES_DELTA,
+                    help="Enviar solo filas nuevas o cambiadas desde la última ingesta del índice (default: ES_DELTA)")
+    ap.add_argument("--delete-missing", action=argparse.BooleanOptionalAction, default=settings.ES_DELTA_DELETES,
+                    help="Con --delta, borrar filas que ya no aparecen (default: ES_DELTA_DELETES)")
+    ap.add_argument("--no-resume", action="store_true", help="Ingesta desde cero, ignorando el checkpoint de --out")
+    defaults = EsIndices()
+    for bucket, index in defaults.by_bucket().items():
+        ap.add_argument(f"--{bucket.replace('_', '-')}-index", dest=f"{bucket}_index", default=index,
+                        help=f"Índice para {bucket} (default: {index})")
+    ap.add_argument("--json", action="store_true", help="Imprimir el resumen final como JSON en stdout")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Mostrar todos los eventos de progreso")
+    return ap
+
+def run(args: argparse.Namespace) -> Dict:
+    files = expand_inputs(args.inputs)
+    if not files:
+        raise SystemExit("No se encontraron reportes en: " + " ".join(args.inputs))
+    if args.no_cache:
+        settings.PARSE_CACHE = False
+    if args.parquet:
+        settings.OUTPUT_PARQUET = True
+    settings.OUTPUT_DEDUP = args.dedup
+
+    out_dir = os.path.abspath(args.out)
+    index_dir = os.path.join(out_dir, ".index")
+    os.makedirs(index_dir, exist_ok=True)
+    if not args.append:
+        for k in BUCKETS:
+            try:
+                os.remove(os.path.join(out_dir, f"{k}.csv"))
+            except OSError:
+                pass
+        remove_parts(out_dir)
+        remove_report_summaries(out_dir)
+        remove_dedup_state(out_dir)
+
+    session_id = f"cli-{uuid.uuid4().hex[:12]}"
+    bus.init(session_id)
+    bus.add_listener(_console(args.verbose))
+    summary: Dict = {"files": len(files), "input_bytes": sum(os.path.getsize(p) for p in files), "out": out_dir}
+
+    # 1) Parseo
+    t0 = time.time()
+    if args.workers > 1:
+        totals = parse_reports_parallel(files, out_dir, args.cliente, session_id,
+                                        workers=args.workers, index_dir=index_dir)
+    else:
+        totals = {k: 0 for k in BUCKETS}
+        for p in files:
+            for k, v in parse_report_cached(p, out_dir, args.cliente, session_id, index_dir).items():
+                totals[k] += v
+    parse_s = time.time() - t0
+    rows = sum(totals.values())
+    summary["parse"] = {"seconds": round(parse_s, 3), "rows": totals,
+                        "rows_per_s": round(rows / max(parse_s, 1e-6)),
+                        "mb_per_s": round(summary["input_bytes"] / 1048576 / max(parse_s, 1e-6), 2)}
+    print(f"Parseo: {len(files)} archivo(s), {summary['input_bytes'] / 1048576:,.1f} MB, {rows:,} filas "
+          f"en {parse_s:.1f}s ({_fmt_rate(rows, parse_s, 'filas')}, "
+          f"{summary['parse']['mb_per_s']:,.1f} MB/s)", file=sys.stderr)
+
+    # 2) Ingesta (opcional)
+    if args.ingest:
+        checkpoint = os.path.join(out_dir, ".ingest_checkpoint.json")
+        if args.no_resume and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        indices = {k: getattr(args, f"{k}_index") for k in BUCKETS}
+        t1 = time.time()
+        with bulk_load_mode(session_id, indices, args.bulk_load):
+            stats = bulk_ingest(session_id, out_dir, indices, checkpoint_path=checkpoint, doc_ids=args.bulk_load,
+                                delta=args.delta, delete_missing=args.delete_missing, scope=args.cliente,
+                                source=args.ingest_source)
+        ingest_s = time.time() - t1
+        docs = sum(st["indexed"] for st in stats.values())
+        summary["ingest"] = {"seconds": round(ingest_s, 3), "stats": stats,
+                             "docs_per_s": round(docs / max(ingest_s, 1e-6))}
+        print(f"Ingesta: {docs:,} docs en {ingest_s:.1f}s ({_fmt_rate(docs, ingest_s, 'docs')}); "
+              f"fallidos: {sum(st['failed'] for st in stats.values())}", file=sys.stderr)
+    return summary
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        summary = run(args)
+    except KeyboardInterrupt:
+        print("Interrumpido", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False))
+    failed = sum(st["failed"] for st in summary.get("ingest", {}).get("stats", {}).values())
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
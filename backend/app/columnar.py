@@ -0,0 +1,144 @@
+import glob, hashlib, os
+from typing import Dict, Iterator, List, Optional, Tuple
+from .config import settings
+
+try:  # opcional: solo necesario con OUTPUT_PARQUET o ingesta desde Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+# Salida columnar opcional (OUTPUT_PARQUET): junto a cada CSV de bucket, un dataset
+# Parquet por bucket en outputs/parquet/<bucket>/ con una parte por reporte
+# (Parquet no admite append). Las filas llegan ya mapeadas (map_row) y se
+# acumulan en lotes de PARQUET_ROW_GROUP_ROWS que se transponen a columnas y se
+# escriben como un row group tipado y comprimido. El directorio de cada bucket se
+# lee como un solo dataset (pyarrow.dataset, DuckDB, Spark, pandas.read_parquet).
+PARQUET_DIRNAME = "parquet"
+INGEST_SOURCES = ("csv", "parquet")
+
+# Columnas numéricas conocidas; el resto es string (con diccionario por row group)
+_INT_COLUMNS = {"passed", "failed", "error"}
+
+def require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("La salida Parquet requiere 'pyarrow' (pip install pyarrow)")
+
+def parquet_dir(outputs_dir: str, bucket: str) -> str:
+    return os.path.join(outputs_dir, PARQUET_DIRNAME, bucket)
+
+def part_name(filepath: str) -> str:
+    # Nombre del reporte + hash de la ruta: dos reportes homónimos (CLI) no se pisan
+    tag = hashlib.blake2b(os.path.abspath(filepath).encode("utf-8"), digest_size=4).hexdigest()
+    return f"{os.path.basename(filepath)}.{tag}.parquet"
+
+def part_report(name: str) -> str:
+    """Nombre del reporte de una parte (inverso de part_name)."""
+    return name.rsplit(".", 2)[0]
+
+def list_parts(outputs_dir: str, bucket: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(parquet_dir(outputs_dir, bucket), "*.parquet")))
+
+def _to_int(v: str) -> Optional[int]:
+    try:
+        return int(v)
+    except ValueError:
+        try:
+            f = float(v.rstrip("%"))
+            return int(f) if f.is_integer() else None
+        except ValueError:
+            return None
+
+def schema_for(header: List[str]) -> "pa.Schema":
+    return pa.schema([pa.field(h, pa.int32() if h.strip().lower() in _INT_COLUMNS else pa.string())
+                      for h in header])
+
+class _PartWriter:
+    """Una parte (reporte × bucket): se escribe en .tmp y se publica al cerrar."""
+    def __init__(self, path: str, header: List[str]):
+        self.path = path
+        self.schema = schema_for(header)
+        self.int_cols = [i for i, f in enumerate(self.schema) if pa.types.is_integer(f.type)]
+        self.rows: List[List[str]] = []
+        self.dropped = 0  # valores numéricos no convertibles (quedan null)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.writer = pq.ParquetWriter(path + ".tmp", self.schema, compression=settings.PARQUET_COMPRESSION)
+
+    def append(self, row: List[str]) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= settings.PARQUET_ROW_GROUP_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        columns = [list(c) for c in zip(*self.rows)]  # transposición en C
+        for i in self.int_cols:
+            vals = [_to_int(v) if v else None for v in columns[i]]
+            self.dropped += sum(1 for v, o in zip(vals, columns[i]) if v is None and o)
+            columns[i] = vals
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))  # un row group por lote
+        self.rows = []
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+        os.replace(self.path + ".tmp", self.path)
+
+class ColumnarOutput:
+    """Partes Parquet de un reporte, una por bucket con filas; se crean con la primera fila."""
+    def __init__(self, outputs_dir: str, filepath: str):
+        require_pyarrow()
+        self.outputs_dir = outputs_dir
+        self.name = part_name(filepath)
+        self.parts: Dict[str, _PartWriter] = {}
+
+    def writer(self, bucket: str, header: List[str]) -> _PartWriter:
+        w = self.parts.get(bucket)
+        if w is None:
+            w = self.parts[bucket] = _PartWriter(os.path.join(parquet_dir(self.outputs_dir, bucket), self.name), header)
+        return w
+
+    def close(self) -> int:
+        """Publica las partes; devuelve cuántos valores numéricos no se pudieron convertir."""
+        dropped = 0
+        for w in self.parts.values():
+            w.close()
+            dropped += w.dropped
+        return dropped
+
+def remove_parts(outputs_dir: str, keep_reports: Optional[set] = None) -> None:
+    """Borra partes (y .tmp de corridas interrumpidas) de reportes fuera de `keep_reports` (None = todas)."""
+    for bucket_dir in glob.glob(os.path.join(outputs_dir, PARQUET_DIRNAME, "*")):
+        for p in glob.glob(os.path.join(bucket_dir, "*")):
+            name = os.path.basename(p)
+            if name.endswith(".tmp") or keep_reports is None or part_report(name) not in keep_reports:
+                os.remove(p)
+
+def dataset_identity(outputs_dir: str, bucket: str) -> Tuple[int, float]:
+    """(bytes, mtime máx.) de las partes del bucket: identidad para el checkpoint de ingesta."""
+    parts = list_parts(outputs_dir, bucket)
+    return sum(os.path.getsize(p) for p in parts), max((os.path.getmtime(p) for p in parts), default=0.0)
+
+def rows_from_parquet(outputs_dir: str, bucket: str, offset: int = 0,
+                      batch_rows: int = 8192) -> Iterator[Tuple[Dict[str, object], int]]:
+    """
+    (fila, ordinal siguiente) de las partes del bucket en orden, desde la fila
+    global `offset`. Los row groups anteriores al offset se saltan por metadatos.
+    """
+    require_pyarrow()
+    base = 0
+    for path in list_parts(outputs_dir, bucket):
+        pf = pq.ParquetFile(path)
+        for rg in range(pf.num_row_groups):
+            n = pf.metadata.row_group(rg).num_rows
+            if base + n <= offset:
+                base += n
+                continue
+            skip = max(0, offset - base)
+            table = pf.read_row_group(rg)
+            for batch in table.slice(skip).to_batches(batch_rows):
+                for i, row in enumerate(batch.to_pylist(), base + skip + 1):
+                    yield row, i
+                skip += batch.num_rows
+            base += n
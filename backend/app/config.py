@@ -14,9 +14,48 @@ class Settings:
     ES_API_KEY: str = os.getenv("ES_API_KEY", "")        # <<— usa ApiKey si viene
     ES_VERIFY_SSL: bool = _to_bool(os.getenv("ES_VERIFY_SSL", "true"), True)
     ES_CA_CERT: str = os.getenv("ES_CA_CERT", "")        # path a CA bundle opcional
+    ES_BULK_MAX_DOCS: int = int(os.getenv("ES_BULK_MAX_DOCS", "5000"))            # docs por _bulk
+    ES_BULK_MAX_BYTES: int = int(os.getenv("ES_BULK_MAX_BYTES", "10485760"))      # 10MB (< http.max_content_length)
+    ES_BULK_MAX_RETRIES: int = int(os.getenv("ES_BULK_MAX_RETRIES", "5"))
+    ES_BULK_BACKOFF_SEC: float = float(os.getenv("ES_BULK_BACKOFF_SEC", "0.5"))  # base del backoff exponencial
+    ES_BULK_TIMEOUT: float = float(os.getenv("ES_BULK_TIMEOUT", "120"))
+    ES_BULK_MIN_DOCS: int = int(os.getenv("ES_BULK_MIN_DOCS", "200"))             # piso del tamaño adaptativo
+    ES_BULK_TARGET_LATENCY: float = float(os.getenv("ES_BULK_TARGET_LATENCY", "2.0"))  # seg por _bulk
+    ES_INGEST_WORKERS: int = int(os.getenv("ES_INGEST_WORKERS", "4"))             # emisores _bulk concurrentes
+    ES_BULK_LOAD: bool = _to_bool(os.getenv("ES_BULK_LOAD", "false"), False)     # templates + refresh/réplicas en pausa
+    ES_TEMPLATE_SHARDS: int = int(os.getenv("ES_TEMPLATE_SHARDS", "1"))           # shards de índices nuevos (template)
+    ES_ID_COLUMNS_T1: str = os.getenv("ES_ID_COLUMNS_T1", "")  # columnas del _id en bulk-load; vacío = fila completa
+    ES_ID_COLUMNS_T2: str = os.getenv("ES_ID_COLUMNS_T2", "")  # p.ej. "Cliente,Host IP,Control ID" → upsert por host
+    ES_DELTA: bool = _to_bool(os.getenv("ES_DELTA", "false"), False)  # solo filas nuevas/cambiadas (huellas por índice)
+    ES_DELTA_DELETES: bool = _to_bool(os.getenv("ES_DELTA_DELETES", "false"), False)  # borrar filas desaparecidas
+    FINGERPRINT_CACHE_MB: int = int(os.getenv("FINGERPRINT_CACHE_MB", "64"))  # caché SQLite del almacén de huellas
 
     DATA_DIR: str = os.getenv("DATA_DIR", "/tmp/app/sessions")
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "8388608"))  # 8MB
-    MAX_CONCURRENCY: int = int(os.getenv("MAX_CONCURRENCY", "2"))
+    UPLOAD_WRITE_BUFFER: int = int(os.getenv("UPLOAD_WRITE_BUFFER", "1048576"))  # bloque por pwrite en /upload/chunk
+    MAX_CONCURRENCY: int = int(os.getenv("MAX_CONCURRENCY", "2"))      # procesos del pool de parseo
+    PROGRESS_MAX_EVENTS: int = int(os.getenv("PROGRESS_MAX_EVENTS", "2000"))  # ring buffer por sesión
+    SSE_KEEPALIVE_SEC: float = float(os.getenv("SSE_KEEPALIVE_SEC", "15"))
+    PROGRESS_BACKEND: str = os.getenv("PROGRESS_BACKEND", "memory").strip().lower()  # memory | sqlite
+    PROGRESS_POLL_SEC: float = float(os.getenv("PROGRESS_POLL_SEC", "0.25"))  # sqlite: eventos de otros procesos
+    PREVIEW_MAX_ROWS: int = int(os.getenv("PREVIEW_MAX_ROWS", "1000"))      # filas por página de vista previa
+    PREVIEW_MAX_SCAN: int = int(os.getenv("PREVIEW_MAX_SCAN", "200000"))   # filas recorridas por request con filtros
+    OUTPUT_SUMMARY: bool = _to_bool(os.getenv("OUTPUT_SUMMARY", "true"), True)  # agregados en outputs/summary.json
+    OUTPUT_DEDUP: bool = _to_bool(os.getenv("OUTPUT_DEDUP", "false"), False)  # omite filas repetidas entre reportes
+    DEDUP_COLUMNS_T1: str = os.getenv("DEDUP_COLUMNS_T1", "")  # columnas clave; vacío = fila completa
+    DEDUP_COLUMNS_T2: str = os.getenv("DEDUP_COLUMNS_T2", "")  # p.ej. "Cliente,Host IP,Control ID"
+    DEDUP_MEMORY_MB: int = int(os.getenv("DEDUP_MEMORY_MB", "64"))  # RAM total (Bloom + caché SQLite) por reporte
+    OUTPUT_PARQUET: bool = _to_bool(os.getenv("OUTPUT_PARQUET", "false"), False)  # + outputs/parquet/<bucket>/ (pyarrow)
+    PARQUET_ROW_GROUP_ROWS: int = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "131072"))  # filas por row group
+    PARQUET_COMPRESSION: str = os.getenv("PARQUET_COMPRESSION", "zstd")  # zstd | snappy | gzip | none
+    INGEST_SOURCE: str = os.getenv("INGEST_SOURCE", "csv").strip().lower()  # csv | parquet
+    RESULTS_ZIP_LEVEL: int = int(os.getenv("RESULTS_ZIP_LEVEL", "6"))  # deflate 1 (rápido) .. 9 (máximo)
+    PARSE_CACHE: bool = _to_bool(os.getenv("PARSE_CACHE", "true"), True)  # caché de parseo por hash de contenido
+    PARSE_CACHE_MAX_BYTES: int = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(10 * 1024**3)))  # evicción LRU; 0 = sin límite
+    SCHEDULER_WORKERS: int = int(os.getenv("SCHEDULER_WORKERS", "2"))      # trabajos (parseo/ingesta) simultáneos
+    SCHEDULER_TENANT_MAX: int = int(os.getenv("SCHEDULER_TENANT_MAX", "0"))  # por cliente; 0 = sin tope
+    PROFILE_MODE: str = os.getenv("PROFILE_MODE", "")  # cprofile | sample | vacío = sin perfilado
+    PROFILE_SAMPLE_INTERVAL: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.01"))  # seg entre muestras
+    PARALLEL_PROCESSING: bool = _to_bool(os.getenv("PARALLEL_PROCESSING", "false"), False)
 
 settings = Settings()
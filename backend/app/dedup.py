@@ -0,0 +1,166 @@
+import hashlib, os, shutil, sqlite3
+from typing import Callable, Dict, List, Optional
+from .config import settings
+
+# De-duplicación opcional de filas entre reportes de una sesión (OUTPUT_DEDUP).
+# Clave = columnas DEDUP_COLUMNS_T1 / _T2 (vacío = fila completa). Por bucket:
+#   outputs/.dedup/<bucket>.bloom  → filtro de Bloom (bits, tamaño fijo)
+#   outputs/.dedup/<bucket>.sqlite → claves vistas (digest 128 bits) y su reporte
+# Una clave ausente del Bloom es nueva con certeza y se inserta en lote; un
+# positivo del Bloom se confirma contra SQLite. La RAM queda acotada por
+# DEDUP_MEMORY_MB (Bloom + caché de páginas), no por la cantidad de filas.
+DEDUP_DIRNAME = ".dedup"
+BLOOM_HASHES = 4     # ~10 bits por clave → ≈1.2% de falsos positivos (k=7 apenas mejora y cuesta casi el doble)
+_HASH_RANGE = range(BLOOM_HASHES)
+INSERT_BATCH = 32768  # claves nuevas pendientes antes de escribirlas en SQLite (ordenadas, en lote)
+
+def dedup_dir(outputs_dir: str) -> str:
+    return os.path.join(outputs_dir, DEDUP_DIRNAME)
+
+def dedup_columns(bucket: str) -> List[str]:
+    """Columnas clave del bucket (DEDUP_COLUMNS_T1 / _T2); [] = fila completa."""
+    cols = settings.DEDUP_COLUMNS_T1 if bucket.startswith("t1_") else settings.DEDUP_COLUMNS_T2
+    return [c.strip() for c in cols.split(",") if c.strip()]
+
+def dedup_signature() -> str:
+    """Configuración vigente ('' = apagada): si cambia entre corridas, la salida se reconstruye."""
+    if not settings.OUTPUT_DEDUP:
+        return ""
+    return f"t1={settings.DEDUP_COLUMNS_T1};t2={settings.DEDUP_COLUMNS_T2}"
+
+def _budget() -> Dict[str, int]:
+    # Presupuesto repartido entre los 4 buckets: 3/4 Bloom, 1/4 caché de SQLite
+    share = max(1, settings.DEDUP_MEMORY_MB) * 1024 * 1024 // 4
+    return {"bloom": share * 3 // 4, "cache_kb": max(1, share // 4 // 1024)}
+
+class _BucketDedup:
+    def __init__(self, outputs_dir: str, bucket: str, report: str):
+        d = dedup_dir(outputs_dir)
+        os.makedirs(d, exist_ok=True)
+        self.bloom_path = os.path.join(d, f"{bucket}.bloom")
+        budget = _budget()
+        self.db = sqlite3.connect(os.path.join(d, f"{bucket}.sqlite"), isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA cache_size=-{budget['cache_kb']}")
+        self.db.execute("CREATE TABLE IF NOT EXISTS k (id BLOB PRIMARY KEY, report INTEGER NOT NULL) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS reports (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.execute("INSERT OR IGNORE INTO reports (name) VALUES (?)", (report,))
+        self.report = self.db.execute("SELECT id FROM reports WHERE name = ?", (report,)).fetchone()[0]
+        self.bits = self._load_bloom(budget["bloom"])
+        self.m = len(self.bits) * 8
+        self.pending: Dict[bytes, None] = {}
+        self.duplicates = 0
+
+    def _load_bloom(self, size: int) -> bytearray:
+        bits = bytearray(size)
+        try:
+            with open(self.bloom_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == size and f.readinto(bits) == size:
+                    return bits
+        except OSError:
+            pass
+        # Sin Bloom (o de otro tamaño): se reconstruye desde las claves ya registradas
+        self.m = size * 8
+        for (id_,) in self.db.execute("SELECT id FROM k"):
+            for p in self._positions(id_):
+                bits[p >> 3] |= 1 << (p & 7)
+        return bits
+
+    def _positions(self, digest: bytes) -> List[int]:
+        m = self.m
+        h1 = int.from_bytes(digest[:8], "little") % m  # enteros chicos: aritmética más rápida
+        h2 = int.from_bytes(digest[8:], "little") % m | 1
+        return [(h1 + i * h2) % m for i in _HASH_RANGE]
+
+    def seen(self, key: str) -> bool:
+        """True si la clave ya apareció (en esta sesión); si no, la registra."""
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        bits = self.bits
+        pos = self._positions(digest)
+        for p in pos:
+            if not bits[p >> 3] >> (p & 7) & 1:
+                break
+        else:
+            # Posible repetida: confirmación exacta (pendientes en memoria, luego SQLite)
+            if digest in self.pending or \
+                    self.db.execute("SELECT 1 FROM k WHERE id = ?", (digest,)).fetchone() is not None:
+                self.duplicates += 1
+                return True
+        for p in pos:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.pending[digest] = None
+        if len(self.pending) >= INSERT_BATCH:
+            self.flush()
+        return False
+
+    def flush(self) -> None:
+        if self.pending:
+            self.db.executemany("INSERT OR IGNORE INTO k (id, report) VALUES (?, ?)",
+                                [(d, self.report) for d in sorted(self.pending)])
+            self.pending = {}
+
+    def close(self) -> None:
+        # Primero el Bloom: si SQLite no llega a confirmar, sobran bits (solo más confirmaciones)
+        self.flush()
+        tmp = self.bloom_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.bits)
+        os.replace(tmp, self.bloom_path)
+        self.db.execute("COMMIT")
+        self.db.close()
+
+class RowDeduper:
+    """Filtro de filas repetidas para los buckets de un reporte; el estado vive en outputs/.dedup/."""
+    def __init__(self, outputs_dir: str, filepath: str):
+        self.outputs_dir = outputs_dir
+        self.report = os.path.basename(filepath)
+        self.buckets: Dict[str, _BucketDedup] = {}
+
+    def checker(self, bucket: str, header: List[str]) -> Callable[[List[str]], bool]:
+        """Función fila → ¿repetida? para una tabla con `header` (columnas clave resueltas una vez)."""
+        st = self.buckets.get(bucket)
+        if st is None:
+            st = self.buckets[bucket] = _BucketDedup(self.outputs_dir, bucket, self.report)
+        by_lower = {h.strip().lower(): i for i, h in enumerate(header)}
+        idx = [by_lower[c.lower()] for c in dedup_columns(bucket) if c.lower() in by_lower] \
+            or list(range(len(header)))
+        seen = st.seen
+        return lambda row: seen("\x1f".join([row[i] for i in idx]))
+
+    def close(self) -> Dict[str, int]:
+        """Confirma el estado; devuelve las filas omitidas por bucket."""
+        out = {}
+        for bucket, st in self.buckets.items():
+            st.close()
+            out[bucket] = st.duplicates
+        return out
+
+def remove_dedup_state(outputs_dir: str, keep_reports: Optional[set] = None) -> None:
+    """
+    Olvida las claves de reportes fuera de `keep_reports` (None = todo el estado).
+    Los bits del Bloom se conservan: solo provocan confirmaciones extra, nunca omisiones.
+    """
+    d = dedup_dir(outputs_dir)
+    if keep_reports is None:
+        shutil.rmtree(d, ignore_errors=True)
+        return
+    if not os.path.isdir(d):
+        return
+    keep = sorted(keep_reports)
+    for name in os.listdir(d):
+        if not name.endswith(".sqlite"):
+            continue
+        db = sqlite3.connect(os.path.join(d, name), isolation_level=None)
+        try:
+            gone = [r for (r,) in db.execute(
+                f"SELECT id FROM reports WHERE name NOT IN ({','.join('?' * len(keep))})", keep)]
+            if gone:
+                marks = ",".join("?" * len(gone))
+                db.execute("BEGIN IMMEDIATE")
+                db.execute(f"DELETE FROM k WHERE report IN ({marks})", gone)  # un solo recorrido
+                db.execute(f"DELETE FROM reports WHERE id IN ({marks})", gone)
+                db.execute("COMMIT")
+        finally:
+            db.close()
@@ -0,0 +1,250 @@
+import gzip, hashlib, json, os, re, uuid, zipfile
+from typing import Dict, Iterator, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from .config import settings
+from .parser import BUCKETS
+
+# Archivos de salida descargables (orden del ZIP)
+OUTPUT_NAMES = tuple(f"{k}.csv" for k in BUCKETS)
+READ_BLOCK = 1024 * 1024
+GZ_CACHE_DIRNAME = ".gz"  # dentro de outputs/: copias gzip de cada CSV
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def list_outputs(outputs_dir: str) -> List[Tuple[str, str]]:
+    """(nombre, ruta) de los CSV de salida existentes, en orden de bucket."""
+    out = []
+    for name in OUTPUT_NAMES:
+        p = os.path.join(outputs_dir, name)
+        if os.path.exists(p):
+            out.append((name, p))
+    return out
+
+def _etag(st: os.stat_result, suffix: str = "") -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}{suffix}"'
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Un único rango 'bytes=a-b' / 'bytes=a-' / 'bytes=-n' → (inicio, fin inclusive).
+    None = responder completo (sin Range o multi-rango); 416 si no es satisfacible.
+    """
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    else:
+        n = int(m.group(2))
+        start, end = max(0, size - n), size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Rango no satisfacible",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(READ_BLOCK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def file_response(request: Request, path: str, media_type: str, filename: str,
+                  etag: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Sirve `path` con soporte de Range (un rango), If-Range, If-None-Match y HEAD.
+    La versión de Starlette fijada no implementa Range en FileResponse.
+    """
+    st = os.stat(path)
+    etag = etag or _etag(st)
+    hdrs = {"Accept-Ranges": "bytes", "ETag": etag,
+            "Content-Disposition": f'attachment; filename="{filename}"', **(headers or {})}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=hdrs)
+
+    rng = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        rng = _parse_range(request.headers.get("range"), st.st_size)
+    if rng is None:
+        start, end, code = 0, st.st_size - 1, 200
+    else:
+        start, end = rng
+        code = 206
+        hdrs["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    length = end - start + 1
+    hdrs["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=code, headers=hdrs, media_type=media_type)
+    return StreamingResponse(_iter_file(path, start, length), status_code=code,
+                             headers=hdrs, media_type=media_type)
+
+# === Escritura en streaming con copia a disco (el cliente recibe mientras se genera) ===
+
+class _TeeSink:
+    """Destino no seekable: acumula lo escrito para el cliente y lo copia al archivo de caché."""
+    def __init__(self, fh):
+        self.fh = fh
+        self._parts: List[bytes] = []
+
+    def write(self, b) -> int:
+        b = bytes(b)
+        self._parts.append(b)
+        self.fh.write(b)
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+def _stream_to_cache(final_path: str, build, on_done=None) -> Iterator[bytes]:
+    """
+    Ejecuta build(sink) (generador que escribe en sink) y entrega los bytes a
+    medida que se producen. Solo si termina completo se publica en final_path
+    (rename atómico); un cliente que corta a medias no deja caché corrupta.
+    """
+    tmp = f"{final_path}.{uuid.uuid4().hex}.tmp"
+    ok = False
+    try:
+        with open(tmp, "wb") as fh:
+            sink = _TeeSink(fh)
+            for _ in build(sink):
+                data = sink.drain()
+                if data:
+                    yield data
+            data = sink.drain()
+            if data:
+                yield data
+        os.replace(tmp, final_path)
+        ok = True
+        if on_done:
+            on_done()
+    finally:
+        if not ok:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+# === results.zip ===
+
+def _outputs_key(files: List[Tuple[str, str]]) -> str:
+    h = hashlib.sha1(f"zip-level={settings.RESULTS_ZIP_LEVEL}".encode())
+    for name, p in files:
+        st = os.stat(p)
+        h.update(f"|{name}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+def results_zip_response(request: Request, outputs_dir: str, zip_path: str) -> Response:
+    """
+    results.zip cacheado por (nombre, tamaño, mtime) de los CSV de salida. Si la
+    caché está vigente se sirve con Range; si no, el ZIP se genera en streaming
+    mientras se envía y queda cacheado para la siguiente descarga.
+    """
+    files = list_outputs(outputs_dir)
+    if not files:
+        raise HTTPException(status_code=404, detail="Sin resultados aún")
+    key = _outputs_key(files)
+    key_path = zip_path + ".key"
+    try:
+        with open(key_path, "r", encoding="utf-8") as f:
+            cached = json.load(f).get("key")
+    except (OSError, ValueError):
+        cached = None
+    if cached == key and os.path.exists(zip_path):
+        return file_response(request, zip_path, "application/zip", "results.zip", etag=f'"{key}"')
+
+    def build(sink):
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED,
+                             compresslevel=settings.RESULTS_ZIP_LEVEL) as z:
+            for name, p in files:
+                zip64 = os.path.getsize(p) > zipfile.ZIP64_LIMIT // 2
+                with open(p, "rb") as src, z.open(name, "w", force_zip64=zip64) as dst:
+                    while True:
+                        chunk = src.read(READ_BLOCK)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        yield
+
+    def save_key():
+        with open(key_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key}, f)
+
+    hdrs = {"Content-Disposition": 'attachment; filename="results.zip"', "ETag": f'"{key}"'}
+    if request.method == "HEAD":
+        return Response(headers=hdrs, media_type="application/zip")
+    return StreamingResponse(_stream_to_cache(zip_path, build, save_key),
+                             media_type="application/zip", headers=hdrs)
+
+# === CSV individuales (gzip negociado + Range) ===
+
+def _accepts_gzip(request: Request) -> bool:
+    for part in request.headers.get("accept-encoding", "").split(","):
+        enc, _, params = part.strip().partition(";")
+        if enc.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+def output_file_response(request: Request, outputs_dir: str, name: str) -> Response:
+    """
+    Descarga directa de un CSV de salida. Con 'Accept-Encoding: gzip' se sirve
+    comprimido (Content-Encoding: gzip): la primera vez se comprime al vuelo
+    mientras se envía y se cachea en outputs/.gz/, y a partir de ahí admite
+    Range sobre la versión comprimida. Sin caché gzip, un Range se atiende
+    sobre el CSV sin comprimir.
+    """
+    if name not in OUTPUT_NAMES:
+        raise HTTPException(status_code=404, detail="Archivo desconocido")
+    path = os.path.join(outputs_dir, name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Sin resultados aún")
+    st = os.stat(path)
+    vary = {"Vary": "Accept-Encoding"}
+    if not _accepts_gzip(request):
+        return file_response(request, path, "text/csv", name, headers=vary)
+
+    gz_dir = os.path.join(outputs_dir, GZ_CACHE_DIRNAME)
+    gz_path = os.path.join(gz_dir, name + ".gz")
+    key_path = gz_path + ".key"
+    etag = _etag(st, "-gz")
+    gz_hdrs = {**vary, "Content-Encoding": "gzip"}
+    try:
+        with open(key_path, "r", encoding="utf-8") as f:
+            fresh = f.read() == etag and os.path.exists(gz_path)
+    except OSError:
+        fresh = False
+    if fresh:
+        return file_response(request, gz_path, "text/csv", name, etag=etag, headers=gz_hdrs)
+    if request.headers.get("range") or request.method == "HEAD":
+        return file_response(request, path, "text/csv", name, headers=vary)
+
+    os.makedirs(gz_dir, exist_ok=True)
+
+    def build(sink):
+        with open(path, "rb") as src, gzip.GzipFile(filename="", mode="wb", fileobj=sink,
+                                                    compresslevel=settings.RESULTS_ZIP_LEVEL, mtime=0) as gz:
+            while True:
+                chunk = src.read(READ_BLOCK)
+                if not chunk:
+                    break
+                gz.write(chunk)
+                yield
+
+    def save_key():
+        with open(key_path, "w", encoding="utf-8") as f:
+            f.write(etag)
+
+    return StreamingResponse(_stream_to_cache(gz_path, build, save_key), media_type="text/csv",
+                             headers={**gz_hdrs, "ETag": etag,
+                                      "Content-Disposition": f'attachment; filename="{name}"'})
@@ -1,7 +1,15 @@
-import csv, os, json, requests
-from typing import Dict, Iterator, Optional
+import base64, csv, fcntl, hashlib, os, json, random, socket, threading, time, uuid, requests
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator, List, Optional, Tuple
+from .columnar import dataset_identity, list_parts, require_pyarrow, rows_from_parquet
 from .config import settings
+from .fingerprints import FingerprintStore, content_hash
+from .parser import BUCKETS, ByteLineReader
 from .progress import bus
+from . import metrics
+from .scheduler import JobCancelled, cancel_requested
 
 def _auth():
     # Usa Basic solo si NO hay API key
@@ -11,8 +19,8 @@ def _auth():
         return (settings.ES_USERNAME, settings.ES_PASSWORD)
     return None
 
-def _headers():
-    h = {"Content-Type": "application/x-ndjson"}
+def _headers(content_type: str = "application/x-ndjson"):
+    h = {"Content-Type": content_type}
     if settings.ES_API_KEY:
         # Authorization: ApiKey <base64(id:key)>   (o la “Encoded API key” de Kibana)
         h["Authorization"] = f"ApiKey {settings.ES_API_KEY}"
@@ -24,44 +32,721 @@ def _verify_opt() -> Optional[object]:
         return settings.ES_CA_CERT
     return settings.ES_VERIFY_SSL
 
-def _actions_from_csv(path: str, index: str) -> Iterator[str]:
-    with open(path, "r", encoding="utf-8", newline="") as f:
-        rdr = csv.DictReader(f)
-        for row in rdr:
-            meta = {"index": {"_index": index}}
-            yield json.dumps(meta) + "\n"
-            yield json.dumps(row, ensure_ascii=False) + "\n"
-
-def bulk_ingest(session_id: str, outputs_dir: str, indices: Dict[str, str]) -> Dict[str, int]:
-    files = {
-        "t1_normal":   os.path.join(outputs_dir, "t1_normal.csv"),
-        "t1_ajustada": os.path.join(outputs_dir, "t1_ajustada.csv"),
-        "t2_normal":   os.path.join(outputs_dir, "t2_normal.csv"),
-        "t2_ajustada": os.path.join(outputs_dir, "t2_ajustada.csv"),
-    }
-    stats: Dict[str, int] = {}
-    url = settings.ES_BASE_URL.rstrip("/") + "/_bulk"
-    headers = _headers()
-    auth = _auth()
-    verify = _verify_opt()
-
-    for key, path in files.items():
-        if not os.path.exists(path):
-            stats[key] = 0
-            continue
-
-        bus.push(session_id, "info", f"Ingestando {key} → {indices[key]}")
-        sent = 0
-        with requests.Session() as s:
-            def gen():
-                nonlocal sent
-                for line in _actions_from_csv(path, indices[key]):
-                    sent += 1
-                    yield line.encode("utf-8")
-            resp = s.post(url, data=gen(), headers=headers, auth=auth, stream=True, verify=verify)
-            resp.raise_for_status()
+# Estados que justifican reintento: rechazo por carga (429) o nodo no disponible
+RETRY_STATUS = (429, 502, 503, 504)
+
+def _rows_from_csv(path: str, offset: int = 0) -> Iterator[Tuple[Dict[str, str], int]]:
+    """
+    Lee un CSV de salida desde el byte `offset` (0 = tras el encabezado) y genera
+    (fila, offset_fin_de_fila). El offset permite checkpoints reanudables.
+    """
+    with open(path, "rb", buffering=1024*1024) as f:
+        header_line = f.readline()
+        if not header_line:
+            return
+        header = next(csv.reader([header_line.decode("utf-8", "replace")]))
+        offset = max(offset, len(header_line))
+        f.seek(offset)
+        src = ByteLineReader(f, offset)
+        lines = iter(lambda: src.readline().decode("utf-8", "replace"), "")
+        for row in csv.reader(lines):
+            if row:
+                yield dict(zip(header, row)), src.pos
+
+def _load_checkpoint(path: str) -> Dict[str, Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_checkpoint(path: str, data: Dict[str, Dict]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def id_columns(bucket: str) -> List[str]:
+    """Columnas identidad del bucket (ES_ID_COLUMNS_T1 / _T2) para el _id determinista; [] = fila completa."""
+    cols = settings.ES_ID_COLUMNS_T1 if bucket.startswith("t1_") else settings.ES_ID_COLUMNS_T2
+    return [c.strip() for c in cols.split(",") if c.strip()]
+
+def _id_keys(fields: List[str], id_cols: List[str]) -> List[str]:
+    """Campos de la fila que forman el _id: id_cols sin distinguir mayúsculas, o todos."""
+    by_lower = {k.strip().lower(): k for k in fields}
+    return [by_lower[c.lower()] for c in id_cols if c.lower() in by_lower] or list(fields)
+
+def _cell(v) -> str:
+    # Mismo texto para un valor leído de CSV ("8", "") o de Parquet (8, None): mismo _id
+    return "" if v is None else str(v)
+
+def _id_digest(values: List[str]) -> bytes:
+    return hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=20).digest()
+
+def _doc_id(values: List[str]) -> str:
+    # 160 bits en base64url (27 caracteres): reingestar la misma fila sobrescribe en vez de duplicar
+    return _b64_id(_id_digest(values))
+
+def _b64_id(digest: bytes) -> str:
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+def _encode_actions(rows: List, index: str, header: Optional[List[str]] = None,
+                    id_cols: Optional[List[str]] = None) -> List[Tuple[bytes, bytes]]:
+    """
+    Serializa filas a pares (línea de acción, línea de documento) NDJSON.
+    Las filas son dicts, o listas alineadas con `header` (modo parse→ES).
+    Con `id_cols` el _id es un hash de esas columnas (sin distinguir mayúsculas);
+    con una lista vacía, o si el CSV no tiene ninguna, de la fila completa.
+    """
+    if header is not None:
+        rows = [dict(zip(header, r)) for r in rows]
+    if id_cols is None or not rows:
+        meta = (json.dumps({"index": {"_index": index}}) + "\n").encode("utf-8")
+        return [(meta, (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")) for row in rows]
+    keys = _id_keys(list(rows[0]), id_cols)
+    prefix = '{"index":{"_index":%s,"_id":"' % json.dumps(index)
+    out = []
+    for row in rows:
+        meta = (prefix + _doc_id([_cell(row.get(k)) for k in keys]) + '"}}\n').encode("utf-8")
+        out.append((meta, (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")))
+    return out
+
+def _encode_deletes(ids: List[bytes], index: str) -> List[Tuple[bytes, bytes]]:
+    prefix = '{"delete":{"_index":%s,"_id":"' % json.dumps(index)
+    return [((prefix + _b64_id(i) + '"}}\n').encode("utf-8"), b"") for i in ids]
+
+def _batches(actions: Iterator[Tuple[bytes, bytes]], max_docs: int, max_bytes: int) -> Iterator[List[Tuple[bytes, bytes]]]:
+    """Agrupa acciones en lotes acotados por documentos y por bytes."""
+    batch: List[Tuple[bytes, bytes]] = []
+    size = 0
+    for meta, doc in actions:
+        n = len(meta) + len(doc)
+        if batch and (len(batch) >= max_docs or size + n > max_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append((meta, doc))
+        size += n
+    if batch:
+        yield batch
+
+def _send_batch(s: requests.Session, url: str, batch: List[Tuple[bytes, bytes]], session_id: str, key: str,
+                ok_label: str = "indexed") -> Tuple[int, int, int]:
+    """
+    Envía un lote a _bulk y procesa la respuesta ítem a ítem. Solo los documentos
+    rechazados por carga (RETRY_STATUS) se reenvían, con backoff exponencial.
+    Un 413 parte el lote en mitades; otro error HTTP lo marca como fallido.
+    Devuelve (indexados, fallidos, rechazos por carga observados).
+    """
+    indexed = failed = rejected = 0
+    split_ok = split_bad = 0  # resultados de las mitades tras un 413
+    pending = batch
+    attempt = 0
+    while pending:
+        body = b"".join(m + d for m, d in pending)
+        retry: List[Tuple[bytes, bytes]] = []
+        t0 = time.perf_counter()
+        try:
+            resp = s.post(url, data=body, headers=_headers(), auth=_auth(), verify=_verify_opt(),
+                          timeout=settings.ES_BULK_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            resp = None
+            reason = str(e)
+        metrics.BULK_SECONDS.observe(time.perf_counter() - t0)
+        metrics.BULK_BYTES.inc(len(body))
+        metrics.BULK_REQUESTS.inc(1, "error" if resp is None else f"{resp.status_code // 100}xx")
+        if resp is None or resp.status_code in RETRY_STATUS:
+            retry = pending
+            reason = reason if resp is None else f"HTTP {resp.status_code}"
+        elif resp.status_code == 413 and len(pending) > 1:
+            # Lote más grande que http.max_content_length: se parte en dos y se reenvía;
+            # los documentos cuentan como rechazo para que el AIMD achique los lotes
+            half = len(pending) // 2
+            bus.push(session_id, "warning", f"ES respondió 413 a un lote de {len(pending)} documentos de {key}; se divide")
+            for part in (pending[:half], pending[half:]):
+                ok, bad, rej = _send_batch(s, url, part, session_id, key, ok_label)  # ya cuentan sus métricas
+                split_ok, split_bad, rejected = split_ok + ok, split_bad + bad, rejected + rej
+            rejected += len(pending)
+            break
+        elif resp.status_code >= 300:
+            # Error no reintentable (400, 401, 413 de un solo documento...): el lote queda
+            # como fallido y la ingesta sigue con el resto
+            failed += len(pending)
+            bus.push(session_id, "warning",
+                     f"ES rechazó un lote de {len(pending)} documentos de {key} "
+                     f"(HTTP {resp.status_code}): {resp.text[:300]}")
+            break
+        else:
             rj = resp.json()
-            if rj.get("errors"):
-                bus.push(session_id, "warning", f"ES devolvió errors=true para {key}")
-        stats[key] = sent // 2  # cada doc son 2 líneas NDJSON (_bulk)
+            if not rj.get("errors"):
+                indexed += len(pending)
+            else:
+                first_error = None
+                for item, action in zip(rj.get("items", []), pending):
+                    op, r = next(iter(item.items()), ("", {}))
+                    st = r.get("status", 0)
+                    if 200 <= st < 300 or (op == "delete" and st == 404):  # ya no estaba: nada que borrar
+                        indexed += 1
+                    elif st in RETRY_STATUS:
+                        retry.append(action)
+                    else:
+                        failed += 1
+                        first_error = first_error or r.get("error")
+                if first_error:
+                    bus.push(session_id, "warning", f"ES rechazó documentos de {key}: {json.dumps(first_error, ensure_ascii=False)[:300]}")
+                reason = "rechazo por carga (429/503)"
+        if not retry:
+            break
+        rejected += len(retry)
+        metrics.BULK_RETRIES.inc(len(retry))
+        attempt += 1
+        if attempt > settings.ES_BULK_MAX_RETRIES:
+            failed += len(retry)
+            bus.push(session_id, "warning", f"{len(retry)} documento(s) de {key} descartados tras {attempt - 1} reintentos ({reason})")
+            break
+        delay = settings.ES_BULK_BACKOFF_SEC * (2 ** (attempt - 1)) * (0.5 + random.random())
+        time.sleep(min(delay, 60.0))
+        pending = retry
+    metrics.BULK_DOCS.inc(indexed, ok_label)
+    metrics.BULK_DOCS.inc(failed, "failed")
+    return indexed + split_ok, failed + split_bad, rejected
+
+class _BatchSizer:
+    """
+    Ajuste adaptativo del tamaño de lote (AIMD): crece mientras la latencia de
+    _bulk esté por debajo del objetivo y no haya rechazos; se reduce a la mitad
+    ante rechazos 429/503 y un 20% si la latencia supera el objetivo.
+    """
+    def __init__(self, min_docs: int, max_docs: int, target_latency: float):
+        self.min_docs = max(1, min_docs)
+        self.max_docs = max(self.min_docs, max_docs)
+        self.target = target_latency
+        self.docs = max(self.min_docs, min(self.max_docs, 1000))
+        self._lock = threading.Lock()
+
+    def observe(self, docs: int, latency: float, rejected: int) -> None:
+        with self._lock:
+            if rejected:
+                self.docs = int(self.docs * 0.5)
+            elif latency > self.target:
+                self.docs = int(self.docs * 0.8)
+            elif latency < self.target * 0.5 and docs >= self.docs:
+                self.docs = int(self.docs * 1.25) + 1
+            self.docs = max(self.min_docs, min(self.max_docs, self.docs))
+
+class _AckTracker:
+    """
+    Offset confirmado de un archivo: los lotes terminan en desorden, así que solo
+    se avanza hasta el último lote cuya totalidad de predecesores ya terminó.
+    """
+    def __init__(self, offset: int):
+        self.offset = offset
+        self._ends: Dict[int, int] = {}
+        self._done = set()
+        self._next = 0
+        self._low = 0
+
+    def add(self, end: int) -> int:
+        seq = self._next
+        self._ends[seq] = end
+        self._next += 1
+        return seq
+
+    def complete(self, seq: int) -> None:
+        self._done.add(seq)
+        while self._low in self._done:
+            self._done.discard(self._low)
+            self.offset = self._ends.pop(self._low)
+            self._low += 1
+
+class BulkEngine:
+    """
+    Motor de ingesta concurrente: N hilos emisores comparten un requests.Session
+    con pool de conexiones HTTP. Los productores (lectores de CSV) solo agrupan
+    filas; la serialización JSON y el envío ocurren en los emisores. Un semáforo
+    limita los lotes en vuelo para que la lectura no se adelante sin límite.
+
+    Con `checkpoint_path`, cada ~segundo se persiste por bucket el último offset
+    confirmado por ES (ver _AckTracker) para poder reanudar la ingesta.
+    Con `doc_ids`, cada documento lleva un _id derivado de sus columnas identidad.
+    """
+    def __init__(self, session_id: str, workers: Optional[int] = None, checkpoint_path: Optional[str] = None,
+                 doc_ids: bool = False):
+        self.session_id = session_id
+        self.doc_ids = doc_ids  # _id determinista por columnas identidad (modo bulk-load)
+        self.workers = max(1, workers or settings.ES_INGEST_WORKERS)
+        self.url = settings.ES_BASE_URL.rstrip("/") + "/_bulk"
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bulk")
+        self.sizer = _BatchSizer(settings.ES_BULK_MIN_DOCS, settings.ES_BULK_MAX_DOCS,
+                                 settings.ES_BULK_TARGET_LATENCY)
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.error: Optional[BaseException] = None
+        self.bytes_sent = 0
+        self.docs_done = 0  # documentos procesados en esta ejecución (sin lo reanudado)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint: Dict[str, Dict] = _load_checkpoint(checkpoint_path) if checkpoint_path else {}
+        self._acks: Dict[str, _AckTracker] = {}
+        self._inflight = threading.BoundedSemaphore(self.workers * 2)
+        self._lock = threading.Lock()
+        self._t0 = self._last_emit = time.time()
+
+    def _send(self, key: str, index: str, rows: List, header: Optional[List[str]] = None,
+              seq: Optional[int] = None, op: str = "index") -> None:
+        try:
+            if self.error is not None:
+                return
+            if op == "delete":  # rows = digests de _id (ingesta delta)
+                actions, field = _encode_deletes(rows, index), "deleted"
+            else:
+                actions, field = _encode_actions(rows, index, header, id_columns(key) if self.doc_ids else None), "indexed"
+            for part in _batches(iter(actions), len(actions), settings.ES_BULK_MAX_BYTES):
+                t0 = time.time()
+                ok, bad, rejected = _send_batch(self.http, self.url, part, self.session_id, key, field)
+                self.sizer.observe(len(part), time.time() - t0, rejected)
+                self._account(key, ok, bad, sum(len(m) + len(d) for m, d in part), field)
+            if seq is not None:
+                with self._lock:
+                    self._acks[key].complete(seq)
+        except BaseException as e:
+            self.error = self.error or e
+        finally:
+            self._inflight.release()
+
+    def _account(self, key: str, ok: int, bad: int, nbytes: int, field: str = "indexed") -> None:
+        with self._lock:
+            st = self.stats.setdefault(key, {"indexed": 0, "failed": 0})
+            st[field] = st.get(field, 0) + ok
+            st["failed"] += bad
+            self.bytes_sent += nbytes
+            self.docs_done += ok + bad
+            if time.time() - self._last_emit >= 1.0:
+                self._last_emit = time.time()
+                self._save_checkpoint_locked()
+                rate = self.docs_done / max(self._last_emit - self._t0, 1e-6)
+                summary = "|".join(f"{k}={v['indexed']}" for k, v in self.stats.items())
+                bus.push(self.session_id, "info",
+                         f"progress|ingest|{summary}|docs_s={rate:.0f}|bytes={self.bytes_sent}|batch={self.sizer.docs}")
+
+    def _save_checkpoint_locked(self) -> None:
+        if not self.checkpoint_path:
+            return
+        for key, ack in self._acks.items():
+            cp = self.checkpoint.get(key)
+            if cp is not None:
+                cp["offset"] = ack.offset
+                cp.update(self.stats.get(key, {}))
+        _save_checkpoint(self.checkpoint_path, self.checkpoint)
+
+    def resume_offset(self, key: str, index: str, identity: Tuple[int, float], source: str = "csv") -> int:
+        """
+        Offset desde el que reanudar: solo si el checkpoint es del mismo índice, origen
+        y contenido (identity = tamaño, mtime). En CSV es un offset en bytes; en
+        Parquet, un ordinal de fila.
+        """
+        size, mtime = identity
+        cp = self.checkpoint.get(key)
+        fresh = {"index": index, "source": source, "size": size, "mtime": mtime, "offset": 0}
+        if cp and all(cp.get(k, "csv" if k == "source" else None) == v for k, v in fresh.items() if k != "offset"):
+            fresh = cp
+        self.checkpoint[key] = fresh
+        return int(fresh.get("offset", 0))
+
+    def feed(self, key: str, index: str, rows: Iterator[Tuple[Dict[str, str], int]], offset: int = 0) -> None:
+        """
+        Agrupa `rows` ((fila, offset_fin)) según el tamaño de lote vigente y los
+        reparte entre los emisores, registrando el offset final de cada lote.
+        """
+        self.stats.setdefault(key, {"indexed": 0, "failed": 0})
+        with self._lock:
+            self._acks[key] = ack = _AckTracker(offset)
+        batch: List[Dict[str, str]] = []
+        end = offset
+        for row, end in rows:
+            batch.append(row)
+            if len(batch) >= self.sizer.docs:
+                if cancel_requested(self.session_id):
+                    # Se descarta el lote: el checkpoint queda en el último confirmado
+                    self.error = self.error or JobCancelled("cancelado por el usuario")
+                    break
+                with self._lock:
+                    seq = ack.add(end)
+                self.submit(key, index, batch, seq=seq)
+                batch = []
+            if self.error is not None:
+                break
+        if batch and self.error is None:
+            with self._lock:
+                seq = ack.add(end)
+            self.submit(key, index, batch, seq=seq)
+
+    def submit(self, key: str, index: str, rows: List, header: Optional[List[str]] = None,
+               seq: Optional[int] = None, op: str = "index") -> None:
+        self._inflight.acquire()  # backpressure: bloquea si hay demasiados lotes en vuelo
+        self.pool.submit(self._send, key, index, rows, header, seq, op)
+
+    def delete(self, key: str, index: str, id_chunks: Iterator[List[bytes]]) -> None:
+        """Borra por _id (digests) en lotes del tamaño vigente; las ausencias (404) no cuentan como fallo."""
+        for ids in id_chunks:
+            if self.error is not None or cancel_requested(self.session_id):
+                self.error = self.error or JobCancelled("cancelado por el usuario")
+                break
+            for i in range(0, len(ids), self.sizer.docs):
+                self.submit(key, index, ids[i:i + self.sizer.docs], op="delete")
+
+    def close(self) -> Dict[str, Dict[str, int]]:
+        self.pool.shutdown(wait=True)
+        self.http.close()
+        with self._lock:
+            self._save_checkpoint_locked()
+        if self.error is not None:
+            raise self.error
+        return self.stats
+
+class StreamIngest:
+    """
+    Modo fusionado parse→ES: se pasa como `sink` a parse_report_file y recibe
+    las filas mapeadas sin pasar por los CSV intermedios. Las filas se agrupan
+    por bucket y se entregan a BulkEngine; cuando hay demasiados lotes en vuelo
+    submit() bloquea y con ello frena al parser (backpressure).
+    """
+    def __init__(self, session_id: str, indices: Dict[str, str], doc_ids: bool = False):
+        self.indices = indices
+        self.engine = BulkEngine(session_id, doc_ids=doc_ids)
+        self._pending: Dict[str, Tuple[List[str], List[List[str]]]] = {}
+
+    def __call__(self, bucket: str, header: List[str], row: List[str]) -> None:
+        hdr, rows = self._pending.get(bucket) or (header, [])
+        if hdr is not header and rows:
+            self._flush(bucket)
+            rows = []
+        rows.append(row)
+        self._pending[bucket] = (header, rows)
+        if len(rows) >= self.engine.sizer.docs:
+            self._flush(bucket)
+            if self.engine.error is not None:
+                raise self.engine.error
+
+    def _flush(self, bucket: str) -> None:
+        header, rows = self._pending.pop(bucket, (None, []))
+        if rows:
+            self.engine.submit(bucket, self.indices[bucket], rows, header)
+
+    def close(self) -> Dict[str, Dict[str, int]]:
+        for bucket in list(self._pending):
+            self._flush(bucket)
+        return self.engine.close()
+
+# === Modo bulk-load: templates explícitos, refresh/réplicas en pausa, _id determinista ===
+
+# Mapeo de las columnas conocidas de las salidas; el resto de strings → keyword (dynamic_templates)
+_FIELD_TYPES = {
+    "Cliente": {"type": "keyword"},
+    "Control ID": {"type": "keyword"},
+    "Control": {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 1024}}},
+    "Passed": {"type": "integer", "ignore_malformed": True},
+    "Failed": {"type": "integer", "ignore_malformed": True},
+    "Error": {"type": "integer", "ignore_malformed": True},
+    "Host IP": {"type": "ip", "ignore_malformed": True},
+    "DNS Hostname": {"type": "keyword"},
+    "Operating System": {"type": "keyword"},
+    "Status": {"type": "keyword"},
+    "Evidence": {"type": "text"},
+}
+
+def _es(method: str, path: str, body: Optional[Dict] = None, ok=(200, 201)) -> requests.Response:
+    resp = requests.request(method, settings.ES_BASE_URL.rstrip("/") + path, json=body,
+                            headers=_headers("application/json"), auth=_auth(), verify=_verify_opt(),
+                            timeout=settings.ES_BULK_TIMEOUT)
+    if resp.status_code not in ok:
+        raise RuntimeError(f"ES {method} {path}: HTTP {resp.status_code} {resp.text[:300]}")
+    return resp
+
+def index_template(index: str) -> Dict:
+    """Template compuesto para `index`: mapeo explícito (sin text+keyword dinámico) y compresión."""
+    return {
+        "index_patterns": [index],
+        "priority": 500,
+        "template": {
+            "settings": {"number_of_shards": settings.ES_TEMPLATE_SHARDS, "codec": "best_compression"},
+            "mappings": {
+                "dynamic_templates": [{"strings_as_keyword": {
+                    "match_mapping_type": "string",
+                    "mapping": {"type": "keyword", "ignore_above": 1024}}}],
+                "properties": _FIELD_TYPES,
+            },
+        },
+        "_meta": {"managed_by": "qualys-csv-processor"},
+    }
+
+def _index_settings(index: str) -> Dict[str, Optional[str]]:
+    st = _es("GET", f"/{index}/_settings").json()
+    idx = next(iter(st.values()), {}).get("settings", {}).get("index", {})
+    return {"refresh_interval": idx.get("refresh_interval"), "number_of_replicas": idx.get("number_of_replicas")}
+
+BULK_LOAD_STATE = "es_bulk_load.json"  # en DATA_DIR: compartido por todas las sesiones / la CLI
+
+def _bulk_state_path() -> str:
+    return os.path.join(settings.DATA_DIR, BULK_LOAD_STATE)
+
+@contextmanager
+def _locked_bulk_state():
+    """
+    Estado del modo bulk-load por índice, bajo flock (válido entre procesos):
+    {índice: {"refresh_interval", "number_of_replicas", "loaders": {token: {host, pid}}}}.
+    """
+    path = _bulk_state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as lk:
+        fcntl.flock(lk, fcntl.LOCK_EX)
+        try:
+            state = _load_checkpoint(path)
+            try:
+                yield state
+            finally:  # también ante error: lo ya aplicado en ES queda registrado
+                if state:
+                    _save_checkpoint(path, state)
+                elif os.path.exists(path):
+                    os.remove(path)
+        finally:
+            fcntl.flock(lk, fcntl.LOCK_UN)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # existe pero es de otro usuario
+        return True
+    return True
+
+def _prune_loaders(entry: Dict) -> Dict:
+    """Descarta cargadores de este host cuyo proceso ya no existe (murió a mitad de carga)."""
+    host = socket.gethostname()
+    loaders = entry.setdefault("loaders", {})
+    for token, who in list(loaders.items()):
+        if who.get("host") == host and not _pid_alive(who.get("pid", 0)):
+            del loaders[token]
+    return loaders
+
+def _original_settings(index: str) -> Dict[str, Optional[str]]:
+    # -1 / 0 son los valores que pone el propio modo bulk-load (p.ej. una carga
+    # interrumpida sin estado): nunca se guardan como originales → default del cluster
+    orig = _index_settings(index)
+    if orig["refresh_interval"] == "-1":
+        orig["refresh_interval"] = None
+    if orig["number_of_replicas"] in ("0", 0):
+        orig["number_of_replicas"] = None
+    return orig
+
+def _create_index(index: str) -> bool:
+    """Crea el índice; False si ya existía. Cualquier otro 400 es un error."""
+    resp = _es("PUT", f"/{index}", ok=(200, 201, 400))
+    if resp.status_code != 400:
+        return True
+    try:
+        err_type = resp.json().get("error", {}).get("type")
+    except ValueError:
+        err_type = None
+    if err_type != "resource_already_exists_exception":
+        raise RuntimeError(f"ES PUT /{index}: HTTP 400 {resp.text[:300]}")
+    return False
+
+@contextmanager
+def bulk_load_mode(session_id: str, indices: Dict[str, str], enabled: bool = True):
+    """
+    Prepara los índices para una carga masiva y los restaura al salir:
+      - instala un index template por índice (solo afecta índices nuevos)
+      - refresh_interval=-1 y number_of_replicas=0 durante la carga
+    Los índices son compartidos entre sesiones: los valores originales y los
+    cargadores activos viven en DATA_DIR/es_bulk_load.json (con flock). Solo el
+    primer cargador guarda los originales y solo el último los restaura; si un
+    proceso muere a mitad de carga, el siguiente que termine restaura esos y no -1/0.
+    """
+    if not enabled:
+        yield
+        return
+    token = f"{session_id}:{uuid.uuid4().hex}"
+    targets = list(dict.fromkeys(indices.values()))
+
+    def release():
+        busy = []
+        with _locked_bulk_state() as state:
+            for index in targets:
+                entry = state.get(index)
+                if entry is None:
+                    continue
+                loaders = _prune_loaders(entry)
+                loaders.pop(token, None)
+                if loaders:  # otra carga sigue en curso: restaura el último en salir
+                    busy.append(index)
+                    continue
+                try:
+                    _es("PUT", f"/{index}/_settings", {"index": {
+                        "refresh_interval": entry.get("refresh_interval"),
+                        "number_of_replicas": entry.get("number_of_replicas")}})  # None = default del cluster
+                    _es("POST", f"/{index}/_refresh")
+                except Exception as e:  # no ocultar el error original de la carga
+                    bus.push(session_id, "warning", f"No se pudo restaurar {index}: {e}")
+                    continue
+                del state[index]
+        if busy:
+            bus.push(session_id, "info", f"Modo bulk-load: {', '.join(busy)} sigue en pausa por otra carga en curso")
+
+    try:
+        with _locked_bulk_state() as state:
+            for index in targets:
+                _es("PUT", f"/_index_template/{index}-template", index_template(index))
+                if not _create_index(index):
+                    bus.push(session_id, "info", f"{index} ya existe: el template aplica solo a índices nuevos")
+                entry = state.get(index)
+                if entry is None:
+                    entry = state[index] = {**_original_settings(index), "loaders": {}}
+                _prune_loaders(entry)[token] = {"host": socket.gethostname(), "pid": os.getpid()}
+                _es("PUT", f"/{index}/_settings", {"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+    except BaseException:
+        release()  # lo que alcanzó a registrarse no queda en pausa para siempre
+        raise
+    bus.push(session_id, "info", f"Modo bulk-load: refresh y réplicas en pausa en {len(targets)} índice(s)")
+    try:
+        yield
+    finally:
+        release()
+        bus.push(session_id, "info", "Modo bulk-load: configuración de índices restaurada")
+
+# === Ingesta delta: solo filas nuevas o cambiadas desde la última ingesta del índice ===
+
+DELTA_CHUNK = 2000  # filas por consulta al almacén de huellas
+
+def _delta_rows(store: FingerprintStore, key: str, rows: Iterator[Tuple[Dict[str, str], int]],
+                unchanged: Dict[str, int]) -> Iterator[Tuple[Dict[str, str], int]]:
+    """Filtra (fila, offset) dejando pasar solo las que el almacén no tiene con el mismo contenido."""
+    keys: Optional[List[str]] = None
+    scope_col: Optional[str] = None
+    buf: List[Tuple[Dict[str, str], int]] = []
+
+    def flush():
+        entries = [(_id_digest([_cell(row.get(k)) for k in keys]),
+                    content_hash(_cell(v) for v in row.values()),
+                    store.scope((row.get(scope_col) or "") if scope_col else "")) for row, _ in buf]
+        send = store.mark(entries)
+        unchanged[key] = unchanged.get(key, 0) + send.count(False)
+        metrics.BULK_DOCS.inc(send.count(False), "unchanged")
+        return [item for item, ok in zip(buf, send) if ok]
+
+    for item in rows:
+        if keys is None:
+            fields = list(item[0])
+            keys = _id_keys(fields, id_columns(key))
+            scope_col = next((f for f in fields if f.strip().lower() == "cliente"), None)
+        buf.append(item)
+        if len(buf) >= DELTA_CHUNK:
+            yield from flush()
+            buf = []
+    if buf:
+        yield from flush()
+
+def bulk_ingest(
+    session_id: str,
+    outputs_dir: str,
+    indices: Dict[str, str],
+    checkpoint_path: Optional[str] = None,
+    doc_ids: bool = False,
+    delta: bool = False,
+    delete_missing: bool = False,
+    scope: Optional[str] = None,
+    source: str = "csv",
+) -> Dict[str, Dict[str, int]]:
+    """
+    Ingresa los CSV de salida con BulkEngine: un productor por archivo (en paralelo)
+    y ES_INGEST_WORKERS emisores compartidos, de modo que hay lotes concurrentes
+    tanto entre índices como dentro de un mismo archivo grande.
+    Con checkpoint_path, reanuda cada archivo desde el último offset confirmado.
+    Con doc_ids, el _id sale de las columnas identidad (reingestar sobrescribe).
+    Con delta, solo se envían filas nuevas o cambiadas según el almacén de huellas
+    del índice (implica doc_ids; el checkpoint no aplica: las huellas se confirman
+    solo si ES aceptó todo, así que una corrida fallida se repite entera sin duplicar).
+    Con delete_missing, además se borran las filas de los clientes presentes (y de
+    `scope`, el cliente por defecto, aunque un bucket quede vacío) que ya no
+    aparecen en la salida.
+    source="parquet" lee las partes de outputs/parquet/<bucket>/ en vez de los CSV.
+    stats[bucket] = {"indexed": n, "failed": m} (acumulado con lo ya confirmado),
+    más "unchanged" / "deleted" en modo delta.
+    """
+    if source == "parquet":
+        require_pyarrow()
+        files = {k: outputs_dir for k in BUCKETS if list_parts(outputs_dir, k)}
+    else:
+        files = {k: p for k in BUCKETS if os.path.exists(p := os.path.join(outputs_dir, f"{k}.csv"))}
+    if delta:
+        present = [indices[k] for k in files]
+        if len(set(present)) != len(present):
+            raise ValueError("La ingesta delta requiere un índice distinto por bucket")
+        checkpoint_path, doc_ids = None, True
+    engine = BulkEngine(session_id, checkpoint_path=checkpoint_path, doc_ids=doc_ids)
+    stores: Dict[str, FingerprintStore] = {}
+    unchanged: Dict[str, int] = {}
+    t0 = time.time()
+
+    def produce(key: str, path: str):
+        try:
+            if source == "parquet":
+                identity = dataset_identity(path, key)
+            else:
+                st = os.stat(path)
+                identity = (st.st_size, st.st_mtime)
+            offset = engine.resume_offset(key, indices[key], identity, source) if checkpoint_path else 0
+            if offset:
+                prev = engine.checkpoint[key]
+                engine.stats[key] = {"indexed": prev.get("indexed", 0), "failed": prev.get("failed", 0)}
+                unit = "fila" if source == "parquet" else "byte"
+                bus.push(session_id, "info", f"Reanudando {key} → {indices[key]} desde {unit} {offset}")
+            else:
+                bus.push(session_id, "info", f"Ingestando {key} → {indices[key]}" + (" (delta)" if delta else ""))
+            rows = rows_from_parquet(path, key, offset) if source == "parquet" else _rows_from_csv(path, offset)
+            if delta:
+                stores[key] = FingerprintStore(indices[key])
+                if scope:
+                    stores[key].scope(scope)
+                rows = _delta_rows(stores[key], key, rows, unchanged)
+            engine.feed(key, indices[key], rows, offset)
+            if delete_missing and key in stores and engine.error is None:
+                engine.delete(key, indices[key], stores[key].stale())
+        except BaseException as e:
+            engine.error = engine.error or e
+
+    producers = []
+    for key in BUCKETS:
+        engine.stats[key] = {"indexed": 0, "failed": 0}
+        if key in files:
+            t = threading.Thread(target=produce, args=(key, files[key]), daemon=True)
+            t.start()
+            producers.append(t)
+    for t in producers:
+        t.join()
+    try:
+        stats = engine.close()
+    except BaseException:
+        for store in stores.values():
+            store.rollback()
+        raise
+    for key, store in stores.items():
+        stats[key]["unchanged"] = unchanged.get(key, 0)
+        if stats[key]["failed"]:
+            store.rollback()  # la próxima corrida reenvía lo que no quedó confirmado
+        else:
+            store.commit(delete_missing)
+        bus.push(session_id, "info",
+                 f"Delta {key}: {stats[key]['indexed']} enviados, {stats[key]['unchanged']} sin cambios"
+                 + (f", {stats[key].get('deleted', 0)} borrados" if delete_missing else ""))
+
+    elapsed = max(time.time() - t0, 1e-6)
+    bus.push(session_id, "info",
+             f"Ingesta: {engine.docs_done} docs, {engine.bytes_sent} bytes en {elapsed:.1f}s "
+             f"({engine.docs_done / elapsed:.0f} docs/s, lote final {engine.sizer.docs})")
+    for key, st in stats.items():
+        if st["failed"]:
+            bus.push(session_id, "warning", f"{key}: {st['failed']} documento(s) fallidos")
     return stats
@@ -0,0 +1,111 @@
+import hashlib, os, re, sqlite3
+from typing import Dict, Iterable, Iterator, List, Tuple
+from .config import settings
+
+# Huellas por índice destino para la ingesta delta:
+#   DATA_DIR/_fingerprints/<índice>.sqlite → (id, hash de contenido, generación, alcance)
+# id = digest del _id determinista; alcance = Cliente de la fila (los borrados de
+# filas desaparecidas se limitan a los clientes presentes en la corrida, porque
+# varios clientes comparten índice). Todo vive en disco: la RAM queda acotada
+# por FINGERPRINT_CACHE_MB (caché de páginas de SQLite), no por la cantidad de filas.
+FINGERPRINTS_DIRNAME = "_fingerprints"
+
+def fingerprints_path(index: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", index)
+    return os.path.join(settings.DATA_DIR, FINGERPRINTS_DIRNAME, f"{safe}.sqlite")
+
+class FingerprintStore:
+    """
+    Una corrida = una transacción (BEGIN IMMEDIATE: dos ingestas delta sobre el
+    mismo índice se serializan). Las filas vistas quedan marcadas con la
+    generación nueva; commit() la confirma solo si ES aceptó todo, y rollback()
+    deja el almacén como estaba para que la próxima corrida reenvíe lo pendiente.
+    """
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS fp ("
+        " id BLOB PRIMARY KEY, h INTEGER NOT NULL, gen INTEGER NOT NULL, scope INTEGER NOT NULL) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS scopes (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER NOT NULL)",
+    )
+
+    def __init__(self, index: str):
+        self.path = fingerprints_path(index)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Sin check_same_thread: el productor marca filas y el hilo principal confirma al final
+        self.db = sqlite3.connect(self.path, timeout=3600, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA cache_size=-{max(1, settings.FINGERPRINT_CACHE_MB) * 1024}")
+        for stmt in self._SCHEMA:
+            self.db.execute(stmt)
+        self.db.execute("BEGIN IMMEDIATE")
+        row = self.db.execute("SELECT v FROM meta WHERE k = 'gen'").fetchone()
+        self.gen = (row[0] if row else 0) + 1
+        self._scopes: Dict[str, int] = dict(self.db.execute("SELECT name, id FROM scopes"))
+        self.seen_scopes = set()
+
+    def scope(self, name: str) -> int:
+        sid = self._scopes.get(name)
+        if sid is None:
+            sid = self.db.execute("INSERT INTO scopes (name) VALUES (?)", (name,)).lastrowid
+            self._scopes[name] = sid
+        self.seen_scopes.add(sid)
+        return sid
+
+    def mark(self, entries: List[Tuple[bytes, int, int]]) -> List[bool]:
+        """
+        Registra (id, hash, alcance) en la generación actual y devuelve, por entrada,
+        si hay que enviarla: nueva o con contenido distinto al de la última ingesta.
+        """
+        known = {}
+        ids = [e[0] for e in entries]
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            known.update(self.db.execute(
+                f"SELECT id, h FROM fp WHERE id IN ({','.join('?' * len(part))})", part))
+        changed, touched, out = [], [], []
+        for id_, h, scope in entries:
+            if known.get(id_) == h:
+                touched.append((self.gen, id_))
+                out.append(False)
+            else:
+                known[id_] = h  # repetida dentro de la corrida: solo se envía la primera vez
+                changed.append((id_, h, self.gen, scope))
+                out.append(True)
+        if changed:
+            self.db.executemany("INSERT OR REPLACE INTO fp (id, h, gen, scope) VALUES (?, ?, ?, ?)", changed)
+        if touched:
+            self.db.executemany("UPDATE fp SET gen = ? WHERE id = ?", touched)
+        return out
+
+    def _stale_where(self) -> Tuple[str, list]:
+        scopes = sorted(self.seen_scopes)
+        return (f"gen < ? AND scope IN ({','.join('?' * len(scopes))})", [self.gen, *scopes])
+
+    def stale(self, chunk: int = 1000) -> Iterator[List[bytes]]:
+        """Ids de filas de los clientes vistos que no aparecieron en esta corrida, en tramos."""
+        if not self.seen_scopes:
+            return
+        where, args = self._stale_where()
+        cur = self.db.execute(f"SELECT id FROM fp WHERE {where}", args)
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            yield [r[0] for r in rows]
+
+    def commit(self, drop_stale: bool) -> None:
+        if drop_stale and self.seen_scopes:
+            where, args = self._stale_where()
+            self.db.execute(f"DELETE FROM fp WHERE {where}", args)
+        self.db.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('gen', ?)", (self.gen,))
+        self.db.execute("COMMIT")
+        self.db.close()
+
+    def rollback(self) -> None:
+        self.db.execute("ROLLBACK")
+        self.db.close()
+
+def content_hash(values: Iterable[str]) -> int:
+    digest = hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
@@ -1,16 +1,32 @@
-from fastapi import FastAPI, HTTPException, Request, Response, status, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, Request, Response, status, Query
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi import status
-import os, uuid, re, shutil, json
+import os, uuid, re, shutil, json, hashlib, time
+from contextlib import contextmanager
+from typing import Dict, List
 from .models import SessionCreate, SessionInfo, UploadInit, ProcessRequest, EsIngestRequest
 from .config import settings
-from .storage import new_session_dir, session_paths, sanitize_filename, open_chunk_file
-from .parser import parse_report_file
-from .elastic import bulk_ingest
+from .storage import (new_session_dir, session_paths, sanitize_filename, open_chunk_file, pwrite_all,
+                      init_upload_state, load_upload_state, record_chunk, missing_ranges, advance_upload_hash,
+                      finish_upload_hash,
+                      file_identity, load_processed, save_processed)
+from .cache import parse_report_cached, save_content_id
+from .parser import BUCKETS
+from .parallel import parse_reports_parallel
+from .elastic import bulk_ingest, bulk_load_mode, StreamIngest
 from .progress import bus
-from fastapi import BackgroundTasks
+from .downloads import (GZ_CACHE_DIRNAME, OUTPUT_NAMES, file_response, list_outputs, output_file_response,
+                        results_zip_response)
+from .preview import parse_filters, read_page
+from .columnar import INGEST_SOURCES, list_parts, parquet_dir, remove_parts
+from .summary import load_summary, remove_report_summaries
+from .dedup import dedup_signature, remove_dedup_state
+from .scheduler import JobCancelled, clear_cancel, scheduler
+from . import metrics
+from .profiling import PROFILE_FILES, profile_job, profile_summary, resolve_mode, stage
 
 app = FastAPI(title="Qualys CSV Processor")
 
@@ -43,6 +59,7 @@ def upload_init(req: UploadInit):
     upload_id = uuid.uuid4().hex
     tmp_path = os.path.join(s["uploads"], f"{upload_id}__{sanitize_filename(req.filename)}.part")
     open_chunk_file(tmp_path, req.total_size)
+    init_upload_state(s["upload_state"], upload_id, req.filename, req.total_size)
     bus.push(req.session_id, "info", f"Inicio de upload: {req.filename} ({req.total_size} bytes)")
     return {"upload_id": upload_id}
 
@@ -50,8 +67,6 @@ def upload_init(req: UploadInit):
 async def upload_chunk(request: Request, session_id: str, upload_id: str, filename: str, total_size: int):
     s = session_paths(session_id)
     tmp_path = os.path.join(s["uploads"], f"{upload_id}__{sanitize_filename(filename)}.part")
-    if not os.path.exists(tmp_path):
-        open_chunk_file(tmp_path, total_size)
 
     # Content-Range: bytes start-end/total
     cr = request.headers.get("Content-Range")
@@ -61,15 +76,75 @@ async def upload_chunk(request: Request, session_id: str, upload_id: str, filena
     if not m: raise HTTPException(400, "Bad Content-Range")
     start, end, total = map(int, m.groups())
     if total != int(total_size): raise HTTPException(400, "total_size mismatch")
+    if start > end or end >= total: raise HTTPException(416, "Range fuera del archivo")
+    expected = end - start + 1
+
+    t0 = time.perf_counter()
+    if not os.path.exists(tmp_path):
+        await run_in_threadpool(open_chunk_file, tmp_path, total_size)
 
-    body = await request.body()
-    if len(body) != (end - start + 1):
-        raise HTTPException(400, "Chunk length mismatch")
+    # SHA-256 del chunk calculado mientras se escribe: verifica X-Chunk-SHA256 (opcional)
+    want_sha = (request.headers.get("X-Chunk-SHA256") or "").strip().lower() or None
+    hasher = hashlib.sha256()
 
-    with open(tmp_path, "r+b") as f:
-        f.seek(start)
-        f.write(body)
-    return {"ok": True, "received": len(body)}
+    def write_block(fd: int, data: bytes, offset: int):
+        hasher.update(data)
+        pwrite_all(fd, data, offset)
+
+    # Stream directo al .part: escrituras posicionales (pwrite) fuera del event loop,
+    # en bloques de UPLOAD_WRITE_BUFFER; nunca se retiene el chunk completo en memoria.
+    fd = await run_in_threadpool(os.open, tmp_path, os.O_WRONLY)
+    try:
+        received = 0
+        buf = bytearray()
+        async for piece in request.stream():
+            received += len(piece)
+            if received > expected:
+                raise HTTPException(400, "Chunk length mismatch")
+            buf += piece
+            if len(buf) >= settings.UPLOAD_WRITE_BUFFER:
+                await run_in_threadpool(write_block, fd, bytes(buf), start + received - len(buf))
+                buf.clear()
+        if buf:
+            await run_in_threadpool(write_block, fd, bytes(buf), start + received - len(buf))
+        if received != expected:
+            raise HTTPException(400, "Chunk length mismatch")
+    finally:
+        os.close(fd)
+
+    digest = hasher.hexdigest()
+    if want_sha and digest != want_sha:
+        metrics.UPLOAD_CHUNKS.inc(1, "checksum_mismatch")
+        raise HTTPException(422, "Checksum del chunk no coincide; reenviar")
+    st = await run_in_threadpool(record_chunk, s["upload_state"], upload_id, start, end, digest,
+                                 filename, int(total_size))
+    # Identidad de contenido (caché de parseo) calculada durante la subida, no al completarla
+    await run_in_threadpool(advance_upload_hash, tmp_path, st["ranges"])
+    metrics.UPLOAD_CHUNKS.inc(1, "ok")
+    metrics.UPLOAD_BYTES.inc(received)
+    metrics.UPLOAD_CHUNK_SECONDS.observe(time.perf_counter() - t0)
+    return {"ok": True, "received": received}
+
+@app.get("/upload/status")
+def upload_status(session_id: str, upload_id: str):
+    """Rangos recibidos y faltantes de un upload (para reanudar solo los huecos)."""
+    s = session_paths(session_id)
+    st = load_upload_state(s["upload_state"], upload_id)
+    if st is None:
+        raise HTTPException(404, "Upload not found")
+    if "filename" not in st or "total_size" not in st:
+        raise HTTPException(409, "Estado de upload incompleto (sin filename / total_size)")
+    tmp = os.path.join(s["uploads"], f"{upload_id}__{sanitize_filename(st['filename'])}.part")
+    ranges = st.get("ranges", [])
+    return {
+        "upload_id": upload_id,
+        "filename": st["filename"],
+        "total_size": st["total_size"],
+        "received_bytes": sum(b - a + 1 for a, b in ranges),
+        "ranges": ranges,
+        "missing": missing_ranges(ranges, st["total_size"]),
+        "completed": not os.path.exists(tmp),
+    }
 
 @app.post("/upload/complete")
 def upload_complete(session_id: str, upload_id: str, filename: str):
@@ -78,78 +153,326 @@ def upload_complete(session_id: str, upload_id: str, filename: str):
     final = os.path.join(s["uploads"], sanitize_filename(filename))
     if not os.path.exists(tmp):
         raise HTTPException(404, "Temp file not found")
+    # Sin estado no hay forma de saber qué rangos llegaron: no se da por completo
+    st = load_upload_state(s["upload_state"], upload_id)
+    if st is None:
+        raise HTTPException(404, "Upload not found")
+    if "total_size" not in st:
+        raise HTTPException(409, "Estado de upload incompleto (sin total_size)")
+    missing = missing_ranges(st.get("ranges", []), st["total_size"])
+    if missing:
+        raise HTTPException(409, {"message": "Upload incompleto", "missing": missing[:100]})
+    digest = finish_upload_hash(tmp, st["total_size"])
     os.replace(tmp, final)
+    # SHA-256 del archivo completo (el mismo que calcula content_id); sin él, se calcula en el trabajo
+    if digest and not st.get("rewritten"):
+        save_content_id(s["index"], final, digest)
     bus.push(session_id, "info", f"Upload completado: {filename}")
     return {"ok": True, "path": final}
 
 # --- Procesamiento ---
+@contextmanager
+def _release_claim_on_error(session_id: str):
+    """Tras bus.claim(): si preparar o encolar el trabajo falla, la sesión no queda 'queued' para siempre."""
+    try:
+        yield
+    except BaseException as e:
+        bus.push(session_id, "error", f"No se pudo encolar el trabajo: {e}")
+        bus.status(session_id, "error")
+        raise
+
+def _output_sizes(outputs_dir: str) -> Dict[str, int]:
+    sizes = {}
+    for k in BUCKETS:
+        p = os.path.join(outputs_dir, f"{k}.csv")
+        if os.path.exists(p):
+            sizes[k] = os.path.getsize(p)
+    return sizes
+
+def _plan_incremental(s: Dict[str, str], uploads: List[str], write_csv: bool, rebuild: bool):
+    """
+    Decide qué uploads faltan por procesar según processed.json.
+    Devuelve (pendientes, manifiesto, motivo de reconstrucción completa o None).
+    Un archivo ya procesado que cambió o desapareció obliga a reconstruir: sus
+    filas ya están en outputs y no se pueden quitar por separado.
+    """
+    manifest = load_processed(s["processed"])
+    by_name = {os.path.basename(p): p for p in uploads}
+    reason = "solicitada" if rebuild else None
+    for name, entry in manifest["files"].items():
+        if reason:
+            break
+        if name not in by_name:
+            reason = f"{name} ya no está en uploads"
+        elif file_identity(by_name[name]) != {"size": entry["size"], "mtime": entry["mtime"]}:
+            reason = f"{name} cambió desde el último procesamiento"
+    if not reason and write_csv and settings.OUTPUT_PARQUET and \
+            any(e["csv"] and not e.get("parquet") for e in manifest["files"].values()):
+        reason = "salida Parquet activada: faltan partes de archivos ya procesados"
+    if not reason and write_csv and \
+            any(e["csv"] and e.get("dedup", "") != dedup_signature() for e in manifest["files"].values()):
+        reason = "cambió la configuración de de-duplicación"
+    if not reason:
+        sizes = _output_sizes(s["outputs"])
+        if any(sizes.get(k, 0) < n for k, n in manifest["outputs"].items()):
+            reason = "outputs no coinciden con el manifiesto"
+    if reason:
+        return uploads, {"files": {}, "outputs": {}}, reason
+    done = manifest["files"]
+    pending = [p for p in uploads
+               if os.path.basename(p) not in done or (write_csv and not done[os.path.basename(p)]["csv"])]
+    return pending, manifest, None
+
+def _rollback_outputs(s: Dict[str, str], manifest: Dict):
+    """
+    Deja outputs exactamente como tras el último archivo registrado: trunca las
+    filas de una corrida interrumpida (o todo, si el manifiesto está vacío),
+    y las partes Parquet / agregados / claves de de-duplicación de reportes no registrados.
+    """
+    for k in BUCKETS:
+        p = os.path.join(s["outputs"], f"{k}.csv")
+        if os.path.exists(p) and os.path.getsize(p) > manifest["outputs"].get(k, 0):
+            os.truncate(p, manifest["outputs"].get(k, 0))
+    if not manifest["files"]:
+        shutil.rmtree(os.path.join(s["outputs"], GZ_CACHE_DIRNAME), ignore_errors=True)
+    # Partes Parquet: sobreviven solo las de reportes registrados (las de una corrida cortada se descartan)
+    remove_parts(s["outputs"], set(manifest["files"]) or None)
+    remove_report_summaries(s["outputs"], set(manifest["files"]) or None)
+    remove_dedup_state(s["outputs"], set(manifest["files"]) or None)
+    save_processed(s["processed"], manifest)
+
+def _session_meta(s: Dict[str, str]) -> Dict:
+    with open(s["meta"], "r", encoding="utf-8") as f:
+        return json.loads(f.read() or "{}")
+
 @app.post("/process")
-def start_processing(req: ProcessRequest, bg: BackgroundTasks):
+def start_processing(req: ProcessRequest):
     s = session_paths(req.session_id)
     if not os.path.exists(s["base"]):
         raise HTTPException(404, "Session not found")
 
-    # 🔒 evita doble inicio si ya corre
-    if bus.get_status(req.session_id) == "running":
-        bus.push(req.session_id, "info", "Procesamiento ya en ejecución; ignorado nuevo inicio")
-        return {"ok": True, "already_running": True}
-
-    uploads = [os.path.join(s["uploads"], f) for f in os.listdir(s["uploads"]) if not f.endswith(".part")]
+    uploads = [os.path.join(s["uploads"], f) for f in sorted(os.listdir(s["uploads"])) if not f.endswith(".part")]
     if not uploads:
         raise HTTPException(400, "No hay archivos subidos")
 
-    with open(s["meta"], "r", encoding="utf-8") as f:
-        meta = json.loads(f.read() or "{}")
-    cliente_default = meta.get("subcliente_por_defecto") or meta.get("cliente_por_defecto") or "DEFAULT"
+    try:
+        profile_mode = resolve_mode(req.profile)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    # 🔒 evita doble inicio si ya corre o está en cola (check-and-set atómico, también entre workers)
+    if not bus.claim(req.session_id, "queued"):
+        bus.push(req.session_id, "info", "Procesamiento ya en cola o en ejecución; ignorado nuevo inicio")
+        return {"ok": True, "already_running": True}
+    with _release_claim_on_error(req.session_id):
+        clear_cancel(req.session_id)  # marca obsoleta de un trabajo anterior
+        meta = _session_meta(s)
+        cliente_default = meta.get("subcliente_por_defecto") or meta.get("cliente_por_defecto") or "DEFAULT"
+        parallel = settings.PARALLEL_PROCESSING if req.parallel is None else req.parallel
+        parallel = parallel and settings.MAX_CONCURRENCY > 1 and req.ingest is None
+        write_csv = req.write_csv or req.ingest is None
+        pending, manifest, rebuild_reason = _plan_incremental(s, uploads, write_csv, req.rebuild)
+
+    def record(p: str, counts: Dict[str, int]):
+        manifest["files"][os.path.basename(p)] = {**file_identity(p), "csv": write_csv, "counts": counts,
+                                                  "parquet": write_csv and settings.OUTPUT_PARQUET,
+                                                  "dedup": dedup_signature() if write_csv else ""}
+        manifest["outputs"] = _output_sizes(s["outputs"])
+        save_processed(s["processed"], manifest)
 
     def work():
         try:
-            bus.status(req.session_id, "running")
-            bus.push(req.session_id, "info", f"Comenzando procesamiento de {len(uploads)} archivo(s)")
-            for p in uploads:
-                bus.push(req.session_id, "info", f"Abriendo {os.path.basename(p)}")
-                parse_report_file(p, s["outputs"], cliente_default, req.session_id)
-                bus.push(req.session_id, "success", f"Finalizado {os.path.basename(p)}")
+            with profile_job(req.session_id, s["profile"], profile_mode):
+                if rebuild_reason:
+                    bus.push(req.session_id, "info", f"Reconstrucción completa: {rebuild_reason}")
+                _rollback_outputs(s, manifest)
+                skipped = len(uploads) - len(pending)
+                if not pending:
+                    bus.push(req.session_id, "success", f"Sin archivos nuevos ({skipped} ya procesado(s)); salida al día")
+                    bus.status(req.session_id, "done")
+                    return
+                bus.push(req.session_id, "info", f"Comenzando procesamiento de {len(pending)} archivo(s)"
+                         + (f"; {skipped} ya procesado(s)" if skipped else ""))
+                if req.ingest is not None:
+                    # Parse→ES fusionado: las filas van del parser a los emisores _bulk
+                    bus.push(req.session_id, "info", "Modo parse→ES directo" + ("" if write_csv else " (sin CSV)"))
+                    indices, bulk_load = req.ingest.by_bucket(), req.ingest.use_bulk_load()
+                    with bulk_load_mode(req.session_id, indices, bulk_load):
+                        stream = StreamIngest(req.session_id, indices, doc_ids=bulk_load)
+                        try:
+                            for p in pending:
+                                bus.push(req.session_id, "info", f"Abriendo {os.path.basename(p)}")
+                                record(p, parse_report_cached(p, s["outputs"], cliente_default, req.session_id,
+                                                              s["index"], sink=stream, write_csv=write_csv))
+                                bus.push(req.session_id, "success", f"Finalizado {os.path.basename(p)}")
+                        finally:
+                            stats = stream.close()
+                    bus.push(req.session_id, "success", f"Ingesta finalizada: {stats}")
+                elif parallel:
+                    bus.push(req.session_id, "info", f"Modo paralelo: hasta {settings.MAX_CONCURRENCY} proceso(s)")
+                    parse_reports_parallel(pending, s["outputs"], cliente_default, req.session_id,
+                                           index_dir=s["index"], on_file=record)
+                else:
+                    for p in pending:
+                        bus.push(req.session_id, "info", f"Abriendo {os.path.basename(p)}")
+                        record(p, parse_report_cached(p, s["outputs"], cliente_default, req.session_id, s["index"]))
+                        bus.push(req.session_id, "success", f"Finalizado {os.path.basename(p)}")
+            # Fuera del perfilado: "done" llega cuando el perfil ya está guardado
             bus.push(req.session_id, "success", "Procesamiento completado")
             bus.status(req.session_id, "done")
+        except JobCancelled:
+            # processed.json solo registra archivos completos: el próximo /process retoma desde ahí
+            bus.push(req.session_id, "warning", "Procesamiento cancelado; los archivos terminados se conservan")
+            bus.status(req.session_id, "cancelled")
         except Exception as e:
             bus.push(req.session_id, "error", f"Fallo en procesamiento: {e}")
             bus.status(req.session_id, "error")
 
-    bg.add_task(work)
-    return {"ok": True}
+    with _release_claim_on_error(req.session_id):
+        position = scheduler.submit(req.session_id, meta.get("cliente_por_defecto") or "DEFAULT", "procesamiento",
+                                    work, req.priority)
+    return {"ok": True, "pending": len(pending), "skipped": len(uploads) - len(pending),
+            "rebuild": bool(rebuild_reason), "queue_position": position}
 
 # --- Progreso (SSE) ---
 @app.get("/sessions/{session_id}/events")
-def stream_events(session_id: str, from_: int | None = Query(default=None, alias="from")):
+async def stream_events(session_id: str, from_: int | None = Query(default=None, alias="from")):
     # Si el cliente pasa ?from=42, empezamos en 43
     start_from = (from_ + 1) if (from_ is not None and from_ >= 0) else 0
     return StreamingResponse(bus.stream(session_id, start_from=start_from), media_type="text/event-stream")
 
 # --- Descarga de resultados ---
-@app.get("/sessions/{session_id}/results.zip")
-def download_results(session_id: str):
-    import zipfile, tempfile
+@app.api_route("/sessions/{session_id}/results.zip", methods=["GET", "HEAD"])
+def download_results(session_id: str, request: Request):
+    s = session_paths(session_id)
+    return results_zip_response(request, s["outputs"], s["results_zip"])
+
+@app.get("/sessions/{session_id}/outputs")
+def list_results(session_id: str):
     s = session_paths(session_id)
-    zpath = os.path.join(s["base"], "results.zip")
-    with zipfile.ZipFile(zpath, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        outdir = s["outputs"]
-        for name in ("t1_normal.csv","t1_ajustada.csv","t2_normal.csv","t2_ajustada.csv"):
-            p = os.path.join(outdir, name)
-            if os.path.exists(p):
-                z.write(p, arcname=name)
-    return FileResponse(zpath, filename="results.zip")
+    return {"files": [{"name": name, "size": os.path.getsize(p)} for name, p in list_outputs(s["outputs"])],
+            "parquet": [{"name": f"{k}/{os.path.basename(p)}", "size": os.path.getsize(p)}
+                        for k in BUCKETS for p in list_parts(s["outputs"], k)]}
+
+@app.api_route("/sessions/{session_id}/outputs/{name}", methods=["GET", "HEAD"])
+def download_output(session_id: str, name: str, request: Request):
+    return output_file_response(request, session_paths(session_id)["outputs"], name)
+
+@app.api_route("/sessions/{session_id}/parquet/{bucket}/{part}", methods=["GET", "HEAD"])
+def download_parquet(session_id: str, bucket: str, part: str, request: Request):
+    outputs = session_paths(session_id)["outputs"]
+    path = os.path.join(parquet_dir(outputs, bucket), part)
+    if bucket not in BUCKETS or path not in list_parts(outputs, bucket):
+        raise HTTPException(404, "Parte no encontrada")
+    return file_response(request, path, "application/vnd.apache.parquet", part)
+
+@app.get("/sessions/{session_id}/outputs/{name}/rows")
+def preview_output(session_id: str, name: str, offset: int = Query(default=0, ge=0),
+                   limit: int = Query(default=100, ge=1), columns: str | None = None,
+                   filter_: List[str] = Query(default=[], alias="filter")):
+    """Página de un CSV de salida: ?offset=&limit=&columns=A,B&filter=Columna=valor (repetible)."""
+    path = os.path.join(session_paths(session_id)["outputs"], name)
+    if name not in OUTPUT_NAMES or not os.path.exists(path):
+        raise HTTPException(404, "Archivo no encontrado")
+    try:
+        cols = [c for c in columns.split(",") if c.strip()] if columns else None
+        page = read_page(path, offset, limit, cols, parse_filters(filter_))
+    except (KeyError, ValueError) as e:
+        raise HTTPException(400, str(e).strip("'\""))
+    return {"name": name, **page}
+
+# --- Agregados (T1 por control, T2 por host / sistema operativo) ---
+@app.get("/sessions/{session_id}/summary")
+def get_summary(session_id: str, bucket: str | None = None, limit: int | None = Query(default=None, ge=1)):
+    """outputs/summary.json; ?bucket= filtra y ?limit=N deja los N controles / hosts / sistemas principales."""
+    if bucket is not None and bucket not in BUCKETS:
+        raise HTTPException(400, f"bucket inválido: {bucket}")
+    data = load_summary(session_paths(session_id)["outputs"], bucket, limit)
+    if data is None:
+        raise HTTPException(404, "Sin agregados (la sesión no se ha procesado)")
+    return data
+
+# --- Perfiles de trabajos (profile=cprofile|sample en /process o ingesta) ---
+@app.get("/sessions/{session_id}/profile")
+def list_profiles(session_id: str):
+    d = session_paths(session_id)["profile"]
+    files = [n for n in PROFILE_FILES if os.path.exists(os.path.join(d, n))]
+    return {"files": [{"name": n, "size": os.path.getsize(os.path.join(d, n)),
+                       "top": profile_summary(os.path.join(d, n))} for n in files]}
+
+@app.api_route("/sessions/{session_id}/profile/{name}", methods=["GET", "HEAD"])
+def download_profile(session_id: str, name: str, request: Request):
+    path = os.path.join(session_paths(session_id)["profile"], name)
+    if name not in PROFILE_FILES or not os.path.exists(path):
+        raise HTTPException(404, "Sin perfil")
+    media = "text/plain" if name.endswith(".collapsed") else "application/octet-stream"
+    return file_response(request, path, media, name)
 
 # --- Ingesta a Elasticsearch ---
 @app.post("/sessions/{session_id}/ingest")
 def ingest_es(session_id: str, req: EsIngestRequest):
     s = session_paths(session_id)
-    indices = {
-        "t1_normal": req.t1_normal_index,
-        "t1_ajustada": req.t1_ajustada_index,
-        "t2_normal": req.t2_normal_index,
-        "t2_ajustada": req.t2_ajustada_index,
-    }
-    stats = bulk_ingest(session_id, s["outputs"], indices)
-    bus.push(session_id, "success", f"Ingesta finalizada: {stats}")
-    return {"ok": True, "stats": stats}
+    if not os.path.exists(s["base"]):
+        raise HTTPException(404, "Session not found")
+
+    try:
+        profile_mode = resolve_mode(req.profile)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    source = req.source or settings.INGEST_SOURCE
+    if source not in INGEST_SOURCES:
+        raise HTTPException(400, f"source inválido: {source} (usa {' | '.join(INGEST_SOURCES)})")
+
+    # 🔒 una sola tarea (proceso o ingesta) por sesión
+    if not bus.claim(session_id, "queued"):
+        bus.push(session_id, "info", "Tarea ya en cola o en ejecución; ignorada nueva ingesta")
+        return {"ok": True, "already_running": True}
+    with _release_claim_on_error(session_id):
+        clear_cancel(session_id)
+        if not req.resume and os.path.exists(s["ingest_checkpoint"]):
+            os.remove(s["ingest_checkpoint"])
+
+    def work():
+        try:
+            indices, bulk_load = req.by_bucket(), req.use_bulk_load()
+            with profile_job(session_id, s["profile"], profile_mode), stage(session_id, "ingesta"), \
+                    bulk_load_mode(session_id, indices, bulk_load):
+                stats = bulk_ingest(session_id, s["outputs"], indices,
+                                    checkpoint_path=s["ingest_checkpoint"], doc_ids=bulk_load,
+                                    delta=settings.ES_DELTA if req.delta is None else req.delta,
+                                    scope=_session_meta(s).get("cliente_por_defecto"), source=source,
+                                    delete_missing=(settings.ES_DELTA_DELETES if req.delete_missing is None
+                                                    else req.delete_missing))
+            bus.push(session_id, "success", f"Ingesta finalizada: {stats}")
+            bus.status(session_id, "done")
+        except JobCancelled:
+            bus.push(session_id, "warning", "Ingesta cancelada (reanudable desde el último lote confirmado)")
+            bus.status(session_id, "cancelled")
+        except Exception as e:
+            bus.push(session_id, "error", f"Fallo en ingesta (reanudable): {e}")
+            bus.status(session_id, "error")
+
+    with _release_claim_on_error(session_id):
+        position = scheduler.submit(session_id, _session_meta(s).get("cliente_por_defecto") or "DEFAULT", "ingesta",
+                                    work, req.priority)
+    return {"ok": True, "queue_position": position}
+
+# --- Cola de trabajos ---
+@app.post("/sessions/{session_id}/cancel")
+def cancel_job(session_id: str):
+    if not os.path.exists(session_paths(session_id)["base"]):
+        raise HTTPException(404, "Session not found")
+    state = scheduler.cancel(session_id)
+    if state is None:
+        raise HTTPException(409, "No hay trabajo en cola ni en ejecución")
+    return {"ok": True, "cancelled": state}
+
+@app.get("/jobs")
+def list_jobs():
+    return scheduler.snapshot()
+
+# --- Métricas (Prometheus) ---
+@app.get("/metrics")
+def prometheus_metrics():
+    # Por proceso: con varios workers de uvicorn, cada uno expone las suyas
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
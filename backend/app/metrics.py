@@ -0,0 +1,210 @@
+import bisect, threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Métricas en formato de exposición de Prometheus (texto 0.0.4), sin dependencias.
+# Se instrumenta por tabla, lote o chunk (nunca por fila) para que el costo sea
+# despreciable y pueda quedar activo en producción.
+#
+# Los procesos del pool de parseo tienen su propio registro: parallel.py drena
+# sus deltas (drain) al terminar cada tarea y los suma al del proceso principal (merge).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 4e6, 16e6, 64e6, 256e6, 1e9)
+
+LabelKey = Tuple[str, ...]
+
+def _fmt_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, object] = {}
+        if not labels and self.kind in ("counter", "gauge"):
+            self._values[()] = 0  # sin etiquetas: se expone desde el arranque
+
+    def _key(self, labels: Iterable[str]) -> LabelKey:
+        key = tuple(labels)
+        if len(key) != len(self.labels):
+            raise ValueError(f"{self.name}: se esperaban etiquetas {self.labels}")
+        return key
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in items]
+
+    def drain(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            out, self._values = self._values, {}
+        return out
+
+    def merge(self, delta: Dict[LabelKey, float]) -> None:
+        with self._lock:
+            for k, v in delta.items():
+                self._values[k] = self._values.get(k, 0) + v
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, *labels: str) -> None:
+        self.inc(-amount, *labels)
+
+    samples = Counter.samples
+
+    def drain(self) -> Dict[LabelKey, float]:
+        return {}  # los gauges describen el proceso local: no se suman entre procesos
+
+    def merge(self, delta: Dict[LabelKey, float]) -> None:
+        pass
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            st = self._values.get(key)
+            if st is None:
+                st = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            st[0][i] += 1
+            st[1] += value
+            st[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        out = []
+        for key, (counts, total, n) in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="%s"' % _fmt_num(bound)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}")
+        return out
+
+    def drain(self) -> Dict[LabelKey, list]:
+        with self._lock:
+            out, self._values = self._values, {}
+        return out
+
+    def merge(self, delta: Dict[LabelKey, list]) -> None:
+        with self._lock:
+            for k, (counts, total, n) in delta.items():
+                st = self._values.get(k)
+                if st is None:
+                    self._values[k] = [list(counts), total, n]
+                    continue
+                st[0] = [a + b for a, b in zip(st[0], counts)]
+                st[1] += total
+                st[2] += n
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_, labels))
+
+    def gauge(self, name: str, help_: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_, labels))
+
+    def histogram(self, name: str, help_: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics.values():
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> Dict[str, Dict]:
+        """Deltas acumulados desde el último drain (se reinician): de un worker hacia el principal."""
+        return {name: d for name, m in self._metrics.items() if (d := m.drain())}
+
+    def merge(self, deltas: Optional[Dict[str, Dict]]) -> None:
+        for name, d in (deltas or {}).items():
+            m = self._metrics.get(name)
+            if m is not None:
+                m.merge(d)
+
+REGISTRY = Registry()
+_P = "qualys_"
+
+# --- Uploads ---
+UPLOAD_CHUNKS = REGISTRY.counter(f"{_P}upload_chunks_total", "Chunks recibidos por resultado", ("result",))
+UPLOAD_BYTES = REGISTRY.counter(f"{_P}upload_bytes_total", "Bytes escritos por /upload/chunk")
+UPLOAD_CHUNK_SECONDS = REGISTRY.histogram(f"{_P}upload_chunk_seconds", "Duración de recepción+escritura de un chunk")
+
+# --- Parseo ---
+PARSE_ROWS = REGISTRY.counter(f"{_P}parse_rows_total", "Filas parseadas por bucket", ("bucket",))
+PARSE_BYTES = REGISTRY.counter(f"{_P}parse_bytes_total", "Bytes de tabla parseados por bucket", ("bucket",))
+PARSE_SECTIONS = REGISTRY.counter(f"{_P}parse_sections_total", "Tablas (secciones) parseadas por bucket", ("bucket",))
+PARSE_SECTION_SECONDS = REGISTRY.histogram(f"{_P}parse_section_seconds", "Duración de parseo por tabla", ("bucket",))
+PARSE_SECTION_BYTES = REGISTRY.histogram(f"{_P}parse_section_bytes", "Tamaño de tabla parseada", ("bucket",),
+                                         SIZE_BUCKETS)
+PARSE_REPORT_SECONDS = REGISTRY.histogram(f"{_P}parse_report_seconds", "Duración por reporte", ("mode",))
+PARSE_CACHE = REGISTRY.counter(f"{_P}parse_cache_total", "Consultas a la caché de parseo", ("result",))
+ASSEMBLE_ROWS = REGISTRY.counter(f"{_P}assemble_rows_total", "Filas agregadas a outputs por bucket", ("bucket",))
+
+# --- Elasticsearch _bulk ---
+BULK_REQUESTS = REGISTRY.counter(f"{_P}es_bulk_requests_total", "Requests _bulk por resultado HTTP", ("result",))
+BULK_SECONDS = REGISTRY.histogram(f"{_P}es_bulk_request_seconds", "Latencia de un request _bulk")
+BULK_BYTES = REGISTRY.counter(f"{_P}es_bulk_bytes_total", "Bytes enviados a _bulk")
+BULK_DOCS = REGISTRY.counter(f"{_P}es_bulk_docs_total", "Documentos por resultado final", ("result",))
+BULK_RETRIES = REGISTRY.counter(f"{_P}es_bulk_retries_total", "Documentos reenviados por rechazo de carga")
+
+# --- Progreso / cola ---
+SSE_SUBSCRIBERS = REGISTRY.gauge(f"{_P}sse_subscribers", "Suscriptores SSE conectados")
+JOBS_QUEUED = REGISTRY.gauge(f"{_P}jobs_queued", "Trabajos en cola")
+JOBS_RUNNING = REGISTRY.gauge(f"{_P}jobs_running", "Trabajos en ejecución")
+JOBS = REGISTRY.counter(f"{_P}jobs_total", "Trabajos terminados por tipo y estado final", ("kind", "status"))
+JOB_WAIT_SECONDS = REGISTRY.histogram(f"{_P}job_wait_seconds", "Espera en cola antes de iniciar", ("kind",))
+JOB_SECONDS = REGISTRY.histogram(f"{_P}job_seconds", "Duración de ejecución por tipo", ("kind",))
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
+from .config import settings
 
 class SessionCreate(BaseModel):
     cliente_por_defecto: str
@@ -14,12 +15,38 @@ class UploadInit(BaseModel):
     filename: str
     total_size: int
 
-class ProcessRequest(BaseModel):
-    session_id: str
-
-class EsIngestRequest(BaseModel):
-    session_id: str
+class EsIndices(BaseModel):
     t1_normal_index: str = Field(default="qualys_t1_normal")
     t1_ajustada_index: str = Field(default="qualys_t1_ajustada")
     t2_normal_index: str = Field(default="qualys_t2_normal")
     t2_ajustada_index: str = Field(default="qualys_t2_ajustada")
+    bulk_load: Optional[bool] = None  # None → ES_BULK_LOAD
+
+    def use_bulk_load(self) -> bool:
+        return settings.ES_BULK_LOAD if self.bulk_load is None else self.bulk_load
+
+    def by_bucket(self) -> Dict[str, str]:
+        return {
+            "t1_normal": self.t1_normal_index,
+            "t1_ajustada": self.t1_ajustada_index,
+            "t2_normal": self.t2_normal_index,
+            "t2_ajustada": self.t2_ajustada_index,
+        }
+
+class ProcessRequest(BaseModel):
+    session_id: str
+    parallel: Optional[bool] = None     # None → usa PARALLEL_PROCESSING
+    ingest: Optional[EsIndices] = None  # si viene: parse→ES directo, sin releer CSV
+    write_csv: bool = True              # en modo ingest, permite omitir los CSV de outputs
+    rebuild: bool = False               # True → descarta outputs y reprocesa todo (si no, solo archivos nuevos)
+    priority: int = 0                   # mayor = antes en la cola global
+    profile: Optional[str] = None       # cprofile | sample | off; None → PROFILE_MODE
+
+class EsIngestRequest(EsIndices):
+    session_id: str
+    resume: bool = True  # reanuda desde el checkpoint si los archivos no cambiaron
+    priority: int = 0    # mayor = antes en la cola global
+    profile: Optional[str] = None  # cprofile | sample | off; None → PROFILE_MODE
+    delta: Optional[bool] = None   # solo filas nuevas/cambiadas; None → ES_DELTA
+    delete_missing: Optional[bool] = None  # en delta, borra filas desaparecidas; None → ES_DELTA_DELETES
+    source: Optional[str] = None  # csv | parquet; None → INGEST_SOURCE
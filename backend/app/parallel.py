@@ -0,0 +1,214 @@
+import os, shutil, threading, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+from .config import settings
+from .cache import assemble_report, build_entry, content_id, load_entry, make_manifest, new_build_dir, publish
+from .parser import (BUCKETS, detect_compression, load_section_index, parse_report_to_sections,
+                     report_metadata, section_index_path)
+from .progress import bus
+from . import metrics
+from .profiling import active_profile, stage, worker_profile
+from .scheduler import check_cancelled
+
+# Directorio (dentro de outputs/) para las secciones parseadas cuando no se usa la caché
+SHARDS_DIRNAME = ".shards"
+# Tamaño mínimo (bytes de tabla) por tarea al repartir secciones
+SECTION_TASK_MIN_BYTES = int(os.getenv("SECTION_TASK_MIN_BYTES", str(16 * 1024 * 1024)))
+
+def _init_worker(queue):
+    # Cada proceso worker reenvía sus eventos al bus del proceso principal
+    bus.forward_to(queue)
+
+def _prepare_file(filepath: str, index_dir: Optional[str], use_cache: bool) -> Dict:
+    """Hash de contenido (con caché) e índice de secciones (solo si hay que parsear y no está comprimido)."""
+    info = {"compression": detect_compression(filepath), "digest": None, "cached": False, "idx": None}
+    if use_cache:
+        info["digest"] = content_id(index_dir, filepath)
+        info["cached"] = load_entry(info["digest"]) is not None
+    if not info["cached"] and not info["compression"]:
+        info["idx"] = load_section_index(filepath, section_index_path(index_dir, filepath) if index_dir else None)
+    return info
+
+def _parse_group(
+    filepath: str,
+    idx: Optional[Dict],
+    section_ids: Optional[List[int]],
+    build_dir: str,
+    prefix: str,
+    session_id: str,
+    consumed_to: int = -1,
+    compression: Optional[str] = None,
+) -> Tuple[List[Dict], Dict[int, int]]:
+    return parse_report_to_sections(filepath, build_dir, session_id, idx, section_ids,
+                                    consumed_to=consumed_to, prefix=prefix, compression=compression)
+
+def _parse_group_task(profile: Optional[Tuple[str, str]], part: str,
+                      *args) -> Tuple[Tuple[List[Dict], Dict[int, int]], Dict]:
+    """_parse_group dentro del pool: devuelve además las métricas del worker para sumarlas en el principal."""
+    with worker_profile(args[4], profile, part):
+        result = _parse_group(*args)
+    return result, metrics.REGISTRY.drain()
+
+def _relay_events(queue):
+    """Drena la cola de eventos de los workers hacia el bus (hasta recibir None)."""
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        session_id, level, message = item
+        try:
+            bus.push(session_id, level, message)
+        except Exception:
+            pass
+
+def _group_sections(idx: Dict, target_bytes: int) -> List[List[int]]:
+    """Agrupa secciones consecutivas hasta ~target_bytes por tarea."""
+    groups: List[List[int]] = []
+    cur: List[int] = []
+    acc = 0
+    for i, sec in enumerate(idx["sections"]):
+        cur.append(i)
+        acc += sec["end"] - sec["start"]
+        if acc >= target_bytes:
+            groups.append(cur); cur = []; acc = 0
+    if cur:
+        groups.append(cur)
+    return groups
+
+def parse_reports_parallel(
+    filepaths: List[str],
+    outputs_dir: str,
+    cliente_por_defecto: str,
+    session_id: str,
+    workers: Optional[int] = None,
+    index_dir: Optional[str] = None,
+    on_file: Optional[Callable[[str, Dict[str, int]], None]] = None,
+) -> Dict[str, int]:
+    """
+    Parsea uno o varios reportes en un pool de procesos (tamaño MAX_CONCURRENCY).
+    El trabajo se reparte por rangos de secciones del índice, así un único
+    reporte enorme también usa todos los núcleos. Cada tarea deja sus tablas en
+    el directorio de secciones del archivo (entrada nueva de la caché de
+    parseo, u outputs/.shards sin caché) y al final se ensamblan en orden
+    (archivo, sección): el resultado es el mismo que el modo secuencial.
+    Los reportes ya cacheados no se parsean; los comprimidos no admiten seek
+    y son una única tarea en streaming. `on_file(path, counts)` se llama tras
+    agregar cada archivo a outputs.
+    """
+    t0 = time.time()
+    workers = max(1, workers or settings.MAX_CONCURRENCY)
+    use_cache = settings.PARSE_CACHE and index_dir is not None
+    shards_root = os.path.join(outputs_dir, SHARDS_DIRNAME)
+    shutil.rmtree(shards_root, ignore_errors=True)
+
+    ctx = mp.get_context("spawn")  # fork + hilos de uvicorn no es seguro
+    queue = ctx.Queue()
+    relay = threading.Thread(target=_relay_events, args=(queue,), daemon=True)
+    relay.start()
+
+    profile = active_profile(session_id)
+    totals = {k: 0 for k in BUCKETS}
+    builds: Dict[int, str] = {}  # directorios de secciones aún no publicados (se borran al salir)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(queue,)) as pool:
+            # 1) Hash + pre-scan de todos los archivos en paralelo
+            n = len(filepaths)
+            with stage(session_id, "preparacion"):
+                infos = list(pool.map(_prepare_file, filepaths, [index_dir] * n, [use_cache] * n))
+            total_bytes = sum(sec["end"] - sec["start"] for info in infos if info["idx"]
+                              for sec in info["idx"]["sections"])
+            target = max(SECTION_TASK_MIN_BYTES, total_bytes // (workers * 4) + 1)
+
+            # 2) Tareas por grupo de secciones: tasks[(archivo, grupo)] = ids (None = streaming)
+            tasks: Dict[Tuple[int, int], Optional[List[int]]] = {}
+            ngroups: Dict[int, int] = {}
+            futs = {}
+            pending = {}
+            for fi, (p, info) in enumerate(zip(filepaths, infos)):
+                name = os.path.basename(p)
+                if info["cached"]:
+                    bus.push(session_id, "info", f"{name}: ya parseado antes (caché {info['digest'][:12]})")
+                    continue
+                builds[fi] = new_build_dir(None if use_cache else shards_root)
+                if info["idx"] is None:
+                    bus.push(session_id, "info", f"Abriendo {name} ({info['compression']}, streaming)")
+                    groups = [None]
+                else:
+                    bus.push(session_id, "info", f"Abriendo {name} ({len(info['idx']['sections'])} sección(es))")
+                    groups = _group_sections(info["idx"], target)
+                pending[fi] = ngroups[fi] = len(groups)
+                for gi, ids in enumerate(groups):
+                    tasks[(fi, gi)] = ids
+                    fut = pool.submit(_parse_group_task, profile, f"part-{fi:04d}-{gi:05d}",
+                                      p, info["idx"], ids, builds[fi], f"{gi:05d}_",
+                                      session_id, -1, info["compression"])
+                    futs[fut] = (fi, gi)
+
+            results = {}
+            try:
+                with stage(session_id, "parseo"):
+                    for fut in as_completed(futs):
+                        fi, gi = futs[fut]
+                        results[(fi, gi)], deltas = fut.result()
+                        metrics.REGISTRY.merge(deltas)
+                        pending[fi] -= 1
+                        if pending[fi] == 0:
+                            bus.push(session_id, "success", f"Finalizado {os.path.basename(filepaths[fi])}")
+            except BaseException:
+                # Error o cancelación: no arrancar las tareas aún en cola del pool
+                for f in futs:
+                    f.cancel()
+                raise
+
+        # 3) Una sección cuyo marcador cae dentro de la tabla previa (otro grupo) fue
+        #    consumida como filas en el escaneo secuencial: se re-parsea ese grupo.
+        entries: List[Tuple[str, Dict]] = []
+        for fi, (p, info) in enumerate(zip(filepaths, infos)):
+            check_cancelled(session_id)
+            if info["cached"]:
+                # Si la entrada se evictó desde el paso 1, se reconstruye aquí
+                entries.append(load_entry(info["digest"]) or build_entry(p, info["digest"], session_id, index_dir))
+                continue
+            idx = info["idx"]
+            sections: List[Dict] = []
+            last_stop = -1
+            for gi in range(ngroups[fi]):
+                ids = tasks[(fi, gi)]
+                secs, stops = results[(fi, gi)]
+                if idx is not None and idx["sections"][ids[0]]["marker"] < last_stop:
+                    for sec in secs:
+                        os.remove(os.path.join(builds[fi], sec["file"]))
+                    secs, stops = _parse_group(p, idx, ids, builds[fi], f"{gi:05d}_", session_id, last_stop)
+                if stops:
+                    last_stop = max(last_stop, stops[max(stops)])
+                sections.extend(secs)
+            meta = idx["meta"] if idx is not None else report_metadata(p)
+            manifest = make_manifest(builds[fi], meta, sections)
+            if use_cache:
+                entries.append(publish(builds.pop(fi), info["digest"], manifest))
+            else:
+                entries.append((builds[fi], manifest))
+
+        # 4) Ensamblado en orden de archivo hacia outputs/ (con el Cliente de la sesión)
+        bus.push(session_id, "info", f"Ensamblando {len(entries)} archivo(s) en outputs")
+        for p, (d, manifest) in zip(filepaths, entries):
+            with stage(session_id, f"ensamblado|{os.path.basename(p)}"):
+                counts = assemble_report(p, d, manifest, outputs_dir, cliente_por_defecto, session_id)
+            for k, v in counts.items():
+                totals[k] += v
+            bus.push(session_id, "info",
+                     f"Procesado {os.path.basename(p)} "
+                     f"(T1N={counts['t1_normal']}, T1A={counts['t1_ajustada']}, "
+                     f"T2N={counts['t2_normal']}, T2A={counts['t2_ajustada']})")
+            if on_file:
+                on_file(p, counts)
+        metrics.PARSE_REPORT_SECONDS.observe(time.time() - t0, "parallel")
+    finally:
+        queue.put(None)
+        relay.join(timeout=5)
+        for d in builds.values():
+            shutil.rmtree(d, ignore_errors=True)
+        shutil.rmtree(shards_root, ignore_errors=True)
+    return totals
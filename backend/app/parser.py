@@ -1,10 +1,29 @@
-import csv, io, os, re, time
-from typing import Optional, Dict, List, Tuple
+import bisect, csv, gzip, io, json, mmap, os, re, threading, time
+from typing import Callable, Iterator, Optional, Dict, List, Tuple
+from .config import settings
+from .columnar import ColumnarOutput
+from .dedup import RowDeduper
+from .summary import ReportSummary, save_report_summary
 from .progress import bus
+from . import metrics
+from .profiling import is_active as _profiling_active, section_timings_message
+from .scheduler import check_cancelled
+
+try:  # opcional: solo necesario para reportes .zst
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
 
 # === Config de progreso (ajustable por env) ===
 PROGRESS_EVERY_ROWS = int(os.getenv("PROGRESS_EVERY_ROWS", "20000"))
 PROGRESS_EVERY_SEC  = float(os.getenv("PROGRESS_EVERY_SEC",  "1.0"))
+PROGRESS_CHECK_MASK = 0x3FF  # el reloj/umbral se evalúa cada 1024 filas, no en cada una
+
+# Buckets de salida (un CSV por bucket en outputs/)
+BUCKETS = ("t1_normal", "t1_ajustada", "t2_normal", "t2_ajustada")
+
+# Consumidor de filas mapeadas: sink(bucket, header_canonico, fila)
+RowSink = Callable[[str, List[str], List[str]], None]
 
 # === Marcadores flexibles ===
 MARK_T1 = re.compile(r"Control\s+Statistics", re.I)          # permite sufijos "(Percentage ...)"
@@ -70,26 +89,58 @@ def _read_existing_header(path: str) -> Optional[List[str]]:
             return None
         return _norm_header(row) if row else None
 
+# Versiones en bytes de los cortes, para decidir sin decodificar la línea
+SECTION_STOP_RE_B = re.compile(SECTION_STOP_RE.pattern.encode(), re.I)
+STOP_LOG_RE_B = re.compile(STOP_LOG_RE.pattern.encode(), re.I)
+_STOP_SECTION_PREFIXES = (b"SUMMARY", b'"SUMMARY', b"ASSET TAGS", b'"ASSET TAGS', b"POLICY ID", b"HOST STATISTICS")
+_STOP_LOG_PREFIXES = (b"ERROR", b"WARN", b"WARNING", b"INFO ", b"DEBUG", b"TRACE", b"EXCEPTION", b"TRACEBACK", b"JAVA.", b"ORG.", b"AT ")
+
+class ByteLineReader:
+    """
+    Lee líneas (bytes) de un archivo binario llevando el offset por su cuenta:
+    evita tell()/seek() de modo texto, que en CPython reconstruye el estado del
+    decodificador en cada llamada. unread() devuelve una línea sin tocar el archivo.
+    """
+    def __init__(self, fh, pos: int = 0):
+        self.fh = fh
+        self.pos = pos  # offset del próximo byte a entregar
+        self._pending: Optional[bytes] = None
+
+    def readline(self) -> bytes:
+        if self._pending is not None:
+            line, self._pending = self._pending, None
+        else:
+            line = self.fh.readline()
+        self.pos += len(line)
+        return line
+
+    def unread(self, line: bytes) -> None:
+        self._pending = line
+        self.pos -= len(line)
+
 class TableIterator:
     """
-    Itera líneas desde fh y se detiene ANTES de:
+    Itera filas (str) desde un ByteLineReader y se detiene ANTES de:
       - línea vacía,
       - SECTION_STOP_RE,
       - STOP_LOG_RE,
       - aparición de otro marcador (T1/T2).
-    Optimiza con checks rápidos antes de regex.
+    Los cortes se evalúan sobre prefijos en bytes; solo las filas de la tabla se decodifican.
     """
-    def __init__(self, fh, extra_stop):
-        self.fh = fh
-        self.extra_stop = extra_stop  # callable(line) -> bool
+    def __init__(self, src: ByteLineReader, extra_stop=None):
+        self.src = src
+        self.extra_stop = extra_stop  # callable(line: bytes) -> bool
         self._done = False
 
     def __iter__(self): return self
 
-    def __next__(self):
+    def _stop(self, line: bytes):
+        self.src.unread(line); self._done = True
+        raise StopIteration
+
+    def __next__(self) -> str:
         if self._done: raise StopIteration
-        pos = self.fh.tell()
-        line = self.fh.readline()
+        line = self.src.readline()
         if not line:
             self._done = True
             raise StopIteration
@@ -97,70 +148,337 @@ class TableIterator:
         # --- Cortes rápidos (evita regex caro) ---
         s = line.lstrip()[:64]  # prefijo, reduce costos
         if not s:  # solo espacios/nueva línea
-            self.fh.seek(pos); self._done = True; raise StopIteration
+            self._stop(line)
         u = s.upper()
-        if u.startswith(("SUMMARY", '"SUMMARY', "ASSET TAGS", '"ASSET TAGS', "POLICY ID", "HOST STATISTICS")):
-            self.fh.seek(pos); self._done = True; raise StopIteration
-        if u.startswith(("ERROR", "WARN", "WARNING", "INFO ", "DEBUG", "TRACE", "EXCEPTION", "TRACEBACK", "JAVA.", "ORG.", "AT ")):
-            self.fh.seek(pos); self._done = True; raise StopIteration
+        if u.startswith(_STOP_SECTION_PREFIXES) or u.startswith(_STOP_LOG_PREFIXES):
+            self._stop(line)
         # Marcadores de otras tablas
-        if "CONTROL STATISTICS" in u or u.strip(' "\r\n') == "RESULTS":
-            self.fh.seek(pos); self._done = True; raise StopIteration
+        if b"CONTROL STATISTICS" in u or u.strip(b' "\r\n') == b"RESULTS":
+            self._stop(line)
 
         # Extra predicate (por si quieres añadir otros cortes)
         if self.extra_stop and self.extra_stop(line):
-            self.fh.seek(pos); self._done = True; raise StopIteration
+            self._stop(line)
 
         # Fallback a regex (caro) solo si lo anterior no cortó
-        if SECTION_STOP_RE.search(line) or STOP_LOG_RE.search(line):
-            self.fh.seek(pos); self._done = True; raise StopIteration
-
-        return line
+        if SECTION_STOP_RE_B.search(line) or STOP_LOG_RE_B.search(line):
+            self._stop(line)
+
+        if line.endswith(b"\r\n"):  # mismo resultado que newline universal del modo texto
+            line = line[:-2] + b"\n"
+        return line.decode("utf-8", "replace")
+
+# === Entrada comprimida (detectada por magic bytes, no por extensión) ===
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def detect_compression(filepath: str) -> Optional[str]:
+    """'gzip' | 'zstd' | None (texto plano)."""
+    with open(filepath, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+def open_report(filepath: str, compression: Optional[str] = None):
+    """Abre el reporte en binario; si viene comprimido lo descomprime al vuelo."""
+    if compression is None:
+        compression = detect_compression(filepath)
+    if compression == "gzip":
+        return io.BufferedReader(gzip.open(filepath, "rb"), 1024*1024)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"{os.path.basename(filepath)} está comprimido con zstd: instala 'zstandard'")
+        dctx = zstandard.ZstdDecompressor()
+        return io.BufferedReader(dctx.stream_reader(open(filepath, "rb"), read_across_frames=True), 1024*1024)
+    return open(filepath, "rb", buffering=1024*1024)
 
 def _t2_header_is_valid(cols: List[str]) -> bool:
     must_have_any = {"host ip", "operating system", "control id", "status"}
     norm = { _strip_cell(c).lower() for c in cols }
     return len(must_have_any & norm) > 0
 
-def parse_report_file(
-    filepath: str,
-    outputs_dir: str,
-    cliente_por_defecto: str,
-    session_id: str,
-) -> Dict[str, int]:
+# === Índice de secciones (pre-scan por bytes) ===
+INDEX_VERSION = 1
+# Versión de la salida del parser: subirla invalida la caché de parseo (cache.py)
+PARSER_VERSION = 1
 
-    counts = {"t1_normal":0, "t1_ajustada":0, "t2_normal":0, "t2_ajustada":0}
-    out_paths = {
-        "t1_normal":   os.path.join(outputs_dir, "t1_normal.csv"),
-        "t1_ajustada": os.path.join(outputs_dir, "t1_ajustada.csv"),
-        "t2_normal":   os.path.join(outputs_dir, "t2_normal.csv"),
-        "t2_ajustada": os.path.join(outputs_dir, "t2_ajustada.csv"),
-    }
+# Candidatos a inicio de tabla sobre el archivo crudo (mmap), equivalentes a
+# MARK_T1.search / MARK_T2.match por línea pero ejecutados en C sobre todo el buffer.
+_IDX_MARK_RE = re.compile(
+    rb'(?im)^(?:\xef\xbb\xbf)?(?:[^\n]*?control[ \t\x0b\x0c]+statistics'
+    rb'|[ \t]*"?results"?[ \t]*\r?$)'
+)
 
-    # Salidas con buffer grande
-    out_handles: Dict[str, Tuple[io.TextIOBase, csv.writer, Optional[List[str]]]] = {}
-    for k, p in out_paths.items():
-        existing = _read_existing_header(p)
-        f = open(p, "a+", encoding="utf-8", newline="", buffering=1024*1024)
-        w = csv.writer(f)
-        out_handles[k] = (f, w, existing)
+def _read_head_lines(filepath: str, n: int = 200) -> List[str]:
+    head_lines: List[str] = []
+    with io.TextIOWrapper(open_report(filepath), encoding="utf-8-sig", errors="replace") as fh:
+        for _ in range(n):
+            line = fh.readline()
+            if not line: break
+            head_lines.append(line)
+    return head_lines
 
-    def _bucket(is_t1: bool, adjusted: bool) -> str:
-        return ("t1_" if is_t1 else "t2_") + ("ajustada" if adjusted else "normal")
+def report_metadata(filepath: str) -> Dict[str, Optional[str]]:
+    """Metadata (ajustada, DC, cliente/subcliente) de las primeras líneas del reporte."""
+    return _detect_metadata(_read_head_lines(filepath))
 
-    def ensure_header(key: str, incoming_header: List[str]) -> List[str]:
-        f, w, cached = out_handles[key]
+def _parse_header_line(header_line: str) -> List[str]:
+    try:
+        return next(csv.reader([header_line]))
+    except Exception:
+        return [c.strip() for c in header_line.split(",")]
+
+def build_section_index(filepath: str) -> Dict:
+    """
+    Pre-scan rápido: localiza los inicios de tabla T1/T2 sin decodificar el archivo.
+    Cada sección: kind (t1/t2), marker (offset de la línea marcador), start (offset
+    de la primera fila de datos), end (offset del siguiente marcador o EOF) y header.
+    `end` es una cota: la tabla puede terminar antes (línea vacía, otra sección, logs).
+    """
+    st = os.stat(filepath)
+    sections: List[Dict] = []
+    if st.st_size > 0:
+        with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            size = len(buf)
+            pos = 0
+            while True:
+                m = _IDX_MARK_RE.search(buf, pos)
+                if not m: break
+                line_start = m.start()
+                line_end = buf.find(b"\n", line_start)
+                if line_end < 0: break          # marcador sin encabezado (EOF)
+                hdr_end = buf.find(b"\n", line_end + 1)
+                if hdr_end < 0: hdr_end = size - 1
+                header_raw = buf[line_end + 1:hdr_end + 1]
+                if not header_raw: break
+                marker = bytes(buf[line_start:line_end]).decode("utf-8", "replace").lstrip("\ufeff")
+                kind = "t1" if MARK_T1.search(marker) else "t2"
+                sections.append({
+                    "kind": kind,
+                    "marker": line_start,
+                    "start": hdr_end + 1,
+                    "end": size,
+                    "header": _parse_header_line(header_raw.decode("utf-8", "replace")),
+                })
+                pos = hdr_end + 1               # el encabezado nunca es marcador
+        for a, b in zip(sections, sections[1:]):
+            a["end"] = b["marker"]
+    return {
+        "version": INDEX_VERSION,
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "meta": report_metadata(filepath),
+        "sections": sections,
+    }
+
+def load_section_index(filepath: str, index_path: Optional[str] = None) -> Dict:
+    """Reutiliza el índice sidecar si sigue vigente (versión, tamaño, mtime); si no, lo reconstruye."""
+    st = os.stat(filepath)
+    if index_path and os.path.exists(index_path):
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                idx = json.load(f)
+            if (idx.get("version") == INDEX_VERSION and idx.get("size") == st.st_size
+                    and idx.get("mtime") == st.st_mtime):
+                return idx
+        except (OSError, ValueError):
+            pass
+    idx = build_section_index(filepath)
+    if index_path:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp = index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(idx, f, ensure_ascii=False)
+        os.replace(tmp, index_path)
+    return idx
+
+def section_index_path(index_dir: str, filepath: str) -> str:
+    return os.path.join(index_dir, os.path.basename(filepath) + ".sections.json")
+
+# === Índice disperso fila → byte de los CSV de salida (vista previa paginada) ===
+ROW_INDEX_DIRNAME = ".rowidx"           # dentro de outputs/, junto a los CSV
+ROW_INDEX_MASK = PROGRESS_CHECK_MASK    # un punto de control cada 1024 filas
+
+class RowOffsetIndex:
+    """
+    Puntos de control (fila, offset) de un CSV de salida: cada 1024 filas (también
+    en el ensamblado por bytes desde la caché) y al final de cada tabla. `end` es lo indexado de forma contigua (filas, bytes); lo que haya
+    después se recorre y se agrega al leer (extend). Solo se agregan filas al
+    final de los CSV, así que un punto de control vale mientras el archivo no se
+    recree (inode) ni se trunque por debajo de él.
+    """
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self.path = os.path.join(os.path.dirname(csv_path), ROW_INDEX_DIRNAME,
+                                 os.path.basename(csv_path) + ".json")
+        self.rows: List[int] = []
+        self.offsets: List[int] = []
+        self.end_rows = 0
+        self.end_offset = 0
+        self.ino = 0
+
+    @classmethod
+    def load(cls, csv_path: str) -> "RowOffsetIndex":
+        """Índice vigente para el archivo actual: descarta lo que quedó más allá de un truncado."""
+        idx = cls(csv_path)
+        try:
+            st = os.stat(csv_path)
+        except OSError:
+            return idx
+        idx.ino = st.st_ino
+        try:
+            with open(idx.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if data and data.get("ino") == st.st_ino:
+            pairs = [(r, o) for r, o in zip(data["rows"], data["offsets"]) if o <= st.st_size]
+            idx.rows = [r for r, _ in pairs]
+            idx.offsets = [o for _, o in pairs]
+            if data["end_offset"] <= st.st_size:
+                idx.end_rows, idx.end_offset = data["end_rows"], data["end_offset"]
+            elif pairs:
+                idx.end_rows, idx.end_offset = pairs[-1]
+        if not idx.end_offset and st.st_size:
+            with open(csv_path, "rb") as f:
+                idx.reset(len(f.readline()))  # sin índice válido: desde el fin del encabezado
+        return idx
+
+    def reset(self, header_end: int) -> None:
+        self.rows, self.offsets = [0], [header_end]
+        self.end_rows, self.end_offset = 0, header_end
+        try:
+            self.ino = os.stat(self.csv_path).st_ino
+        except OSError:
+            pass
+
+    def mark(self, row: int, offset: int) -> None:
+        """Punto de control: la fila `row` (0 = primera tras el encabezado) empieza en `offset`."""
+        if not self.rows or row > self.rows[-1]:
+            self.rows.append(row)
+            self.offsets.append(offset)
+            return
+        i = bisect.bisect_left(self.rows, row)
+        if self.rows[i] != row:
+            self.rows.insert(i, row)
+            self.offsets.insert(i, offset)
+
+    def set_end(self, rows: int, offset: int) -> None:
+        self.mark(rows, offset)
+        self.end_rows, self.end_offset = rows, offset
+
+    def locate(self, row: int) -> Tuple[int, int]:
+        """Punto de control más cercano a `row` por debajo: (fila, offset)."""
+        i = bisect.bisect_right(self.rows, row) - 1
+        return (self.rows[i], self.offsets[i]) if i >= 0 else (self.end_rows, self.end_offset)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"  # lector y writer pueden guardar a la vez
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ino": self.ino, "rows": self.rows, "offsets": self.offsets,
+                       "end_rows": self.end_rows, "end_offset": self.end_offset}, f)
+        os.replace(tmp, self.path)
+
+    def scan(self, row: int, offset: int) -> Iterator[Tuple[int, int, List[str]]]:
+        """
+        (fila, offset, celdas) desde el punto de control (row, offset), agregando
+        puntos de control por el camino. Se detiene en la última fila completa:
+        un writer en curso puede haber dejado la última a medio escribir.
+        """
+        with open(self.csv_path, "rb", buffering=1024*1024) as fh:
+            fh.seek(offset)
+            src = ByteLineReader(fh, offset)
+
+            def complete_lines():
+                while True:
+                    line = src.readline()
+                    if not line.endswith(b"\n"):
+                        return
+                    yield line.decode("utf-8", "replace")
+            start = offset
+            try:
+                for cells in csv.reader(complete_lines(), strict=True):
+                    if not row & ROW_INDEX_MASK:
+                        self.mark(row, start)
+                    yield row, start, cells
+                    row += 1
+                    start = src.pos
+                    if row > self.end_rows:
+                        self.end_rows, self.end_offset = row, start
+            except csv.Error:  # registro entre comillas sin terminar al final del archivo
+                return
+
+    def extend(self) -> bool:
+        """Indexa lo escrito después de `end` (p.ej. por un /process en curso). True si avanzó."""
+        before = self.end_offset
+        if self.end_offset and os.path.getsize(self.csv_path) > self.end_offset:
+            for _ in self.scan(self.end_rows, self.end_offset):
+                pass
+        return self.end_offset != before
+
+class _TableWriter:
+    """
+    Parte común de los modos indexado y streaming: mapea las filas de cada tabla
+    al encabezado canónico del bucket, las escribe en outputs_dir (y/o `sink`) y
+    publica el progreso.
+    """
+    def __init__(self, filepath: str, outputs_dir: str, cliente_por_defecto: str, session_id: str,
+                 md: Dict, sink: Optional[RowSink] = None, write_csv: bool = True):
+        self.filepath = filepath
+        self.outputs_dir = outputs_dir
+        self.session_id = session_id
+        self.md = md
+        self.sink = sink
+        self.cliente_val = md["subcliente"] or md["cliente"] or cliente_por_defecto
+        self.counts = {k: 0 for k in BUCKETS}
+        self.last_emit_ts = time.time()
+        self.last_emit_rows = 0
+        # Con perfilado activo: bucket -> [tablas, filas, segundos] (evento 'timing|' al cerrar)
+        self.timings: Optional[Dict[str, list]] = {} if _profiling_active(session_id) else None
+
+        # Salidas con buffer grande
+        self.out_handles: Dict[str, Tuple[Optional[io.TextIOBase], Optional[csv.writer], Optional[List[str]]]] = {}
+        # Índice fila→byte por salida; solo se mantiene si cubre el archivo entero al abrirlo
+        self.row_index: Dict[str, RowOffsetIndex] = {}
+        for k in BUCKETS:
+            if not write_csv:
+                self.out_handles[k] = (None, None, None)
+                continue
+            p = os.path.join(outputs_dir, f"{k}.csv")
+            existing = _read_existing_header(p)
+            f = open(p, "a+", encoding="utf-8", newline="", buffering=1024*1024)
+            self.out_handles[k] = (f, csv.writer(f), existing)
+            ridx = RowOffsetIndex.load(p) if existing is not None else RowOffsetIndex(p)
+            if existing is None or ridx.end_offset == os.path.getsize(p):
+                self.row_index[k] = ridx
+        # Partes Parquet del reporte junto a los CSV (OUTPUT_PARQUET)
+        self.columnar = ColumnarOutput(outputs_dir, filepath) if write_csv and settings.OUTPUT_PARQUET else None
+        # Filas repetidas entre reportes de la sesión (OUTPUT_DEDUP): no se escriben ni se envían
+        self.dedup = RowDeduper(outputs_dir, filepath) if write_csv and settings.OUTPUT_DEDUP else None
+        # Agregados del reporte (OUTPUT_SUMMARY), sumados a outputs/summary.json al cerrar
+        self.summary = ReportSummary() if settings.OUTPUT_SUMMARY else None
+
+    def ensure_header(self, key: str, incoming_header: List[str]) -> List[str]:
+        f, w, cached = self.out_handles[key]
         if cached is not None:
             return cached
         canon = _ensure_cliente_last(_norm_header(incoming_header))
-        w.writerow(canon)          # una sola vez
-        out_handles[key] = (f, w, canon)
+        if w is not None:
+            w.writerow(canon)      # una sola vez
+            if key in self.row_index:
+                self.row_index[key].reset(f.tell())
+        self.out_handles[key] = (f, w, canon)
         return canon
 
-    def make_row_mapper(in_header: List[str], canon_header: List[str], cliente_val: str):
+    def make_row_mapper(self, in_header: List[str], canon_header: List[str], with_cliente: bool = True):
         src_names = [_strip_cell(c).lower() for c in in_header]
         src_map = {name: idx for idx, name in enumerate(src_names)}
         dest_cols = [c for c in canon_header if c.strip().lower() != "cliente"]
+        cliente_val = self.cliente_val
 
         def map_row(row: List[str]) -> List[str]:
             out = []
@@ -170,123 +488,314 @@ def parse_report_file(
                 out.append(val)
             out.append(cliente_val)
             return out
-        return map_row
 
-    # --- Progreso ---
-    def emit_progress(bucket: str, rows: int, pos_bytes: int, force=False):
-        nonlocal last_emit_ts, last_emit_rows
-        now = time.time()
-        if force or rows - last_emit_rows >= PROGRESS_EVERY_ROWS or (now - last_emit_ts) >= PROGRESS_EVERY_SEC:
-            bus.push(session_id, "info", f"progress|{os.path.basename(filepath)}|{bucket}|rows={rows}|bytes={pos_bytes}")
-            last_emit_ts = now
-            last_emit_rows = rows
-
-    with open(filepath, "r", encoding="utf-8-sig", errors="replace", buffering=1024*1024) as fh:
-        # Leer primeras N líneas para metadata
-        head_lines: List[str] = []
-        for _ in range(200):
-            pos = fh.tell()
-            line = fh.readline()
-            if not line: break
-            head_lines.append(line)
-        fh.seek(0)
-        md = _detect_metadata(head_lines)
-        cliente_val = md["subcliente"] or md["cliente"] or cliente_por_defecto
+        def map_row_sin_cliente(row: List[str]) -> List[str]:
+            out = []
+            for col in dest_cols:
+                idx = src_map.get(col.strip().lower())
+                out.append(row[idx] if (idx is not None and idx < len(row)) else "")
+            return out
+        return map_row if with_cliente else map_row_sin_cliente
+
+    def begin_table(self, bucket: str, in_header: List[str]):
+        """Destino de una tabla: (csv.writer o None, encabezado canónico, mapper)."""
+        canon = self.ensure_header(bucket, in_header)
+        return self.out_handles[bucket][1], canon, self.make_row_mapper(in_header, canon)
+
+    def end_table(self, bucket: str, rows: int):
+        pass
 
-        # Variables de progreso
-        last_emit_ts = time.time()
-        last_emit_rows = 0
+    def table_written(self, bucket: str, rows: int) -> None:
+        """Punto de control al final de una tabla ya escrita en la salida (`rows` filas)."""
+        ridx = self.row_index.get(bucket)
+        if ridx is not None:
+            ridx.set_end(ridx.end_rows + rows, self.out_handles[bucket][0].tell())
 
-        # Bucle principal
+    # --- Progreso ---
+    def emit_progress(self, bucket: str, rows: int, pos_bytes: int, force=False):
+        now = time.time()
+        if force or rows - self.last_emit_rows >= PROGRESS_EVERY_ROWS or (now - self.last_emit_ts) >= PROGRESS_EVERY_SEC:
+            bus.push(self.session_id, "info",
+                     f"progress|{os.path.basename(self.filepath)}|{bucket}|rows={rows}|bytes={pos_bytes}")
+            self.last_emit_ts = now
+            self.last_emit_rows = rows
+
+    def parse_table(self, src: ByteLineReader, is_t1: bool, in_header: List[str]) -> int:
+        """Consume las filas de una tabla desde `src` (ya tras el encabezado); devuelve el offset de parada."""
+        md = self.md
+        start_pos = src.pos
+        t0 = time.perf_counter()
+        if not is_t1 and not _t2_header_is_valid(in_header):
+            bus.push(self.session_id, "warning", "Encabezado T2 inválido tras RESULTS; bloque ignorado")
+            return start_pos
+
+        os_idx = None
+        if not is_t1:
+            for i, col in enumerate(in_header):
+                if _strip_cell(col).lower() == "operating system":
+                    os_idx = i; break
+
+        bucket = ("t1_" if is_t1 else "t2_") + ("ajustada" if md["adjusted"] else "normal")
+        check_cancelled(self.session_id)
+        w, canon, map_row = self.begin_table(bucket, in_header)
+
+        rdr = csv.reader(TableIterator(src))
+        sink = self.sink
+        counts = self.counts
+        written = counts[bucket]
+        bad = 0
+        rows = 0
+        ridx = self.row_index.get(bucket) if w is not None else None
+        out_f = self.out_handles[bucket][0]
+        col = self.columnar.writer(bucket, canon).append if self.columnar is not None else None
+        agg = self.summary.adder(bucket, canon) if self.summary is not None else None
+        dup = self.dedup.checker(bucket, canon) if self.dedup is not None else None
+        nrow = ridx.end_rows if ridx is not None else 0  # fila de la salida (para el índice fila→byte)
+        for row in rdr:
+            rows += 1
+            if in_header and len(row) != len(in_header):
+                bad += 1
+                if bad >= 3: break
+                continue
+            bad = 0
+            if os_idx is not None and os_idx < len(row):
+                row[os_idx] = _norm_os_value(row[os_idx], md["has_dc"])
+            out = map_row(row)
+            if dup is None or not dup(out):
+                if w is not None:
+                    if ridx is not None and not nrow & ROW_INDEX_MASK:
+                        ridx.mark(nrow, out_f.tell())
+                    nrow += 1
+                    w.writerow(out)
+                if col is not None:
+                    col(out)
+                if agg is not None:
+                    agg(out)
+                if sink is not None:
+                    sink(bucket, canon, out)
+                counts[bucket] += 1
+            if not rows & PROGRESS_CHECK_MASK:
+                self.emit_progress(bucket, rows, src.pos - start_pos)
+                check_cancelled(self.session_id)
+        stop = src.pos
+        if ridx is not None:
+            self.table_written(bucket, counts[bucket] - written)
+        self.end_table(bucket, counts[bucket] - written)
+        # Métricas por tabla (no por fila)
+        metrics.PARSE_SECTIONS.inc(1, bucket)
+        metrics.PARSE_ROWS.inc(counts[bucket] - written, bucket)
+        metrics.PARSE_BYTES.inc(stop - start_pos, bucket)
+        metrics.PARSE_SECTION_SECONDS.observe(time.perf_counter() - t0, bucket)
+        metrics.PARSE_SECTION_BYTES.observe(stop - start_pos, bucket)
+        if self.timings is not None:
+            t = self.timings.setdefault(bucket, [0, 0, 0.0])
+            t[0] += 1; t[1] += counts[bucket] - written; t[2] += time.perf_counter() - t0
+        self.emit_progress(bucket, rows, stop - start_pos, force=True)
+        return stop
+
+    def push_timings(self):
+        if self.timings:
+            bus.push(self.session_id, "info", section_timings_message(self.filepath, self.timings))
+
+    def close(self):
+        self.push_timings()
+        if self.columnar is not None:
+            dropped = self.columnar.close()
+            if dropped:
+                bus.push(self.session_id, "warning",
+                         f"Parquet {os.path.basename(self.filepath)}: {dropped} valor(es) no numéricos quedaron vacíos")
+        if self.dedup is not None:
+            dups = {k: n for k, n in self.dedup.close().items() if n}
+            if dups:
+                bus.push(self.session_id, "info", f"{os.path.basename(self.filepath)}: filas repetidas omitidas "
+                         + ", ".join(f"{k}={n}" for k, n in dups.items()))
+        for k, (f, _, _) in self.out_handles.items():
+            if f is not None:
+                f.close()
+                if k in self.row_index and self.row_index[k].end_offset:
+                    self.row_index[k].save()
+        if self.summary is not None:
+            save_report_summary(self.outputs_dir, self.filepath, self.summary)
+
+class _SectionWriter(_TableWriter):
+    """
+    Variante para la caché de parseo: cada tabla va a su propio CSV en
+    sections_dir, sin la columna Cliente (se aplica al ensamblar la sesión).
+    `sections` acumula por tabla {bucket, header, rows, file, simple[, summary]};
+    simple indica que cada fila ocupa exactamente una línea (ensamblado por
+    bytes) y summary lleva los agregados de la tabla (se suman al ensamblar).
+    """
+    def __init__(self, filepath: str, sections_dir: str, session_id: str, md: Dict, prefix: str = ""):
+        super().__init__(filepath, sections_dir, "", session_id, md, write_csv=False)
+        self.sections_dir = sections_dir
+        self.prefix = prefix
+        self.sections: List[Dict] = []
+        self._cur = None
+
+    def begin_table(self, bucket: str, in_header: List[str]):
+        canon = _ensure_cliente_last(_norm_header(in_header))
+        name = f"{self.prefix}{len(self.sections):05d}.csv"
+        f = open(os.path.join(self.sections_dir, name), "w", encoding="utf-8", newline="", buffering=1024*1024)
+        self._cur = (f, {"bucket": bucket, "header": canon, "rows": 0, "file": name})
+        if self.summary is not None:
+            self.summary = ReportSummary()  # uno por tabla: parse_table toma su adder tras begin_table
+        return csv.writer(f), canon, self.make_row_mapper(in_header, canon, with_cliente=False)
+
+    def end_table(self, bucket: str, rows: int):
+        f, entry = self._cur
+        f.close()
+        self._cur = None
+        newlines = 0
+        with open(os.path.join(self.sections_dir, entry["file"]), "rb") as fh:
+            for block in iter(lambda: fh.read(1024*1024), b""):
+                newlines += block.count(b"\n")
+        entry["rows"] = rows
+        entry["simple"] = newlines == rows
+        if self.summary is not None:
+            entry["summary"] = self.summary.buckets.get(bucket, {})
+        self.sections.append(entry)
+
+    def close(self):
+        self.push_timings()
+        if self._cur is not None:
+            self._cur[0].close()
+
+def _parse_indexed(tw: _TableWriter, filepath: str, idx: Dict, section_ids: Optional[List[int]],
+                   consumed_to: int) -> Dict[int, int]:
+    stops: Dict[int, int] = {}
+    sections = idx["sections"]
+    if section_ids is None:
+        section_ids = list(range(len(sections)))
+    with open(filepath, "rb", buffering=1024*1024) as fh:
+        for sid in section_ids:
+            sec = sections[sid]
+            if sec["marker"] < consumed_to:
+                continue
+            fh.seek(sec["start"])
+            stop = tw.parse_table(ByteLineReader(fh, sec["start"]), sec["kind"] == "t1", sec["header"])
+            stops[sid] = stop
+            consumed_to = stop
+    return stops
+
+def _parse_stream(tw: _TableWriter, filepath: str, compression: Optional[str]) -> None:
+    with open_report(filepath, compression) as fh:
+        src = ByteLineReader(fh)
         while True:
-            pos_file = fh.tell()
-            line = fh.readline()
+            line = src.readline()
             if not line:
                 break
-            stripped = line.rstrip("\r\n")
-
-            # Inicio de T1
-            if MARK_T1.search(stripped):
-                header_line = fh.readline()
-                if not header_line:
-                    continue
-                try:
-                    in_header = next(csv.reader([header_line]))
-                except Exception:
-                    in_header = [c.strip() for c in header_line.split(",")]
-                bucket = _bucket(True, md["adjusted"])
-                canon = ensure_header(bucket, in_header)
-                map_row = make_row_mapper(in_header, canon, cliente_val)
-
-                def extra_stop(_l: str) -> bool: return False
-                rdr = csv.reader(TableIterator(fh, extra_stop))
-                f, w, _ = out_handles[bucket]
-                bad = 0
-                rows = 0
-                start_pos = fh.tell()
-                for row in rdr:
-                    rows += 1
-                    if in_header and len(row) != len(in_header):
-                        bad += 1
-                        if bad >= 3: break
-                        continue
-                    bad = 0
-                    w.writerow(map_row(row))
-                    counts["t1_ajustada" if md["adjusted"] else "t1_normal"] += 1
-                    emit_progress(bucket, rows, fh.tell() - start_pos)
-                emit_progress(bucket, rows, fh.tell() - start_pos, force=True)
+            if not _IDX_MARK_RE.match(line):
                 continue
+            header_raw = src.readline()
+            if not header_raw:
+                break
+            marker = line.rstrip(b"\r\n").decode("utf-8", "replace").lstrip("\ufeff")
+            tw.parse_table(src, bool(MARK_T1.search(marker)),
+                           _parse_header_line(header_raw.decode("utf-8", "replace")))
 
-            # Inicio de T2
-            if MARK_T2.match(stripped):
-                header_line = fh.readline()
-                if not header_line:
-                    continue
-                try:
-                    in_header = next(csv.reader([header_line]))
-                except Exception:
-                    in_header = [c.strip() for c in header_line.split(",")]
-
-                if not _t2_header_is_valid(in_header):
-                    bus.push(session_id, "warning", "Encabezado T2 inválido tras RESULTS; bloque ignorado")
-                    continue
-
-                os_idx = None
-                for idx, col in enumerate(in_header):
-                    if _strip_cell(col).lower() == "operating system":
-                        os_idx = idx; break
-
-                bucket = _bucket(False, md["adjusted"])
-                canon = ensure_header(bucket, in_header)
-                map_row = make_row_mapper(in_header, canon, cliente_val)
-
-                def extra_stop(_l: str) -> bool: return False
-                rdr = csv.reader(TableIterator(fh, extra_stop))
-                f, w, _ = out_handles[bucket]
-                bad = 0
-                rows = 0
-                start_pos = fh.tell()
-                for row in rdr:
-                    rows += 1
-                    if in_header and len(row) != len(in_header):
-                        bad += 1
-                        if bad >= 3: break
-                        continue
-                    bad = 0
-                    if os_idx is not None and os_idx < len(row):
-                        row[os_idx] = _norm_os_value(row[os_idx], md["has_dc"])
-                    w.writerow(map_row(row))
-                    counts["t2_ajustada" if md["adjusted"] else "t2_normal"] += 1
-                    emit_progress(bucket, rows, fh.tell() - start_pos)
-                emit_progress(bucket, rows, fh.tell() - start_pos, force=True)
-                continue
+def parse_report_sections(
+    filepath: str,
+    outputs_dir: str,
+    cliente_por_defecto: str,
+    session_id: str,
+    idx: Dict,
+    section_ids: Optional[List[int]] = None,
+    consumed_to: int = -1,
+    sink: Optional[RowSink] = None,
+    write_csv: bool = True,
+) -> Tuple[Dict[str, int], Dict[int, int]]:
+    """
+    Parsea las secciones `section_ids` del índice (todas si None) saltando
+    directamente a su offset. Devuelve (counts, stops) donde stops[i] es el
+    offset en que terminó la tabla i.
 
-            # Ninguna tabla: seguir
-            continue
+    `sink(bucket, header, row)` recibe cada fila ya mapeada (p.ej. ingesta
+    directa a ES); con write_csv=False no se escriben los CSV de outputs_dir.
 
-    # Cerrar salidas
-    for f, _, _ in out_handles.values():
-        f.close()
+    Una sección cuyo marcador cae dentro de la tabla anterior (ya consumida como
+    filas) se ignora, igual que el escaneo línea a línea. `consumed_to` permite
+    arrancar con el offset de parada de una tabla procesada en otra tarea.
+    """
+    tw = _TableWriter(filepath, outputs_dir, cliente_por_defecto, session_id, idx["meta"], sink, write_csv)
+    try:
+        stops = _parse_indexed(tw, filepath, idx, section_ids, consumed_to)
+    finally:
+        tw.close()
+    return tw.counts, stops
+
+def parse_report_stream(
+    filepath: str,
+    outputs_dir: str,
+    cliente_por_defecto: str,
+    session_id: str,
+    compression: Optional[str] = None,
+    sink: Optional[RowSink] = None,
+    write_csv: bool = True,
+) -> Dict[str, int]:
+    """
+    Parsea un reporte en una sola pasada secuencial, sin índice ni seek: es el
+    modo de los reportes comprimidos, que se descomprimen al vuelo (nunca se
+    escribe el archivo expandido). Mismo resultado que parse_report_sections.
+    """
+    md = report_metadata(filepath)
+    tw = _TableWriter(filepath, outputs_dir, cliente_por_defecto, session_id, md, sink, write_csv)
+    try:
+        _parse_stream(tw, filepath, compression)
+    finally:
+        tw.close()
+    return tw.counts
+
+def parse_report_to_sections(
+    filepath: str,
+    sections_dir: str,
+    session_id: str,
+    idx: Optional[Dict] = None,
+    section_ids: Optional[List[int]] = None,
+    consumed_to: int = -1,
+    prefix: str = "",
+    compression: Optional[str] = None,
+) -> Tuple[List[Dict], Dict[int, int]]:
+    """
+    Parsea hacia un CSV por tabla en sections_dir (ver _SectionWriter), con el
+    índice si se da `idx` o en streaming si no. Devuelve (secciones, stops).
+    """
+    md = idx["meta"] if idx is not None else report_metadata(filepath)
+    tw = _SectionWriter(filepath, sections_dir, session_id, md, prefix)
+    try:
+        if idx is not None:
+            stops = _parse_indexed(tw, filepath, idx, section_ids, consumed_to)
+        else:
+            _parse_stream(tw, filepath, compression)
+            stops = {}
+    finally:
+        tw.close()
+    return tw.sections, stops
+
+def parse_report_file(
+    filepath: str,
+    outputs_dir: str,
+    cliente_por_defecto: str,
+    session_id: str,
+    index_path: Optional[str] = None,
+    sink: Optional[RowSink] = None,
+    write_csv: bool = True,
+) -> Dict[str, int]:
+    """
+    Parsea un reporte completo hacia los CSV de outputs_dir (append).
+    Si se da index_path, el índice de secciones se guarda/reutiliza ahí.
+    Los reportes gzip/zstd se detectan por magic bytes y se parsean en streaming.
+    `sink` / `write_csv`: ver parse_report_sections.
+    """
+    t0 = time.perf_counter()
+    compression = detect_compression(filepath)
+    if compression:
+        counts = parse_report_stream(filepath, outputs_dir, cliente_por_defecto, session_id,
+                                     compression, sink=sink, write_csv=write_csv)
+    else:
+        idx = load_section_index(filepath, index_path)
+        counts, _ = parse_report_sections(filepath, outputs_dir, cliente_por_defecto, session_id, idx,
+                                          sink=sink, write_csv=write_csv)
+    metrics.PARSE_REPORT_SECONDS.observe(time.perf_counter() - t0, "file")
 
     bus.push(session_id, "info",
              f"Procesado {os.path.basename(filepath)} "
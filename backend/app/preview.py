@@ -0,0 +1,73 @@
+import csv, os
+from typing import Dict, List, Optional, Tuple
+from .config import settings
+from .parser import RowOffsetIndex
+
+# Vista previa paginada de los CSV de salida sobre el índice fila→byte
+# (outputs/.rowidx/): la página N es un seek al punto de control anterior más
+# como mucho 1023 filas de avance, no un recorrido desde el inicio.
+
+def parse_filters(raw: List[str]) -> List[Tuple[str, str]]:
+    """'Columna=valor' → (columna, valor); igualdad exacta, columnas sin distinguir mayúsculas."""
+    out = []
+    for item in raw:
+        col, sep, val = item.partition("=")
+        if not sep or not col.strip():
+            raise ValueError(f"Filtro inválido: {item!r} (usa Columna=valor)")
+        out.append((col.strip(), val))
+    return out
+
+def _read_header(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return next(csv.reader(f), [])
+
+def _resolve(header: List[str], names: List[str]) -> List[int]:
+    by_lower = {h.strip().lower(): i for i, h in enumerate(header)}
+    missing = [n for n in names if n.strip().lower() not in by_lower]
+    if missing:
+        raise KeyError(f"Columnas inexistentes: {', '.join(missing)}")
+    return [by_lower[n.strip().lower()] for n in names]
+
+def read_page(path: str, offset: int = 0, limit: int = 100, columns: Optional[List[str]] = None,
+              filters: Optional[List[Tuple[str, str]]] = None) -> Dict:
+    """
+    Filas de `path` desde la fila `offset` (0 = primera tras el encabezado).
+    Sin filtros es una página exacta. Con filtros se recorre desde `offset`
+    hasta reunir `limit` coincidencias o PREVIEW_MAX_SCAN filas; `next_offset`
+    indica desde dónde seguir. Raises KeyError (columna desconocida).
+    """
+    limit = max(1, min(limit, settings.PREVIEW_MAX_ROWS))
+    offset = max(0, offset)
+    header = _read_header(path) if os.path.getsize(path) else []
+    cols = _resolve(header, columns) if columns else list(range(len(header)))
+    conds = [(i, v) for i, (_, v) in zip(_resolve(header, [c for c, _ in filters or []]), filters or [])]
+
+    idx = RowOffsetIndex.load(path)
+    dirty = idx.extend()
+    total = idx.end_rows
+    rows: List[List[str]] = []
+    next_offset: Optional[int] = None
+    if header and offset < total:
+        known = len(idx.rows)
+        row, pos = idx.locate(offset)
+        scanned = 0
+        for row, _, cells in idx.scan(row, pos):
+            if row < offset:
+                continue
+            if len(rows) >= limit or scanned >= settings.PREVIEW_MAX_SCAN:
+                next_offset = row
+                break
+            scanned += 1
+            if all(i < len(cells) and cells[i] == v for i, v in conds):
+                rows.append([cells[i] if i < len(cells) else "" for i in cols])
+        dirty = dirty or len(idx.rows) != known
+    if dirty:
+        idx.save()  # puntos de control nuevos: la próxima lectura salta directo
+    return {
+        "columns": [header[i] for i in cols],
+        "offset": offset,
+        "limit": limit,
+        "total_rows": total,
+        "rows": rows,
+        "next_offset": next_offset,
+    }
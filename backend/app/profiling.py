@@ -0,0 +1,191 @@
+import cProfile, glob, io, os, pstats, sys, threading, time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from .config import settings
+from .progress import bus
+
+# Perfilado opcional por trabajo (/process o ingesta), activado por request o PROFILE_MODE:
+#   cprofile → perfil determinista del hilo del trabajo (y de cada tarea del pool de
+#              parseo): profile.pstats
+#   sample   → muestreo periódico de las pilas de todos los hilos del proceso
+#              (PROFILE_SAMPLE_INTERVAL): profile.collapsed (formato flamegraph.pl / speedscope)
+# Se guarda en <sesión>/profile/ y se descarga con GET /sessions/{id}/profile/{nombre}.
+
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_FILES = ("profile.pstats", "profile.collapsed")
+
+_active: Dict[str, Tuple[str, str]] = {}  # sesión -> (directorio, modo) con perfilado en curso en este proceso
+
+def resolve_mode(requested: Optional[str]) -> Optional[str]:
+    """Modo pedido en el request o, si no viene, PROFILE_MODE; '' / 'off' = sin perfilado."""
+    mode = (settings.PROFILE_MODE if requested is None else requested).strip().lower()
+    if mode in ("", "off", "none", "false", "0"):
+        return None
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Modo de perfilado desconocido: {mode} (usa {', '.join(PROFILE_MODES)})")
+    return mode
+
+def is_active(session_id: str) -> bool:
+    return session_id in _active
+
+def active_profile(session_id: str) -> Optional[Tuple[str, str]]:
+    """(directorio, modo) del perfilado en curso de la sesión, para propagarlo a los workers del pool."""
+    return _active.get(session_id)
+
+class _Sampler:
+    """Hilo que cada `interval` s cuenta las pilas (raíz→hoja) de los demás hilos."""
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(parts))] += 1
+
+class JobProfiler:
+    def __init__(self, mode: str, interval: Optional[float] = None):
+        self.mode = mode
+        self._prof = cProfile.Profile() if mode == "cprofile" else None
+        self._sampler = _Sampler(interval or settings.PROFILE_SAMPLE_INTERVAL) if mode == "sample" else None
+
+    def start(self):
+        if self._prof is not None:
+            self._prof.enable()
+        else:
+            self._sampler.start()
+
+    def stop(self):
+        if self._prof is not None:
+            self._prof.disable()
+        else:
+            self._sampler.stop()
+
+    def dump(self, out_dir: str, name: str = "profile") -> str:
+        os.makedirs(out_dir, exist_ok=True)
+        if self._prof is not None:
+            path = os.path.join(out_dir, f"{name}.pstats")
+            self._prof.dump_stats(path)
+        else:
+            path = os.path.join(out_dir, f"{name}.collapsed")
+            _write_collapsed(path, self._sampler.stacks)
+        return path
+
+def _write_collapsed(path: str, stacks: Counter) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, n in sorted(stacks.items()):
+            f.write(f"{stack} {n}\n")
+
+def _read_collapsed(path: str) -> Counter:
+    out: Counter = Counter()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            stack, _, n = line.rstrip("\n").rpartition(" ")
+            if stack:
+                out[stack] += int(n)
+    return out
+
+def merge_profiles(out_dir: str) -> None:
+    """Suma al perfil principal los parciales de las tareas del pool (part-*.pstats / part-*.collapsed)."""
+    parts = sorted(glob.glob(os.path.join(out_dir, "part-*.pstats")))
+    if parts:
+        main = os.path.join(out_dir, "profile.pstats")
+        st = pstats.Stats(*([main] if os.path.exists(main) else []), *parts, stream=io.StringIO())
+        st.dump_stats(main)
+    parts_c = sorted(glob.glob(os.path.join(out_dir, "part-*.collapsed")))
+    if parts_c:
+        main = os.path.join(out_dir, "profile.collapsed")
+        total = _read_collapsed(main) if os.path.exists(main) else Counter()
+        for p in parts_c:
+            total.update(_read_collapsed(p))
+        _write_collapsed(main, total)
+    for p in parts + parts_c:
+        os.remove(p)
+
+def profile_summary(path: str, limit: int = 8) -> str:
+    """Top de funciones por tiempo acumulado (pstats) o por muestras propias (collapsed)."""
+    if path.endswith(".pstats"):
+        buf = io.StringIO()
+        pstats.Stats(path, stream=buf).sort_stats("cumulative").print_stats(limit)
+        return buf.getvalue()
+    leaves: Counter = Counter()
+    for stack, n in _read_collapsed(path).items():
+        leaves[stack.rsplit(";", 1)[-1]] += n
+    return "\n".join(f"{n:>7} {fn}" for fn, n in leaves.most_common(limit))
+
+@contextmanager
+def profile_job(session_id: str, out_dir: str, mode: Optional[str]) -> Iterator[None]:
+    """Perfila el bloque si `mode` no es None y deja el resultado en out_dir."""
+    if mode is None:
+        yield
+        return
+    for name in PROFILE_FILES:  # perfil de una corrida anterior
+        try:
+            os.remove(os.path.join(out_dir, name))
+        except OSError:
+            pass
+    prof = JobProfiler(mode)
+    _active[session_id] = (out_dir, mode)
+    t0 = time.time()
+    prof.start()
+    try:
+        yield
+    finally:
+        prof.stop()
+        _active.pop(session_id, None)
+        path = prof.dump(out_dir)
+        merge_profiles(out_dir)
+        bus.push(session_id, "info", f"Perfil ({mode}) de {time.time() - t0:.1f}s guardado: {os.path.basename(path)}")
+
+@contextmanager
+def stage(session_id: str, name: str) -> Iterator[None]:
+    """Tiempo de una etapa gruesa como evento 'timing|<etapa>|s=...' (solo con perfilado activo)."""
+    if session_id not in _active:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        bus.push(session_id, "info", f"timing|{name}|s={time.perf_counter() - t0:.3f}")
+
+@contextmanager
+def worker_profile(session_id: str, profile: Optional[Tuple[str, str]], name: str) -> Iterator[None]:
+    """Dentro de un proceso del pool: perfila una tarea y deja su parcial (part-*) en el directorio."""
+    if profile is None:
+        yield
+        return
+    out_dir, mode = profile
+    prof = JobProfiler(mode)
+    _active[session_id] = profile
+    prof.start()
+    try:
+        yield
+    finally:
+        prof.stop()
+        _active.pop(session_id, None)
+        prof.dump(out_dir, name)
+
+def section_timings_message(filepath: str, timings: Dict[str, list]) -> str:
+    parts = "|".join(f"{b}=tablas:{t}/filas:{r}/s:{s:.3f}" for b, (t, r, s) in sorted(timings.items()))
+    return f"timing|{os.path.basename(filepath)}|{parts}"
@@ -1,57 +1,298 @@
-from typing import Dict
-from threading import Lock
-import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from collections import deque
+from threading import Lock, local
+import asyncio, os, sqlite3, time
+from .config import settings
+from . import metrics
 
-class ProgressBus:
-    def __init__(self):
+def _coalesce_key(message: str) -> Optional[str]:
+    """'progress|<archivo>|<bucket>|...' → 'progress|<archivo>|<bucket>' (None si no es progreso)."""
+    if not message.startswith("progress|"):
+        return None
+    return "|".join(message.split("|", 3)[:3])
+
+# Estados con un trabajo en cola o en curso (claim() no los pisa)
+ACTIVE_STATUSES = ("queued", "running")
+
+class _BusBase:
+    """
+    Lógica común de los buses: reenvío desde workers, suscriptores asíncronos y
+    stream SSE. Cada backend implementa init/_append/status/get_status/claim/_snapshot.
+
+      - Los eventos tienen id absoluto y creciente por sesión; '?from=<id>' reanuda.
+      - Un 'progress|' consecutivo a otro del mismo archivo/bucket lo reemplaza
+        (el nuevo recibe un id mayor, los clientes no pierden el último).
+      - stream() es asíncrono: los suscriptores esperan un asyncio.Event que push()
+        despierta en este proceso. `_poll_sec` permite además ver eventos escritos
+        por otros procesos (backend compartido).
+      - Si `_snapshot` bloquea (SQLite), stream() lo corre en un hilo, fuera del event loop.
+    """
+    _poll_sec: Optional[float] = None
+    _blocking_snapshot = False
+
+    def __init__(self, max_events: Optional[int] = None):
+        self._max_events = max_events or settings.PROGRESS_MAX_EVENTS
+        self._forward = None  # cola hacia el proceso principal (workers del pool)
+        self._waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._waiters_lock = Lock()
+        self._listeners: List[Callable[[str, str, str], None]] = []
+
+    def forward_to(self, queue):
+        """
+        Usado dentro de procesos worker: push() deja de guardar localmente y
+        reenvía (session_id, level, message) a `queue`, que el proceso
+        principal drena hacia su propio bus.
+        """
+        self._forward = queue
+
+    def add_listener(self, fn: Callable[[str, str, str], None]):
+        """fn(session_id, level, message) por cada evento de este proceso (p.ej. la CLI imprime el progreso)."""
+        self._listeners.append(fn)
+
+    def _notify(self, session_id: str):
+        with self._waiters_lock:
+            waiters = list(self._waiters.get(session_id, ()))
+        for loop, ev in waiters:
+            try:
+                loop.call_soon_threadsafe(ev.set)
+            except RuntimeError:  # loop ya cerrado (cliente desconectado)
+                pass
+
+    def push(self, session_id: str, level: str, message: str):
+        if self._forward is not None:
+            self._forward.put((session_id, level, message))
+            return
+        self._append(session_id, {"ts": time.time(), "level": level, "message": message,
+                                  "key": _coalesce_key(message)})
+        self._notify(session_id)
+        for fn in self._listeners:
+            fn(session_id, level, message)
+
+    async def stream(self, session_id: str, start_from: int = 0):
+        """
+        Envía eventos desde start_from (id del último evento visto + 1).
+        Incluye 'id: <n>' para que el cliente pueda reconectar con 'from=<lastId>'.
+        """
+        last_idx = max(0, int(start_from))
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._waiters_lock:
+            self._waiters.setdefault(session_id, set()).add(waiter)
+        metrics.SSE_SUBSCRIBERS.inc()
+        keepalive = settings.SSE_KEEPALIVE_SEC
+        last_sent = time.monotonic()
+        try:
+            while True:
+                waiter[1].clear()  # antes del snapshot: un push posterior no se pierde
+                if self._blocking_snapshot:
+                    evts, status, next_id = await asyncio.to_thread(self._snapshot, session_id, last_idx)
+                else:
+                    evts, status, next_id = self._snapshot(session_id, last_idx)
+
+                # Emitir eventos pendientes
+                for i, e in evts:
+                    yield (
+                        f"id: {i}\n"
+                        f"data: {e['ts']}|{e['level']}|{e['message']}\n\n"
+                    )
+                    last_sent = time.monotonic()
+                    last_idx = i + 1
+                last_idx = max(last_idx, next_id)
+
+                # Estado final
+                if status in ("done", "error", "cancelled"):
+                    yield f"id: {last_idx}\n" f"data: status|{status}\n\n"
+                    break
+
+                # Espera notificación (o sondeo del backend); ping si no hubo actividad
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), timeout=self._poll_sec or keepalive)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - last_sent >= keepalive:
+                        yield ": ping\n\n"
+                        last_sent = time.monotonic()
+        finally:
+            metrics.SSE_SUBSCRIBERS.dec()
+            with self._waiters_lock:
+                ws = self._waiters.get(session_id)
+                if ws is not None:
+                    ws.discard(waiter)
+                    if not ws:
+                        del self._waiters[session_id]
+
+class ProgressBus(_BusBase):
+    """Bus en memoria del proceso: ring buffer acotado (PROGRESS_MAX_EVENTS) por sesión."""
+    def __init__(self, max_events: Optional[int] = None):
+        super().__init__(max_events)
         self._state: Dict[str, Dict] = {}
         self._lock = Lock()
 
+    def _new_state(self) -> Dict:
+        return {"events": deque(maxlen=self._max_events), "next_id": 0, "status": "created"}
+
     def init(self, session_id: str):
         with self._lock:
-            self._state[session_id] = {"events": [], "status": "created"}
+            self._state[session_id] = self._new_state()
 
-    def push(self, session_id: str, level: str, message: str):
-        evt = {"ts": time.time(), "level": level, "message": message}
+    def _append(self, session_id: str, evt: Dict):
+        key = evt["key"]
         with self._lock:
-            self._state[session_id]["events"].append(evt)
+            st = self._state.get(session_id)
+            if st is None:
+                st = self._state[session_id] = self._new_state()
+            events = st["events"]
+            if key is not None and events and events[-1][1]["key"] == key:
+                events.pop()
+            events.append((st["next_id"], evt))
+            st["next_id"] += 1
 
     def status(self, session_id: str, status: str):
         with self._lock:
-            if session_id in self._state:
-                self._state[session_id]["status"] = status
+            if session_id not in self._state:
+                return
+            self._state[session_id]["status"] = status
+        self._notify(session_id)
 
     def get_status(self, session_id: str) -> str:
         with self._lock:
             return self._state.get(session_id, {}).get("status", "unknown")
 
-    def stream(self, session_id: str, start_from: int = 0):
-        """
-        Envía eventos desde start_from (índice del último evento visto + 1).
-        Incluye 'id: <n>' para que el cliente pueda reconectar con 'from=<lastId>'.
-        """
-        last_idx = max(0, int(start_from))
-        while True:
-            with self._lock:
-                evts = self._state.get(session_id, {}).get("events", [])
-                status = self._state.get(session_id, {}).get("status", "unknown")
-
-            # Emitir eventos pendientes
-            while last_idx < len(evts):
-                e = evts[last_idx]
-                yield (
-                    f"id: {last_idx}\n"
-                    f"data: {e['ts']}|{e['level']}|{e['message']}\n\n"
-                )
-                last_idx += 1
-
-            # Estado final
-            if status in ("done", "error"):
-                yield f"id: {last_idx}\n" f"data: status|{status}\n\n"
-                break
-
-            # Ping preventivo (mantiene viva la conexión)
-            yield ": ping\n\n"
-            time.sleep(1.0)
-
-bus = ProgressBus()
+    def claim(self, session_id: str, status: str = "running", active: Tuple[str, ...] = ACTIVE_STATUSES) -> bool:
+        """Pasa la sesión a `status` salvo que ya esté en él o en uno de `active` (check-and-set atómico)."""
+        with self._lock:
+            st = self._state.get(session_id)
+            if st is None:
+                st = self._state[session_id] = self._new_state()
+            if st["status"] == status or st["status"] in active:
+                return False
+            st["status"] = status
+        self._notify(session_id)
+        return True
+
+    def _snapshot(self, session_id: str, start_from: int):
+        with self._lock:
+            st = self._state.get(session_id)
+            if st is None:
+                return [], "unknown", start_from
+            evts = [(i, e) for i, e in st["events"] if i >= start_from]
+            return evts, st["status"], st["next_id"]
+
+class SqliteProgressBus(_BusBase):
+    """
+    Bus compartido entre procesos (uvicorn --workers N) y persistente entre
+    reinicios: SQLite en modo WAL bajo DATA_DIR. Las escrituras locales despiertan
+    a los suscriptores al instante; las de otros procesos se ven por sondeo
+    (PROGRESS_POLL_SEC), una consulta por rango sobre la clave (session_id, id).
+    """
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        " session_id TEXT PRIMARY KEY, status TEXT NOT NULL, next_id INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS events ("
+        " session_id TEXT NOT NULL, id INTEGER NOT NULL, ts REAL NOT NULL,"
+        " level TEXT NOT NULL, message TEXT NOT NULL, key TEXT,"
+        " PRIMARY KEY (session_id, id)) WITHOUT ROWID",
+    )
+
+    _blocking_snapshot = True  # sqlite3 con timeout=30: nunca en el event loop
+
+    def __init__(self, path: str, max_events: Optional[int] = None):
+        super().__init__(max_events)
+        self.path = path
+        self._poll_sec = settings.PROGRESS_POLL_SEC
+        self._local = local()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for stmt in self._SCHEMA:
+                conn.execute(stmt)
+            self._local.conn = conn
+        return conn
+
+    def _ensure_session(self, db: sqlite3.Connection, session_id: str):
+        db.execute("INSERT OR IGNORE INTO sessions (session_id, status, next_id) VALUES (?, 'created', 0)",
+                   (session_id,))
+
+    def init(self, session_id: str):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+            db.execute("INSERT OR REPLACE INTO sessions (session_id, status, next_id) VALUES (?, 'created', 0)",
+                       (session_id,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _append(self, session_id: str, evt: Dict):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._ensure_session(db, session_id)
+            next_id = db.execute("SELECT next_id FROM sessions WHERE session_id = ?", (session_id,)).fetchone()[0]
+            if evt["key"] is not None:
+                last = db.execute("SELECT id, key FROM events WHERE session_id = ? ORDER BY id DESC LIMIT 1",
+                                  (session_id,)).fetchone()
+                if last is not None and last[1] == evt["key"]:
+                    db.execute("DELETE FROM events WHERE session_id = ? AND id = ?", (session_id, last[0]))
+            db.execute("INSERT INTO events (session_id, id, ts, level, message, key) VALUES (?, ?, ?, ?, ?, ?)",
+                       (session_id, next_id, evt["ts"], evt["level"], evt["message"], evt["key"]))
+            db.execute("UPDATE sessions SET next_id = ? WHERE session_id = ?", (next_id + 1, session_id))
+            # Ring buffer: conserva como mucho los últimos PROGRESS_MAX_EVENTS ids
+            db.execute("DELETE FROM events WHERE session_id = ? AND id <= ?",
+                       (session_id, next_id - self._max_events))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def status(self, session_id: str, status: str):
+        self._db().execute("UPDATE sessions SET status = ? WHERE session_id = ?", (status, session_id))
+        self._notify(session_id)
+
+    def get_status(self, session_id: str) -> str:
+        row = self._db().execute("SELECT status FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else "unknown"
+
+    def claim(self, session_id: str, status: str = "running", active: Tuple[str, ...] = ACTIVE_STATUSES) -> bool:
+        """Pasa la sesión a `status` salvo que ya esté en él o en uno de `active`; atómico entre procesos."""
+        blocked = tuple({status, *active})
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._ensure_session(db, session_id)
+            cur = db.execute("UPDATE sessions SET status = ? WHERE session_id = ? AND status NOT IN (%s)"
+                             % ",".join("?" * len(blocked)), (status, session_id, *blocked))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if cur.rowcount:
+            self._notify(session_id)
+        return cur.rowcount > 0
+
+    def _snapshot(self, session_id: str, start_from: int):
+        db = self._db()
+        db.execute("BEGIN")  # lectura consistente (sessions + events) en WAL
+        try:
+            row = db.execute("SELECT status, next_id FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return [], "unknown", start_from
+            evts = [(i, {"ts": ts, "level": lv, "message": msg})
+                    for i, ts, lv, msg in db.execute(
+                        "SELECT id, ts, level, message FROM events WHERE session_id = ? AND id >= ? ORDER BY id",
+                        (session_id, start_from))]
+            return evts, row[0], row[1]
+        finally:
+            db.execute("COMMIT")
+
+def _make_bus() -> _BusBase:
+    if settings.PROGRESS_BACKEND == "sqlite":
+        return SqliteProgressBus(os.path.join(settings.DATA_DIR, "progress.db"))
+    return ProgressBus()
+
+bus = _make_bus()
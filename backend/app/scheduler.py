@@ -0,0 +1,187 @@
+import itertools, os, threading, time
+from typing import Callable, Dict, List, Optional
+from .config import settings
+from .progress import bus
+from . import metrics
+from .storage import session_paths
+
+# === Cancelación cooperativa ===
+# La marca es un archivo en el directorio de la sesión: la ven también los
+# procesos del pool de parseo y otros workers de uvicorn.
+
+class JobCancelled(Exception):
+    """El trabajo de la sesión fue cancelado (POST /sessions/{id}/cancel)."""
+
+def cancel_requested(session_id: str) -> bool:
+    return os.path.exists(session_paths(session_id)["cancel"])
+
+CANCEL_CHECK_SEC = 0.25  # los puntos de corte consultan la marca como mucho cada este intervalo
+_next_check: Dict[str, float] = {}
+
+def check_cancelled(session_id: str) -> None:
+    """Punto de corte: entre filas (cada PROGRESS_CHECK_MASK), tablas, secciones o lotes _bulk."""
+    now = time.monotonic()
+    if now < _next_check.get(session_id, 0.0):
+        return
+    _next_check[session_id] = now + CANCEL_CHECK_SEC
+    if cancel_requested(session_id):
+        raise JobCancelled("cancelado por el usuario")
+
+def request_cancel(session_id: str) -> None:
+    path = session_paths(session_id)["cancel"]
+    with open(path, "a", encoding="utf-8"):
+        pass
+
+def clear_cancel(session_id: str) -> None:
+    try:
+        os.remove(session_paths(session_id)["cancel"])
+    except OSError:
+        pass
+
+# === Scheduler ===
+
+class _Job:
+    __slots__ = ("seq", "session_id", "tenant", "kind", "fn", "priority", "submitted")
+
+    def __init__(self, seq: int, session_id: str, tenant: str, kind: str, fn: Callable[[], None], priority: int):
+        self.seq = seq
+        self.session_id = session_id
+        self.tenant = tenant
+        self.kind = kind
+        self.fn = fn
+        self.priority = priority
+        self.submitted = time.time()
+
+    def info(self) -> Dict:
+        return {"session_id": self.session_id, "tenant": self.tenant, "kind": self.kind,
+                "priority": self.priority, "submitted": self.submitted}
+
+class Scheduler:
+    """
+    Cola global de trabajos (parseo / ingesta) con SCHEDULER_WORKERS hilos.
+    Orden de despacho: mayor prioridad primero; a igual prioridad, el tenant
+    (cliente) con menos trabajos en curso y que lleva más tiempo sin despachar,
+    y por último orden de llegada. SCHEDULER_TENANT_MAX (0 = sin tope) limita
+    los trabajos simultáneos de un mismo tenant. La posición en cola se publica
+    en el bus como 'progress|cola|<tipo>|posicion=N|en_cola=M'.
+    La cola es por proceso: con varios workers de uvicorn cada uno tiene la suya.
+    """
+    def __init__(self, workers: Optional[int] = None, tenant_max: Optional[int] = None):
+        self.workers = max(1, workers or settings.SCHEDULER_WORKERS)
+        self.tenant_max = settings.SCHEDULER_TENANT_MAX if tenant_max is None else tenant_max
+        self._cond = threading.Condition()
+        self._queue: List[_Job] = []
+        self._running: Dict[str, _Job] = {}
+        self._tenant_running: Dict[str, int] = {}
+        self._last_start: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_threads(self) -> None:
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._loop, name=f"sched-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _key(self, job: _Job):
+        return (-job.priority, self._tenant_running.get(job.tenant, 0),
+                self._last_start.get(job.tenant, 0.0), job.seq)
+
+    def _eligible(self, job: _Job) -> bool:
+        return self.tenant_max <= 0 or self._tenant_running.get(job.tenant, 0) < self.tenant_max
+
+    def _publish_positions_locked(self) -> None:
+        metrics.JOBS_QUEUED.set(len(self._queue))
+        metrics.JOBS_RUNNING.set(len(self._running))
+        ordered = sorted(self._queue, key=self._key)
+        for pos, job in enumerate(ordered, 1):
+            bus.push(job.session_id, "info",
+                     f"progress|cola|{job.kind}|posicion={pos}|en_cola={len(ordered)}|en_curso={len(self._running)}")
+
+    def submit(self, session_id: str, tenant: str, kind: str, fn: Callable[[], None], priority: int = 0) -> int:
+        """Encola fn(); devuelve la posición inicial en la cola (0 si arranca de inmediato)."""
+        with self._cond:
+            self._ensure_threads()
+            job = _Job(next(self._seq), session_id, tenant, kind, fn, priority)
+            self._queue.append(job)
+            free = len(self._running) < self.workers and self._eligible(job)
+            position = 0 if free else sorted(self._queue, key=self._key).index(job) + 1
+            if not free:
+                self._publish_positions_locked()
+            metrics.JOBS_QUEUED.set(len(self._queue))
+            self._cond.notify_all()
+        return position
+
+    def cancel(self, session_id: str) -> Optional[str]:
+        """
+        Quita el trabajo de la cola ('queued') o marca la cancelación para que el
+        trabajo en curso se detenga en su próximo punto de corte ('running').
+        """
+        with self._cond:
+            for job in self._queue:
+                if job.session_id == session_id:
+                    self._queue.remove(job)
+                    self._publish_positions_locked()
+                    break
+            else:
+                job = None
+        if job is not None:
+            bus.push(session_id, "warning", f"Trabajo {job.kind} cancelado antes de iniciar")
+            bus.status(session_id, "cancelled")
+            return "queued"
+        if bus.get_status(session_id) in ("queued", "running"):
+            request_cancel(session_id)
+            bus.push(session_id, "warning", "Cancelación solicitada; se detendrá en el próximo punto seguro")
+            return "running"
+        return None
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {"workers": self.workers,
+                    "running": [j.info() for j in self._running.values()],
+                    "queued": [j.info() for j in sorted(self._queue, key=self._key)]}
+
+    def _next_locked(self) -> Optional[_Job]:
+        if len(self._running) >= self.workers:
+            return None
+        candidates = [j for j in self._queue if self._eligible(j)]
+        return min(candidates, key=self._key) if candidates else None
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_locked()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_locked()
+                self._queue.remove(job)
+                self._running[job.session_id] = job
+                self._tenant_running[job.tenant] = self._tenant_running.get(job.tenant, 0) + 1
+                self._last_start[job.tenant] = time.time()
+                self._publish_positions_locked()
+            started = time.time()
+            metrics.JOB_WAIT_SECONDS.observe(started - job.submitted, job.kind)
+            try:
+                if cancel_requested(job.session_id):
+                    # Cancelado desde otro proceso mientras esperaba
+                    bus.push(job.session_id, "warning", f"Trabajo {job.kind} cancelado antes de iniciar")
+                    bus.status(job.session_id, "cancelled")
+                else:
+                    bus.push(job.session_id, "info",
+                             f"Iniciando {job.kind} (esperó {time.time() - job.submitted:.1f}s en cola)")
+                    bus.status(job.session_id, "running")
+                    job.fn()
+            except Exception as e:  # fn ya reporta sus errores; esto no debe tumbar el hilo
+                bus.push(job.session_id, "error", f"Fallo en {job.kind}: {e}")
+                bus.status(job.session_id, "error")
+            finally:
+                clear_cancel(job.session_id)
+                metrics.JOB_SECONDS.observe(time.time() - started, job.kind)
+                metrics.JOBS.inc(1, job.kind, bus.get_status(job.session_id))
+                with self._cond:
+                    self._running.pop(job.session_id, None)
+                    self._tenant_running[job.tenant] -= 1
+                    metrics.JOBS_RUNNING.set(len(self._running))
+                    self._cond.notify_all()
+
+scheduler = Scheduler()
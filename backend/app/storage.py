@@ -1,5 +1,6 @@
-import os, uuid, re
-from typing import Tuple
+import os, uuid, re, json, fcntl, hashlib, threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
 from .config import settings
 
 os.makedirs(settings.DATA_DIR, exist_ok=True)
@@ -9,6 +10,8 @@ def new_session_dir() -> Tuple[str, str]:
     sdir = os.path.join(settings.DATA_DIR, sid)
     os.makedirs(os.path.join(sdir, "uploads"), exist_ok=True)
     os.makedirs(os.path.join(sdir, "outputs"), exist_ok=True)
+    os.makedirs(os.path.join(sdir, "index"), exist_ok=True)
+    os.makedirs(os.path.join(sdir, "upload_state"), exist_ok=True)
     return sid, sdir
 
 def session_paths(session_id: str):
@@ -17,7 +20,14 @@ def session_paths(session_id: str):
         "base": base,
         "uploads": os.path.join(base, "uploads"),
         "outputs": os.path.join(base, "outputs"),
+        "index": os.path.join(base, "index"),      # índices de secciones (sidecar por upload)
+        "upload_state": os.path.join(base, "upload_state"),  # rangos recibidos por upload_id
         "meta": os.path.join(base, "meta.txt"),
+        "ingest_checkpoint": os.path.join(base, "ingest_checkpoint.json"),
+        "results_zip": os.path.join(base, "results.zip"),  # caché (clave en results.zip.key)
+        "processed": os.path.join(base, "processed.json"),  # manifiesto de archivos ya procesados
+        "cancel": os.path.join(base, "cancel.flag"),  # marca de cancelación del trabajo en curso
+        "profile": os.path.join(base, "profile"),  # perfiles de trabajos (profile.pstats / profile.collapsed)
     }
 
 def sanitize_filename(name: str) -> str:
@@ -28,3 +38,147 @@ def open_chunk_file(tmp_path: str, total_size: int):
     if not os.path.exists(tmp_path):
         with open(tmp_path, "wb") as f:
             f.truncate(total_size)
+
+def pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    """Escritura posicional completa (pwrite puede escribir menos de lo pedido)."""
+    view = memoryview(data)
+    while view:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+
+# === Estado de uploads: rangos recibidos (inclusive) y checksums por chunk ===
+
+def _merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    out: List[List[int]] = []
+    for a, b in sorted(ranges + [[start, end]]):
+        if out and a <= out[-1][1] + 1:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+def missing_ranges(ranges: List[List[int]], total_size: int) -> List[List[int]]:
+    """Huecos (inclusive) de [0, total_size) no cubiertos por `ranges`."""
+    out: List[List[int]] = []
+    pos = 0
+    for a, b in ranges:
+        if a > pos:
+            out.append([pos, a - 1])
+        pos = max(pos, b + 1)
+    if pos < total_size:
+        out.append([pos, total_size - 1])
+    return out
+
+def _state_path(state_dir: str, upload_id: str) -> str:
+    return os.path.join(state_dir, sanitize_filename(upload_id) + ".json")
+
+@contextmanager
+def _locked_state(state_dir: str, upload_id: str):
+    """Lectura-modificación-escritura del estado bajo flock (válido entre workers)."""
+    os.makedirs(state_dir, exist_ok=True)
+    path = _state_path(state_dir, upload_id)
+    with open(path + ".lock", "a") as lk:
+        fcntl.flock(lk, fcntl.LOCK_EX)
+        try:
+            state = load_upload_state(state_dir, upload_id) or {}
+            yield state
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, path)
+        finally:
+            fcntl.flock(lk, fcntl.LOCK_UN)
+
+def load_upload_state(state_dir: str, upload_id: str) -> Optional[Dict]:
+    try:
+        with open(_state_path(state_dir, upload_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def init_upload_state(state_dir: str, upload_id: str, filename: str, total_size: int) -> None:
+    with _locked_state(state_dir, upload_id) as st:
+        st.update({"filename": filename, "total_size": total_size, "ranges": [], "chunks": {}})
+
+def record_chunk(state_dir: str, upload_id: str, start: int, end: int, sha256: Optional[str] = None,
+                 filename: Optional[str] = None, total_size: Optional[int] = None) -> Dict:
+    """
+    Marca [start, end] como recibido junto con el SHA-256 del chunk. Si el estado
+    no existe (chunk sin /upload/init), se crea con el filename / total_size del chunk.
+    """
+    with _locked_state(state_dir, upload_id) as st:
+        if filename is not None:
+            st.setdefault("filename", filename)
+        if total_size is not None:
+            st.setdefault("total_size", total_size)
+        if any(a <= end and start <= b for a, b in st.get("ranges", [])):
+            st["rewritten"] = True  # bytes ya recibidos sobrescritos: el hash incremental no vale
+        st["ranges"] = _merge_range(st.get("ranges", []), start, end)
+        if sha256:
+            st.setdefault("chunks", {})[str(start)] = {"end": end, "sha256": sha256}
+        return st
+
+# === Identidad de contenido de un upload ===
+
+# SHA-256 incremental por upload (en memoria del proceso): avanza sobre el prefijo
+# contiguo ya recibido a medida que llegan los chunks, leyendo del .part solo los
+# bytes nuevos (recién escritos: page cache). Así /upload/complete no relee el
+# archivo; si el hash no llegó al final (chunks atendidos por otro proceso, reinicio,
+# rangos reescritos), no se registra y cache.content_id lo calcula en el trabajo.
+_running_hashes: Dict[str, Dict] = {}
+_running_lock = threading.Lock()
+
+def advance_upload_hash(tmp_path: str, ranges: List[List[int]]) -> None:
+    with _running_lock:
+        rh = _running_hashes.setdefault(tmp_path, {"h": hashlib.sha256(), "offset": 0, "lock": threading.Lock()})
+    with rh["lock"]:
+        if not ranges or ranges[0][0] != 0 or ranges[0][1] + 1 <= rh["offset"]:
+            return
+        end = ranges[0][1] + 1
+        with open(tmp_path, "rb") as f:
+            f.seek(rh["offset"])
+            while rh["offset"] < end:
+                block = f.read(min(1024 * 1024, end - rh["offset"]))
+                if not block:
+                    return
+                rh["h"].update(block)
+                rh["offset"] += len(block)
+
+def finish_upload_hash(tmp_path: str, total_size: int) -> Optional[str]:
+    """SHA-256 del upload completo si el hash incremental cubrió todo el archivo (si no, None)."""
+    with _running_lock:
+        rh = _running_hashes.pop(tmp_path, None)
+    if rh is None:
+        return None
+    with rh["lock"]:
+        return rh["h"].hexdigest() if rh["offset"] == total_size else None
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024*1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# === Manifiesto de procesamiento incremental ===
+
+def file_identity(path: str) -> Dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+def load_processed(path: str) -> Dict:
+    """{"files": {nombre: {size, mtime, csv, counts}}, "outputs": {bucket: bytes}}."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            m = json.load(f)
+        m.setdefault("files", {}); m.setdefault("outputs", {})
+        return m
+    except (OSError, ValueError):
+        return {"files": {}, "outputs": {}}
+
+def save_processed(path: str, manifest: Dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
@@ -0,0 +1,155 @@
+import glob, json, os, time
+from typing import Callable, Dict, List, Optional
+from .columnar import part_name, part_report
+
+# Agregados en una sola pasada (OUTPUT_SUMMARY), calculados mientras se escriben las filas:
+#   T1 → por control (Control ID): filas y suma de Passed / Failed / Error
+#   T2 → conteo por Status, total y por host (Host IP) y por sistema operativo
+# La memoria es un contador por clave distinta, no por fila. Cada reporte deja
+# outputs/.summary/<parte>.json y la sesión los suma en outputs/summary.json.
+SUMMARY_FILENAME = "summary.json"
+SUMMARY_DIRNAME = ".summary"
+
+_T1_COUNTS = ("passed", "failed", "error")
+
+def _count(v: str) -> int:
+    try:
+        return int(v)
+    except ValueError:
+        try:
+            return int(float(v.rstrip("%")))
+        except ValueError:
+            return 0
+
+def _col(cols: Dict[str, int], *names: str) -> Optional[int]:
+    for n in names:
+        if n in cols:
+            return cols[n]
+    return None
+
+def _merge(dst: Dict, src: Dict) -> Dict:
+    for k, v in src.items():
+        if isinstance(v, dict):
+            _merge(dst.setdefault(k, {}), v)
+        elif isinstance(v, int):
+            dst[k] = dst.get(k, 0) + v
+        else:
+            dst.setdefault(k, v)  # p.ej. el nombre del control: el primero visto
+    return dst
+
+class ReportSummary:
+    """Agregados por bucket de un reporte (o de una sección de la caché)."""
+    def __init__(self, buckets: Optional[Dict] = None):
+        self.buckets: Dict[str, Dict] = buckets if buckets is not None else {}
+
+    def adder(self, bucket: str, header: List[str]) -> Callable[[List[str]], None]:
+        """Función fila → agregados para una tabla con `header` (columnas resueltas una vez)."""
+        cols = {h.strip().lower(): i for i, h in enumerate(header)}
+        b = self.buckets.setdefault(bucket, {"rows": 0})
+        if bucket.startswith("t1_"):
+            key_i, name_i = _col(cols, "control id", "control"), _col(cols, "control")
+            nums = [(k, cols[k]) for k in _T1_COUNTS if k in cols]
+            controls = b.setdefault("controls", {})
+
+            def add(row: List[str]) -> None:
+                b["rows"] += 1
+                key = row[key_i] if key_i is not None else ""
+                c = controls.get(key)
+                if c is None:
+                    c = controls[key] = {"control": row[name_i] if name_i is not None else key,
+                                         "rows": 0, **{k: 0 for k in _T1_COUNTS}}
+                c["rows"] += 1
+                for k, i in nums:
+                    if row[i]:
+                        c[k] += _count(row[i])
+            return add
+
+        host_i, os_i = _col(cols, "host ip", "dns hostname"), _col(cols, "operating system")
+        status_i = _col(cols, "status")
+        status, hosts, oses = b.setdefault("status", {}), b.setdefault("hosts", {}), b.setdefault("os", {})
+
+        def add(row: List[str]) -> None:
+            b["rows"] += 1
+            st = row[status_i] if status_i is not None else ""
+            status[st] = status.get(st, 0) + 1
+            for key_i, by in ((host_i, hosts), (os_i, oses)):
+                if key_i is not None:
+                    d = by.get(row[key_i])
+                    if d is None:
+                        d = by[row[key_i]] = {}
+                    d[st] = d.get(st, 0) + 1
+        return add
+
+    def merge(self, buckets: Dict[str, Dict]) -> None:
+        _merge(self.buckets, buckets)
+
+# === Resumen de la sesión ===
+
+def summary_dir(outputs_dir: str) -> str:
+    return os.path.join(outputs_dir, SUMMARY_DIRNAME)
+
+def save_report_summary(outputs_dir: str, filepath: str, summary: ReportSummary) -> None:
+    """Guarda los agregados del reporte y recalcula outputs/summary.json."""
+    d = summary_dir(outputs_dir)
+    os.makedirs(d, exist_ok=True)
+    path = os.path.join(d, part_name(filepath).rsplit(".", 1)[0] + ".json")
+    _write_json(path, {"report": os.path.basename(filepath), "buckets": summary.buckets})
+    write_session_summary(outputs_dir)
+
+def remove_report_summaries(outputs_dir: str, keep_reports: Optional[set] = None) -> None:
+    """Borra los agregados de reportes fuera de `keep_reports` (None = todos) y recalcula summary.json."""
+    for p in glob.glob(os.path.join(summary_dir(outputs_dir), "*.json")):
+        if keep_reports is None or part_report(os.path.basename(p)) not in keep_reports:
+            os.remove(p)
+    write_session_summary(outputs_dir)
+
+def _write_json(path: str, data: Dict) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _finalize(buckets: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Tasas derivadas: pass_rate por control = Passed / (Passed + Failed + Error)."""
+    for b in buckets.values():
+        for c in b.get("controls", {}).values():
+            total = sum(c[k] for k in _T1_COUNTS)
+            c["pass_rate"] = round(c["passed"] / total, 4) if total else None
+    return buckets
+
+def write_session_summary(outputs_dir: str) -> None:
+    parts = sorted(glob.glob(os.path.join(summary_dir(outputs_dir), "*.json")))
+    path = os.path.join(outputs_dir, SUMMARY_FILENAME)
+    if not parts:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    total = ReportSummary()
+    for p in parts:
+        with open(p, "r", encoding="utf-8") as f:
+            total.merge(json.load(f)["buckets"])
+    _write_json(path, {"reports": len(parts), "updated": time.time(), "buckets": _finalize(total.buckets)})
+
+def _top(by: Dict[str, Dict], limit: int, weight: Callable[[Dict], int]) -> Dict[str, Dict]:
+    return dict(sorted(by.items(), key=lambda kv: -weight(kv[1]))[:limit])
+
+def load_summary(outputs_dir: str, bucket: Optional[str] = None, limit: Optional[int] = None) -> Optional[Dict]:
+    """
+    summary.json de la sesión (None si no hay). `bucket` filtra; `limit` deja los
+    N controles con más fallos y los N hosts / sistemas con más filas.
+    """
+    try:
+        with open(os.path.join(outputs_dir, SUMMARY_FILENAME), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if bucket is not None:
+        data["buckets"] = {k: v for k, v in data["buckets"].items() if k == bucket}
+    if limit is not None:
+        for b in data["buckets"].values():
+            if "controls" in b:
+                b["controls"] = _top(b["controls"], limit, lambda c: c["failed"] + c["error"])
+            for k in ("hosts", "os"):
+                if k in b:
+                    b[k] = _top(b[k], limit, lambda d: sum(d.values()))
+    return data
@@ -0,0 +1 @@
+"""Benchmarks del backend (python -m bench --help desde backend/)."""
@@ -0,0 +1,166 @@
+"""
+Benchmarks del backend: reporte sintético → parseo, subida chunked e ingesta
+contra un _bulk local. Los resultados quedan en JSON y se comparan con una base.
+
+    cd backend
+    python -m bench generate /tmp/reporte.csv --size-mb 64 --adjusted --dc
+    python -m bench run --size-mb 64 --repeat 3 --out bench/results/base.json
+    python -m bench run --size-mb 64 --baseline bench/results/base.json   # exit 1 si hay regresión
+    python -m bench compare bench/results/nuevo.json bench/results/base.json --tolerance 0.10
+"""
+import argparse, gzip, json, os, platform, shutil, subprocess, sys, tempfile, time
+from typing import Dict, List
+from .fake_es import FakeES
+from .generator import generate_report
+from .scenarios import SCENARIOS, run_scenario
+
+# Métricas comparadas: +1 = más es mejor, -1 = menos es mejor. El resto es informativo.
+METRICS = {"rows_per_s": 1, "mb_per_s": 1, "docs_per_s": 1, "seconds": -1, "peak_rss_mb": -1}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def _gen_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--size-mb", type=float, default=32, help="Tamaño aproximado del reporte")
+    p.add_argument("--t1-sections", type=int, default=2)
+    p.add_argument("--t2-sections", type=int, default=4)
+    p.add_argument("--controls", type=int, default=300)
+    p.add_argument("--hosts", type=int, default=2000)
+    p.add_argument("--adjusted", action="store_true", help="Cabecera AJUSTADA (buckets *_ajustada)")
+    p.add_argument("--dc", action="store_true", help="Cabecera DOMAIN CONTROLLER")
+    p.add_argument("--noise-lines", type=int, default=3, help="Líneas de log entre secciones")
+    p.add_argument("--malformed-every", type=int, default=50000, help="Una fila malformada cada N (0 = ninguna)")
+    p.add_argument("--seed", type=int, default=1)
+
+def _gen_kwargs(args: argparse.Namespace) -> Dict:
+    return {"size_mb": args.size_mb, "t1_sections": args.t1_sections, "t2_sections": args.t2_sections,
+            "controls": args.controls, "hosts": args.hosts, "adjusted": args.adjusted, "dc": args.dc,
+            "noise_lines": args.noise_lines, "malformed_every": args.malformed_every, "seed": args.seed}
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks del backend")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    g = sub.add_parser("generate", help="Escribe un reporte sintético")
+    g.add_argument("path")
+    g.add_argument("--gzip", action="store_true")
+    _gen_args(g)
+
+    r = sub.add_parser("run", help="Corre los escenarios y guarda el JSON de resultados")
+    _gen_args(r)
+    r.add_argument("--scenarios", default=",".join(SCENARIOS),
+                   help=f"Separados por coma (default: todos: {','.join(SCENARIOS)})")
+    r.add_argument("--repeat", type=int, default=1, help="Corridas por escenario; se queda la más rápida")
+    r.add_argument("--chunk-mb", type=int, default=8, help="Tamaño de chunk en el escenario upload")
+    r.add_argument("--es-reject-rate", type=float, default=0.0, help="Fracción de items 429 del _bulk local")
+    r.add_argument("--work", default=None, help="Directorio de trabajo (default: temporal)")
+    r.add_argument("--out", default=None, help="JSON de resultados (default: bench/results/<fecha>.json)")
+    r.add_argument("--baseline", default=None, help="Compara contra este JSON al terminar")
+    r.add_argument("--tolerance", type=float, default=0.10)
+
+    c = sub.add_parser("compare", help="Compara dos JSON de resultados")
+    c.add_argument("current")
+    c.add_argument("baseline")
+    c.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento relativo admitido (0.10 = 10%%)")
+    return ap
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def _meta(params: Dict) -> Dict:
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_rev": _git_rev(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "params": params}
+
+def _run(args: argparse.Namespace) -> int:
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"Escenarios desconocidos: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    work = args.work or tempfile.mkdtemp(prefix="qualys-bench-")
+    os.makedirs(work, exist_ok=True)
+    try:
+        csv_path = os.path.join(work, "report.csv")
+        t0 = time.time()
+        gen = generate_report(csv_path, **_gen_kwargs(args))
+        inputs = {"csv": csv_path, "bytes": os.path.getsize(csv_path), "chunk_mb": args.chunk_mb}
+        if "parse_gzip" in names:
+            inputs["gz"] = csv_path + ".gz"
+            with open(csv_path, "rb") as src, gzip.open(inputs["gz"], "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        print(f"Reporte: {inputs['bytes'] / 1024 / 1024:.1f} MB, {gen['t1_rows']} filas T1, "
+              f"{gen['t2_rows']} filas T2 ({time.time() - t0:.1f}s)", file=sys.stderr)
+
+        env = {"PARSE_CACHE": "false", "PROGRESS_BACKEND": "memory", "ES_API_KEY": "",
+               "ES_USERNAME": "", "ES_PASSWORD": "", "ES_BULK_BACKOFF_SEC": "0.01"}
+        results: Dict[str, Dict] = {}
+        with FakeES(reject_rate=args.es_reject_rate, seed=args.seed) as es:
+            env["ES_BASE_URL"] = es.url
+            for name in names:
+                scenario_env = {**env, "PARSE_CACHE": "true"} if name == "parse_cache_hit" else env
+                results[name] = run_scenario(name, work, inputs, scenario_env, repeat=max(1, args.repeat))
+                print(f"{name}: " + ", ".join(f"{k}={v}" for k, v in results[name].items()), file=sys.stderr)
+    finally:
+        if not args.work:
+            shutil.rmtree(work, ignore_errors=True)
+
+    params = {**_gen_kwargs(args), "report_bytes": inputs["bytes"], "chunk_mb": args.chunk_mb,
+              "es_reject_rate": args.es_reject_rate, "repeat": args.repeat, "generated": gen}
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"meta": _meta(params), "scenarios": results}, f, indent=2)
+    print(f"Resultados: {out}", file=sys.stderr)
+    if args.baseline:
+        return _compare(out, args.baseline, args.tolerance)
+    return 0
+
+def compare_results(current: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Una fila por (escenario, métrica) presente en ambos; regression=True si empeoró más que `tolerance`."""
+    rows = []
+    for name, cur in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        for metric, sign in METRICS.items():
+            if metric not in cur or metric not in base or not base[metric]:
+                continue
+            change = (cur[metric] - base[metric]) / base[metric]
+            rows.append({"scenario": name, "metric": metric, "baseline": base[metric], "current": cur[metric],
+                         "change": round(change, 4), "regression": change * sign < -tolerance})
+    return rows
+
+def _compare(current_path: str, baseline_path: str, tolerance: float) -> int:
+    with open(current_path, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    cp, bp = current["meta"]["params"], baseline["meta"]["params"]
+    if cp.get("report_bytes") != bp.get("report_bytes"):
+        print("Aviso: los reportes de las dos corridas no tienen el mismo tamaño", file=sys.stderr)
+    rows = compare_results(current, baseline, tolerance)
+    for r in rows:
+        flag = "REGRESIÓN" if r["regression"] else "ok"
+        print(f"{r['scenario']:<16} {r['metric']:<12} {r['baseline']:>12} → {r['current']:<12} "
+              f"{r['change']:+.1%}  {flag}")
+    bad = [r for r in rows if r["regression"]]
+    if bad:
+        print(f"{len(bad)} métricas empeoraron más de {tolerance:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.cmd == "generate":
+        stats = generate_report(args.path, gzip_output=args.gzip, **_gen_kwargs(args))
+        print(json.dumps(stats))
+        return 0
+    if args.cmd == "run":
+        return _run(args)
+    return _compare(args.current, args.baseline, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Servidor `_bulk` local que reemplaza a Elasticsearch en los benchmarks.
+
+Responde lo mínimo que usa app.elastic (HEAD/PUT de índices y templates,
+_settings, _bulk con un item por acción). Con `reject_rate` devuelve una
+fracción de items 429 para ejercitar reintentos y el AIMD de BulkEngine.
+"""
+import json, random, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeES"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, obj) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        if n:
+            return self.rfile.read(n)
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            out = bytearray()
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(out)
+                out += self.rfile.read(size)
+                self.rfile.readline()
+        return b""
+
+    def do_HEAD(self):
+        self.send_response(404)  # índice / template inexistente: el cliente lo crea
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.endswith("/_settings"):
+            idx = self.path.strip("/").split("/")[0]
+            return self._send(200, {idx: {"settings": {"index": {"refresh_interval": "1s", "number_of_replicas": "1"}}}})
+        self._send(200, {})
+
+    def do_PUT(self):
+        self._body()
+        self._send(200, {"acknowledged": True})
+
+    def do_DELETE(self):
+        self._send(200, {"acknowledged": True})
+
+    def do_POST(self):
+        body = self._body()
+        if not self.path.endswith("/_bulk"):
+            return self._send(200, {"acknowledged": True})
+        srv = self.server
+        lines = body.split(b"\n")
+        items, errors, docs = [], False, 0
+        i = 0
+        while i < len(lines) - 1:
+            op = next(iter(json.loads(lines[i])))
+            if op == "delete":
+                items.append({op: {"status": 200}})
+                i += 1
+                continue
+            i += 2
+            if srv.reject_rate and srv.rng.random() < srv.reject_rate:
+                items.append({op: {"status": 429, "error": {"type": "es_rejected_execution_exception"}}})
+                errors = True
+            else:
+                items.append({op: {"status": 201}})
+                docs += 1
+        with srv.lock:
+            srv.stats["requests"] += 1
+            srv.stats["bytes"] += len(body)
+            srv.stats["docs"] += docs
+        self._send(200, {"took": 1, "errors": errors, "items": items})
+
+class FakeES(ThreadingHTTPServer):
+    """`with FakeES() as es:` levanta el servidor en un puerto libre; es.url es la base."""
+    daemon_threads = True
+
+    def __init__(self, reject_rate: float = 0.0, seed: int = 1):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.reject_rate = reject_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "bytes": 0, "docs": 0}
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self) -> "FakeES":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+        self.server_close()
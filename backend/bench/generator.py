@@ -0,0 +1,106 @@
+"""
+Generador de reportes Qualys sintéticos para los benchmarks.
+
+Reproduce la forma de un export real de Policy Compliance: cabecera con
+Cliente / AJUSTADA / DOMAIN CONTROLLER, bloques que el parser debe saltar
+(SUMMARY, HOST STATISTICS, ASSET TAGS), tablas T1 "Control Statistics" y T2
+"RESULTS", evidencias con comas, comillas y saltos de línea, líneas de log
+entre secciones y filas malformadas sueltas. Mismo `seed` → mismo archivo.
+"""
+import gzip, random
+from typing import Dict, Optional
+
+_OS = ["Windows Server 2019", "Windows Server 2022", "Windows 10 Enterprise", "Red Hat Enterprise Linux 8.6",
+       "Ubuntu 22.04 LTS", "CentOS 7.9", "Oracle Linux 8"]
+_TECH = ["Windows Server 2019", "Microsoft IIS 10", "RHEL 8", "Apache HTTP 2.4", "Oracle DB 19c"]
+_CRIT = ["URGENT", "CRITICAL", "SERIOUS", "MEDIUM", "MINIMAL"]
+_STATUS = ["Passed", "Failed", "Error", "Passed", "Passed", "Failed"]  # mayoría Passed, como en los reportes reales
+_NOISE = ["WARN  Connection reset while fetching host details", "INFO  Retrying scan segment 3/7",
+          "ERROR Timeout contacting scanner appliance", "DEBUG evidence truncated at 32768 chars"]
+
+T1_HEADER = ["Control ID", "Technology", "Control", "Criticality Label", "Passed", "Failed", "Error"]
+T2_HEADER = ["Host IP", "DNS Hostname", "NetBIOS Hostname", "Operating System", "Control ID",
+             "Technology", "Control", "Criticality Label", "Status", "Evidence"]
+
+def _q(v) -> str:
+    return '"' + str(v).replace('"', '""') + '"'
+
+def _line(cells) -> str:
+    return ",".join(_q(c) for c in cells) + "\n"
+
+def generate_report(
+    path: str,
+    size_mb: float = 16,
+    t1_sections: int = 2,
+    t2_sections: int = 4,
+    controls: int = 300,
+    hosts: int = 2000,
+    adjusted: bool = False,
+    dc: bool = False,
+    cliente: Optional[str] = "BENCH",
+    noise_lines: int = 3,
+    malformed_every: int = 50000,
+    multiline_every: int = 200,
+    gzip_output: bool = False,
+    seed: int = 1,
+) -> Dict[str, int]:
+    """
+    Escribe un reporte de ~size_mb MB en `path` (gzip con gzip_output) y
+    devuelve lo escrito: {"bytes", "t1_rows", "t2_rows", "malformed", "noise"}.
+    Las filas T2 se reparten entre t2_sections hasta alcanzar el tamaño.
+    """
+    r = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    stats = {"bytes": 0, "t1_rows": 0, "t2_rows": 0, "malformed": 0, "noise": 0}
+    opener = (lambda: gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=1)) if gzip_output \
+        else (lambda: open(path, "w", encoding="utf-8", newline="", buffering=1024 * 1024))
+    with opener() as f:
+        def w(s: str):
+            f.write(s)
+            stats["bytes"] += len(s)
+
+        w("\ufeff\"Qualys Policy Compliance Report\"\n")
+        if adjusted:
+            w("\"Reporte AJUSTADA\"\n")
+        if dc:
+            w("\"Servidores DOMAIN CONTROLLER\"\n")
+        if cliente:
+            w(f"Cliente: {cliente}\n")
+        w("\n\"SUMMARY\"\n\"Total Hosts\",\"Total Controls\"\n" + _line([hosts, controls]) + "\n")
+
+        for s in range(t1_sections):
+            w("\"Control Statistics (Percentage of Hosts Passed)\"\n" + _line(T1_HEADER))
+            for c in range(controls):
+                p = r.randint(0, hosts)
+                fl = r.randint(0, hosts - p)
+                w(_line([1000 + c, r.choice(_TECH), f"Control {c}: ensure setting, value {r.randint(1, 99)}",
+                         r.choice(_CRIT), p, fl, hosts - p - fl]))
+                stats["t1_rows"] += 1
+            w("\n\"HOST STATISTICS (Percentage of Controls Passed)\"\n\"Host IP\",\"Passed\"\n\"10.0.0.1\",\"90%\"\n\n")
+
+        per_section = max(1, (target - stats["bytes"]) // max(1, t2_sections))
+        for s in range(t2_sections):
+            w("\"RESULTS\"\n" + _line(T2_HEADER))
+            start = stats["bytes"]
+            i = 0
+            while stats["bytes"] - start < per_section:
+                h = r.randrange(hosts)
+                c = r.randrange(controls)
+                if malformed_every and i and not i % malformed_every:
+                    w(_line(["10.9.9.9", "corrupt row"]))  # menos columnas: el parser la descarta
+                    stats["malformed"] += 1
+                evidence = f"Expected: value >= {r.randint(1, 64)}; Current: {r.randint(0, 64)}, \"reg\\key\""
+                if multiline_every and not i % multiline_every:
+                    evidence += "\nHKLM\\SOFTWARE\\Policies, line 2"
+                w(_line([f"10.{s}.{h // 250}.{h % 250}", f"host{h}.corp.local", f"HOST{h}", _OS[h % len(_OS)],
+                         1000 + c, r.choice(_TECH), f"Control {c}: ensure setting", r.choice(_CRIT),
+                         r.choice(_STATUS), evidence]))
+                stats["t2_rows"] += 1
+                i += 1
+            w("\n")
+            for _ in range(noise_lines):  # ruido de logs entre secciones
+                w(r.choice(_NOISE) + "\n")
+                stats["noise"] += 1
+            w("\n")
+        w("\"ASSET TAGS\"\n\"Tag\",\"Hosts\"\n\"prod\",\"1200\"\n")
+    return stats
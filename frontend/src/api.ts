@@ -20,32 +20,49 @@ export async function initUpload(sessionId: string, filename: string, total: num
   return res.json();
 }
 
-export async function sendChunk(sessionId: string, uploadId: string, filename: string, total: number, start: number, end: number, blob: Blob) {
+export async function sendChunk(sessionId: string, uploadId: string, filename: string, total: number, start: number, end: number, blob: Blob, sha256?: string) {
+  const headers: Record<string, string> = { "Content-Range": `bytes ${start}-${end}/${total}` };
+  if (sha256) headers["X-Chunk-SHA256"] = sha256;
   const res = await fetch(`${API}/upload/chunk?session_id=${sessionId}&upload_id=${uploadId}&filename=${encodeURIComponent(filename)}&total_size=${total}`, {
     method: "PUT",
-    headers: { "Content-Range": `bytes ${start}-${end}/${total}` },
+    headers,
     body: blob
   });
   if (!res.ok) throw new Error("Fallo envío chunk");
   return res.json();
 }
 
+export async function uploadStatus(sessionId: string, uploadId: string): Promise<{ missing: [number, number][]; completed: boolean } | null> {
+  const res = await fetch(`${API}/upload/status?session_id=${sessionId}&upload_id=${uploadId}`);
+  if (res.status === 404) return null;
+  if (!res.ok) throw new Error("Fallo estado upload");
+  return res.json();
+}
+
 export async function completeUpload(sessionId: string, uploadId: string, filename: string) {
   const res = await fetch(`${API}/upload/complete?session_id=${sessionId}&upload_id=${uploadId}&filename=${encodeURIComponent(filename)}`, { method: "POST" });
   if (!res.ok) throw new Error("Fallo complete");
   return res.json();
 }
 
-export async function startProcess(sessionId: string) {
+// Por defecto solo procesa los archivos nuevos; rebuild=true reprocesa todo desde cero
+export async function startProcess(sessionId: string, rebuild = false) {
   const res = await fetch(`${API}/process`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ session_id: sessionId })
+    body: JSON.stringify({ session_id: sessionId, rebuild })
   });
   if (!res.ok) throw new Error("Fallo iniciar proceso");
   return res.json();
 }
 
+// Cancela el trabajo de la sesión: lo saca de la cola o lo detiene en el próximo punto seguro
+export async function cancelJob(sessionId: string) {
+  const res = await fetch(`${API}/sessions/${sessionId}/cancel`, { method: "POST" });
+  if (!res.ok) throw new Error("Nada que cancelar");
+  return res.json();
+}
+
 export function eventsUrl(sessionId: string, fromId?: string | number) {
   const base = `${API}/sessions/${sessionId}/events`;
   if (fromId !== undefined && fromId !== null && String(fromId).length > 0) {
@@ -54,14 +71,59 @@ export function eventsUrl(sessionId: string, fromId?: string | number) {
   return base;
 }
 
-export async function downloadZip(sessionId: string) {
-  const res = await fetch(`${API}/sessions/${sessionId}/results.zip`);
+export async function listOutputs(sessionId: string): Promise<{ name: string; size: number }[]> {
+  const res = await fetch(`${API}/sessions/${sessionId}/outputs`);
   if (!res.ok) throw new Error("Sin resultados aún");
-  const blob = await res.blob();
-  const url = URL.createObjectURL(blob);
+  return (await res.json()).files;
+}
+
+export function outputUrl(sessionId: string, name: string) {
+  return `${API}/sessions/${sessionId}/outputs/${encodeURIComponent(name)}`;
+}
+
+export type OutputPage = {
+  name: string;
+  columns: string[];
+  offset: number;
+  limit: number;
+  total_rows: number;
+  rows: string[][];
+  next_offset: number | null; // con filtros: desde dónde seguir buscando
+};
+
+// Página de un CSV de salida (índice fila→byte en el backend: cualquier página cuesta lo mismo)
+export async function previewOutput(sessionId: string, name: string, offset: number, limit: number, filters: string[] = []): Promise<OutputPage> {
+  const q = new URLSearchParams({ offset: String(offset), limit: String(limit) });
+  filters.forEach((f) => q.append("filter", f));
+  const res = await fetch(`${API}/sessions/${sessionId}/outputs/${encodeURIComponent(name)}/rows?${q}`);
+  if (!res.ok) throw new Error(res.status === 400 ? (await res.json()).detail : "Sin vista previa");
+  return res.json();
+}
+
+export type ControlSummary = { control: string; rows: number; passed: number; failed: number; error: number; pass_rate: number | null };
+export type StatusCounts = Record<string, number>;
+export type BucketSummary = {
+  rows: number;
+  controls?: Record<string, ControlSummary>;  // T1
+  status?: StatusCounts;                      // T2
+  hosts?: Record<string, StatusCounts>;
+  os?: Record<string, StatusCounts>;
+};
+export type SessionSummary = { reports: number; updated: number; buckets: Record<string, BucketSummary> };
+
+// Agregados calculados al parsear (T1 por control, T2 por host / sistema operativo); `limit` = top N
+export async function getSummary(sessionId: string, limit = 10): Promise<SessionSummary> {
+  const res = await fetch(`${API}/sessions/${sessionId}/summary?limit=${limit}`);
+  if (!res.ok) throw new Error("Sin agregados");
+  return res.json();
+}
+
+// Descarga directa del navegador (streaming a disco, reanudable), sin pasar por un Blob en memoria
+export async function downloadZip(sessionId: string) {
+  const files = await listOutputs(sessionId);
+  if (!files.length) throw new Error("Sin resultados aún");
   const a = document.createElement("a");
-  a.href = url; a.download = "results.zip"; a.click();
-  URL.revokeObjectURL(url);
+  a.href = `${API}/sessions/${sessionId}/results.zip`; a.download = "results.zip"; a.click();
 }
 
 export async function ingestES(sessionId: string, indices: {t1n:string,t1a:string,t2n:string,t2a:string}) {
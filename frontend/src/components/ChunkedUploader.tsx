@@ -1,22 +1,67 @@
 import React, { useState } from "react";
-import { initUpload, sendChunk, completeUpload } from "../api";
+import { initUpload, sendChunk, completeUpload, uploadStatus } from "../api";
 
 const CHUNK = 8 * 1024 * 1024; // 8MB
+const PARALLEL = 4;            // chunks en vuelo por archivo
+const RETRIES = 3;
+
+// Clave para reanudar un upload tras recargar la página o perder la conexión
+function resumeKey(sessionId: string, file: File) {
+  return `upload:${sessionId}:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function sha256Hex(blob: Blob): Promise<string | undefined> {
+  if (!window.crypto?.subtle) return undefined; // solo en contextos seguros (https/localhost)
+  const digest = await window.crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, "0")).join("");
+}
 
 export function ChunkedUploader({ sessionId, onDone }: { sessionId: string; onDone: () => void }) {
   const [progress, setProgress] = useState<Record<string, number>>({});
 
   async function uploadFile(file: File) {
-    const { upload_id } = await initUpload(sessionId, file.name, file.size);
-    let offset = 0;
-    while (offset < file.size) {
-      const end = Math.min(offset + CHUNK, file.size);
-      const blob = file.slice(offset, end);
-      await sendChunk(sessionId, upload_id, file.name, file.size, offset, end - 1, blob);
-      offset = end;
-      setProgress(p => ({ ...p, [file.name]: Math.round((offset / file.size) * 100) }));
+    // Reanuda si el servidor ya tiene parte del archivo; si no, inicia uno nuevo
+    const key = resumeKey(sessionId, file);
+    let uploadId = localStorage.getItem(key);
+    let missing: [number, number][] = [[0, file.size - 1]];
+    const status = uploadId ? await uploadStatus(sessionId, uploadId).catch(() => null) : null;
+    if (uploadId && status && !status.completed) {
+      missing = status.missing;
+    } else {
+      uploadId = (await initUpload(sessionId, file.name, file.size)).upload_id as string;
+      localStorage.setItem(key, uploadId);
+    }
+
+    // Solo los huecos, partidos en chunks de CHUNK bytes
+    const pending: [number, number][] = [];
+    for (const [a, b] of missing) {
+      for (let off = a; off <= b; off += CHUNK) pending.push([off, Math.min(off + CHUNK, b + 1)]);
+    }
+    let done = file.size - pending.reduce((acc, [a, b]) => acc + (b - a), 0);
+    const report = () => setProgress(p => ({ ...p, [file.name]: file.size ? Math.round((done / file.size) * 100) : 100 }));
+    report();
+
+    async function worker() {
+      for (let next = pending.shift(); next; next = pending.shift()) {
+        const [start, end] = next;
+        const blob = file.slice(start, end);
+        const sha = await sha256Hex(blob);
+        for (let attempt = 0; ; attempt++) {
+          try {
+            await sendChunk(sessionId, uploadId!, file.name, file.size, start, end - 1, blob, sha);
+            break;
+          } catch (e) {
+            if (attempt >= RETRIES) throw e;
+            await new Promise(r => setTimeout(r, 500 * 2 ** attempt));
+          }
+        }
+        done += end - start;
+        report();
+      }
     }
-    await completeUpload(sessionId, upload_id, file.name);
+    await Promise.all(Array.from({ length: PARALLEL }, worker));
+    await completeUpload(sessionId, uploadId!, file.name);
+    localStorage.removeItem(key);
   }
 
   async function handleFiles(files: FileList | null) {
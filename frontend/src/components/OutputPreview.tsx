@@ -0,0 +1,103 @@
+import React, { useEffect, useState } from "react";
+import { previewOutput, OutputPage } from "../api";
+
+const NAMES = ["t1_normal.csv", "t1_ajustada.csv", "t2_normal.csv", "t2_ajustada.csv"];
+const PAGE = 50;
+const LIVE_REFRESH_MS = 3000; // mientras se procesa, la salida sigue creciendo
+
+// Vista previa paginada de las salidas; con `live` refresca la página actual periódicamente
+export function OutputPreview({ sessionId, live }: { sessionId: string; live: boolean }) {
+  const [name, setName] = useState(NAMES[0]);
+  const [filter, setFilter] = useState("");      // texto del input
+  const [filters, setFilters] = useState<string[]>([]); // filtros aplicados
+  const [offset, setOffset] = useState(0);
+  const [history, setHistory] = useState<number[]>([]); // offsets anteriores (con filtros no son aritméticos)
+  const [page, setPage] = useState<OutputPage | null>(null);
+  const [error, setError] = useState<string | null>(null);
+
+  async function load(off: number) {
+    try {
+      setPage(await previewOutput(sessionId, name, off, PAGE, filters));
+      setError(null);
+    } catch (e) {
+      setPage(null);
+      setError(e instanceof Error ? e.message : "Sin vista previa");
+    }
+  }
+
+  useEffect(() => {
+    load(offset);
+    if (!live) return;
+    const t = window.setInterval(() => load(offset), LIVE_REFRESH_MS);
+    return () => window.clearInterval(t);
+  }, [sessionId, name, offset, live, filters]);
+
+  function reset(nextName = name) {
+    setName(nextName);
+    setFilters(filter.split(";").map((f) => f.trim()).filter(Boolean));
+    setHistory([]);
+    setOffset(0);
+  }
+
+  function next() {
+    if (!page) return;
+    const n = page.next_offset ?? offset + PAGE;
+    if (n >= page.total_rows) return;
+    setHistory([...history, offset]);
+    setOffset(n);
+  }
+
+  function prev() {
+    if (!history.length) return;
+    setOffset(history[history.length - 1]);
+    setHistory(history.slice(0, -1));
+  }
+
+  const last = offset + (page?.rows.length ?? 0);
+
+  return (
+    <div className="space-y-2 border rounded p-3">
+      <div className="flex flex-wrap items-center gap-2">
+        <select className="border p-1 rounded text-sm" value={name} onChange={(e) => reset(e.target.value)}>
+          {NAMES.map((n) => (
+            <option key={n} value={n}>{n}</option>
+          ))}
+        </select>
+        <input
+          className="border p-1 rounded text-sm flex-1"
+          placeholder="Filtro: Columna=valor (varios separados por ;)"
+          value={filter}
+          onChange={(e) => setFilter(e.target.value)}
+          onKeyDown={(e) => e.key === "Enter" && reset()}
+        />
+        <button onClick={() => reset()} className="px-2 py-1 border rounded text-sm hover:bg-gray-50">Aplicar</button>
+        <button onClick={prev} disabled={!history.length} className="px-2 py-1 border rounded text-sm disabled:opacity-40">←</button>
+        <button onClick={next} disabled={!page || (page.next_offset === null && offset + PAGE >= page.total_rows)}
+                className="px-2 py-1 border rounded text-sm disabled:opacity-40">→</button>
+        {page && (
+          <span className="text-xs text-gray-600">
+            {filters.length ? `${page.rows.length} coincidencia(s) desde la fila ${offset + 1}` : `Filas ${page.rows.length ? offset + 1 : 0}–${last}`}
+            {" "}de {page.total_rows.toLocaleString()}{live ? " (en vivo)" : ""}
+          </span>
+        )}
+      </div>
+      {error && <div className="text-sm text-red-700">{error}</div>}
+      {page && page.columns.length > 0 && (
+        <div className="overflow-auto max-h-80 border rounded">
+          <table className="text-xs w-full">
+            <thead className="bg-gray-100 sticky top-0">
+              <tr>{page.columns.map((c) => <th key={c} className="px-2 py-1 text-left whitespace-nowrap">{c}</th>)}</tr>
+            </thead>
+            <tbody>
+              {page.rows.map((r, i) => (
+                <tr key={offset + i} className="border-t">
+                  {r.map((v, j) => <td key={j} className="px-2 py-1 whitespace-nowrap max-w-xs truncate" title={v}>{v}</td>)}
+                </tr>
+              ))}
+            </tbody>
+          </table>
+        </div>
+      )}
+    </div>
+  );
+}
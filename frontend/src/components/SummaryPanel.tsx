@@ -0,0 +1,51 @@
+import React, { useEffect, useState } from "react";
+import { getSummary, SessionSummary, StatusCounts } from "../api";
+
+const TOP = 10;
+
+function counts(c: StatusCounts) {
+  return Object.entries(c).map(([k, v]) => `${k || "—"}: ${v.toLocaleString()}`).join(" · ");
+}
+
+// Resumen instantáneo de la sesión: controles con más fallos (T1) y estados por sistema operativo (T2)
+export function SummaryPanel({ sessionId }: { sessionId: string }) {
+  const [data, setData] = useState<SessionSummary | null>(null);
+
+  useEffect(() => {
+    getSummary(sessionId, TOP).then(setData).catch(() => setData(null));
+  }, [sessionId]);
+
+  if (!data) return null;
+  return (
+    <div className="space-y-3 border rounded p-3 text-sm">
+      <div className="text-xs text-gray-600">Agregados de {data.reports} reporte(s)</div>
+      {Object.entries(data.buckets).map(([bucket, b]) => (
+        <div key={bucket}>
+          <div className="font-semibold">{bucket} ({b.rows.toLocaleString()} filas)</div>
+          {b.controls && (
+            <table className="text-xs w-full">
+              <thead className="bg-gray-100">
+                <tr><th className="px-2 text-left">Control</th><th className="px-2">Passed</th><th className="px-2">Failed</th><th className="px-2">Error</th><th className="px-2">% OK</th></tr>
+              </thead>
+              <tbody>
+                {Object.entries(b.controls).map(([id, c]) => (
+                  <tr key={id} className="border-t">
+                    <td className="px-2 truncate max-w-xs" title={c.control}>{id} {c.control}</td>
+                    <td className="px-2 text-right">{c.passed}</td>
+                    <td className="px-2 text-right">{c.failed}</td>
+                    <td className="px-2 text-right">{c.error}</td>
+                    <td className="px-2 text-right">{c.pass_rate === null ? "—" : (c.pass_rate * 100).toFixed(1)}</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+          )}
+          {b.status && <div className="text-xs">Estados: {counts(b.status)}</div>}
+          {b.os && Object.entries(b.os).map(([os, c]) => (
+            <div key={os} className="text-xs text-gray-700">{os || "—"}: {counts(c)}</div>
+          ))}
+        </div>
+      ))}
+    </div>
+  );
+}
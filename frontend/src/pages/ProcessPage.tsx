@@ -1,12 +1,14 @@
 import React, { useEffect, useRef, useState } from "react";
-import { createSession, startProcess, downloadZip, ingestES } from "../api";
+import { createSession, startProcess, cancelJob, downloadZip, ingestES, listOutputs, outputUrl } from "../api";
 import { StepIndicator } from "../components/StepIndicator";
 import { ChunkedUploader } from "../components/ChunkedUploader";
+import { OutputPreview } from "../components/OutputPreview";
+import { SummaryPanel } from "../components/SummaryPanel";
 
 /**
  * Vista principal con SSE robusto:
  * - Cursor (?from=<lastId>) + dedupe por eventId
- * - No reconecta después de status|done / status|error
+ * - No reconecta después de status|done / status|error / status|cancelled
  * - Candado para evitar doble procesamiento
  */
 
@@ -22,6 +24,7 @@ export default function ProcessPage() {
   // Logs y estado
   const [log, setLog] = useState<string[]>([]);
   const [processing, setProcessing] = useState<boolean>(false);
+  const [outputs, setOutputs] = useState<{ name: string; size: number }[]>([]);
 
   // Índices de ES
   const [indices, setIndices] = useState({
@@ -74,7 +77,7 @@ export default function ProcessPage() {
 
       const msg = String(e.data ?? "");
       // Evita duplicar status ya finalizado
-      if (finishedRef.current && (msg === "status|done" || msg === "status|error")) return;
+      if (finishedRef.current && (msg === "status|done" || msg === "status|error" || msg === "status|cancelled")) return;
 
       setLog((prev) => [...prev, msg]);
 
@@ -83,7 +86,7 @@ export default function ProcessPage() {
         setProcessing(false);
         setStep(4);
         closeSSE(); // no reconectar más
-      } else if (msg === "status|error") {
+      } else if (msg === "status|error" || msg === "status|cancelled") {
         finishedRef.current = true;
         setProcessing(false);
         closeSSE();
@@ -132,12 +135,12 @@ export default function ProcessPage() {
     }
   }
 
-  async function handleStartProcess() {
+  async function handleStartProcess(rebuild = false) {
     if (!session || processing) return;
     try {
       setProcessing(true);
       finishedRef.current = false; // por si re-procesas en una nueva sesión
-      await startProcess(session);
+      await startProcess(session, rebuild);
       // Progreso vía SSE; al finalizar llega "status|done"
     } catch {
       setProcessing(false);
@@ -145,6 +148,16 @@ export default function ProcessPage() {
     }
   }
 
+  async function handleCancel() {
+    if (!session) return;
+    try {
+      await cancelJob(session);
+      // La confirmación llega por SSE como "status|cancelled"
+    } catch {
+      setLog((prev) => [...prev, "warning|No hay trabajo en curso para cancelar"]);
+    }
+  }
+
   async function handleDownload() {
     if (!session) return;
     try {
@@ -157,13 +170,21 @@ export default function ProcessPage() {
   async function handleIngest() {
     if (!session) return;
     try {
-      const res = await ingestES(session, indices);
-      setLog((prev) => [...prev, `success|Ingesta completada ${JSON.stringify(res.stats)}`]);
+      await ingestES(session, indices);
+      // La ingesta corre en segundo plano: progreso y resultado llegan por SSE
+      finishedRef.current = false;
+      openSSE(session);
     } catch {
       setLog((prev) => [...prev, "error|Fallo al subir a Elasticsearch"]);
     }
   }
 
+  // CSVs individuales disponibles al llegar al paso de descarga
+  useEffect(() => {
+    if (step < 4 || !session) return;
+    listOutputs(session).then(setOutputs).catch(() => setOutputs([]));
+  }, [step, session]);
+
   // === Render ===
   return (
     <div className="max-w-4xl mx-auto p-6">
@@ -209,7 +230,7 @@ export default function ProcessPage() {
         <div className="space-y-3">
           <div className="flex items-center gap-2">
             <button
-              onClick={handleStartProcess}
+              onClick={() => handleStartProcess()}
               disabled={processing}
               className={`px-4 py-2 rounded text-white ${
                 processing ? "bg-indigo-400 cursor-not-allowed" : "bg-indigo-600 hover:bg-indigo-700"
@@ -217,6 +238,23 @@ export default function ProcessPage() {
             >
               {processing ? "Procesando..." : "Iniciar procesamiento"}
             </button>
+            {!processing && (
+              <button
+                onClick={() => handleStartProcess(true)}
+                className="px-3 py-2 border rounded text-sm hover:bg-gray-50"
+                title="Descarta las salidas y vuelve a procesar todos los archivos"
+              >
+                Reprocesar todo
+              </button>
+            )}
+            {processing && (
+              <button
+                onClick={handleCancel}
+                className="px-3 py-2 border border-red-300 text-red-700 rounded text-sm hover:bg-red-50"
+              >
+                Cancelar
+              </button>
+            )}
             {processing && <span className="text-sm text-gray-600">Procesando… no cierres la página.</span>}
           </div>
 
@@ -225,6 +263,9 @@ export default function ProcessPage() {
               <div key={i}>{l}</div>
             ))}
           </div>
+
+          {/* Vista previa en vivo de lo que ya se escribió */}
+          {processing && <OutputPreview sessionId={session} live />}
         </div>
       )}
 
@@ -238,8 +279,21 @@ export default function ProcessPage() {
             >
               Descargar CSVs
             </button>
+            {outputs.map((o) => (
+              <a
+                key={o.name}
+                href={outputUrl(session, o.name)}
+                download={o.name}
+                className="px-3 py-2 border rounded text-sm hover:bg-gray-50"
+              >
+                {o.name} ({(o.size / 1048576).toFixed(1)} MB)
+              </a>
+            ))}
           </div>
 
+          <SummaryPanel sessionId={session} />
+          <OutputPreview sessionId={session} live={false} />
+
           <div className="grid grid-cols-2 gap-2">
             <input
               className="border p-2 rounded"
@@ -267,12 +321,20 @@ export default function ProcessPage() {
             />
           </div>
 
-          <button
-            onClick={handleIngest}
-            className="px-4 py-2 bg-amber-600 text-white rounded hover:bg-amber-700"
-          >
-            Subir a Elasticsearch
-          </button>
+          <div className="flex gap-2">
+            <button
+              onClick={handleIngest}
+              className="px-4 py-2 bg-amber-600 text-white rounded hover:bg-amber-700"
+            >
+              Subir a Elasticsearch
+            </button>
+            <button
+              onClick={handleCancel}
+              className="px-3 py-2 border border-red-300 text-red-700 rounded text-sm hover:bg-red-50"
+            >
+              Cancelar ingesta
+            </button>
+          </div>
 
           <div className="p-3 bg-gray-50 rounded h-56 overflow-auto text-sm border">
             {log.map((l, i) => (